@@ -0,0 +1,246 @@
+import sys
+import gc
+import json
+import argparse
+import platform
+import time
+import tracemalloc
+
+import pygame
+
+from game import Game
+from scripts.entities import Cat
+from scripts.particle import Particle
+from scripts.inputs import ScriptedInput
+from scripts.levels import load_index, levels_for, MAP_PATH
+
+# run right, hop and dash every so often, turn around halfway, then come back
+DEFAULT_SCRIPT = {0: ['right_down'], 30: ['jump'], 90: ['dash'], 150: ['jump'], 240: ['jump'], 300: ['right_up', 'left_down'],
+                  330: ['jump'], 400: ['dash'], 480: ['jump'], 600: ['left_up', 'right_down'], 660: ['jump'], 720: ['dash']}
+SCRIPT_LENGTH = 780 # the default script loops after this many steps
+
+STRESS_KINDS = ['cats', 'particles', 'projectiles']
+ALLOC_FRAMES = 120 # frames played with tracemalloc on after the timed ones
+
+def percentile(values, pct):
+    '''
+    nearest rank percentile
+    (sorted list, 0-100) -> value
+    '''
+    if not values:
+        return 0
+    rank = max(0, min(len(values) - 1, int(round(pct / 100 * len(values) + 0.5)) - 1))
+    return values[rank]
+
+def looping_script(script, length, steps):
+    '''
+    repeats a script so it covers a whole run
+    (dict of {step: actions}, script length, total steps) -> (dict of {step: actions})
+    '''
+    full = {}
+    for start in range(0, steps, length):
+        for tick, actions in script.items():
+            full[start + tick] = actions
+    return full
+
+def in_level(game):
+    '''
+    (Game) -> (bool, true while step() is running gameplay and not a story / ending / transition screen)
+    '''
+    if game.story_timer > 0 or game.prize[0].dead == 1:
+        return False
+    return not (game.prize[0].dead == 0 and not game.win_delay)
+
+def stress(game, kind, count, base_cats):
+    '''
+    tops a level up to count extra cats / particles / projectiles around the player
+    (Game, stress kind, count, cats the level itself spawns)
+    '''
+    center = game.player.rect().center
+    if kind == 'cats':
+        while len(game.enemies) < base_cats + count:
+            i = len(game.enemies)
+            game.enemies.append(Cat(game, (center[0] + (i % 20 - 10) * 12, center[1] - 40), (16, 13)))
+    if kind == 'particles':
+        while len(game.particles) < count:
+            game.particles.append(Particle(game, 'particle', (center[0] + game.rng.random() * 300 - 150, center[1] + game.rng.random() * 200 - 100), velocity=[game.rng.random() - 0.5, game.rng.random() - 0.5], frame=game.rng.randint(0, 7)))
+    if kind == 'projectiles':
+        while len(game.projectiles) < count:
+            game.projectiles.append([[center[0] + game.rng.random() * 300 - 150, center[1] - 60 - game.rng.random() * 60], game.rng.choice([-1.5, 1.5]), 0])
+
+def next_frame(game, level, kind, count, base_cats):
+    '''
+    gets the game ready for the next measured frame
+    -> (bool, the level had to be started again)
+    '''
+    restarted = not in_level(game)
+    if restarted: # won or lost, put the player back in the level we are measuring
+        game.start_at(level)
+    if kind:
+        stress(game, kind, count, base_cats)
+    return restarted
+
+def run_scenario(level, frames, warmup, seed, script, script_length, kind=None, count=0, alloc_frames=ALLOC_FRAMES, maps=MAP_PATH):
+    '''
+    plays one level through the real update + render path offscreen and times every frame, then plays on with
+    tracemalloc on to see what each frame allocates (kept out of the timed frames, tracing slows them down)
+    (level number, frames to time, untimed frames first, seed, script, script length, stress kind, stress count,
+     frames traced after the timed ones (0 -> none), maps folder)
+    -> (dict of results)
+    '''
+    total = warmup + frames
+    game = Game(headless=True, input_source=ScriptedInput(looping_script(script, script_length, (total + alloc_frames) * 2)), seed=seed, maps=maps)
+    start = time.perf_counter()
+    game.levels.prepare(level) # reading the bundle from disk, the game itself usually has it preloaded
+    load_ms = (time.perf_counter() - start) * 1000
+    game.start_at(level)
+    base_cats = len(game.enemies)
+
+    times = []
+    blocks = []
+    gen0 = []
+    restarts = 0
+    gc.collect()
+    for i in range(total):
+        restarts += next_frame(game, level, kind, count, base_cats)
+        allocated = sys.getallocatedblocks()
+        collections = gc.get_stats()[0]['collections']
+        start = time.perf_counter()
+        game.step()
+        game.render()
+        elapsed = time.perf_counter() - start
+        if i >= warmup:
+            times.append(elapsed * 1000)
+            blocks.append(sys.getallocatedblocks() - allocated)
+            gen0.append(gc.get_stats()[0]['collections'] - collections)
+
+    peaks = []
+    if alloc_frames:
+        tracemalloc.start()
+        for i in range(alloc_frames):
+            restarts += next_frame(game, level, kind, count, base_cats)
+            tracemalloc.reset_peak()
+            traced = tracemalloc.get_traced_memory()[0]
+            game.step()
+            game.render()
+            peaks.append((tracemalloc.get_traced_memory()[1] - traced) / 1024)
+        tracemalloc.stop()
+
+    times.sort()
+    result = {
+        'level': level,
+        'frames': frames,
+        'p50_ms': round(percentile(times, 50), 4),
+        'p95_ms': round(percentile(times, 95), 4),
+        'p99_ms': round(percentile(times, 99), 4),
+        'worst_ms': round(times[-1], 4),
+        'mean_ms': round(sum(times) / len(times), 4),
+        # one gen 0 collection for every 700 container objects made and not yet freed, how often allocating costs a gc pass
+        'gc_gen0_per_frame': round(sum(gen0) / len(gen0), 3),
+        # growth only, a frame that allocates and frees thousands of objects shows up as about 0 here
+        'net_blocks_per_frame': round(sum(blocks) / len(blocks), 2),
+        'max_net_blocks_per_frame': max(blocks),
+        'restarts': restarts,
+        'load_ms': round(load_ms, 3),
+        'tiles': len(game.tilemap.tilemap),
+    }
+    if kind:
+        result['stress'] = {'kind': kind, 'count': count}
+    if peaks:
+        # what a frame allocates, freed again before it ends or not (the most it had live on top of what it started with)
+        result['alloc_kib_per_frame'] = round(sum(peaks) / len(peaks), 2)
+        result['max_alloc_kib_per_frame'] = round(max(peaks), 2)
+    return result
+
+def compare(results, baseline, threshold):
+    '''
+    finds scenarios whose p50 / p95 / p99 got slower than the baseline by more than threshold percent
+    (results dict, baseline results dict, percent) -> (list of strings)
+    '''
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for key in ['p50_ms', 'p95_ms', 'p99_ms']:
+            old = baseline[name][key]
+            new = result[key]
+            if old and (new - old) / old * 100 > threshold:
+                regressions.append(f'{name} {key}: {old:.3f} -> {new:.3f} ms (+{(new - old) / old * 100:.1f}%)')
+    return regressions
+
+def parse_stress(values):
+    '''
+    ('cats:0,10,50') -> ('cats', [0, 10, 50])
+    '''
+    kind, counts = values.split(':')
+    if kind not in STRESS_KINDS:
+        raise argparse.ArgumentTypeError('stress kind must be one of ' + ', '.join(STRESS_KINDS))
+    return kind, [int(c) for c in counts.split(',')]
+
+def main():
+    parser = argparse.ArgumentParser(description='frame time benchmark over the shipped levels')
+    parser.add_argument('--frames', type=int, default=1200, help='timed frames per scenario')
+    parser.add_argument('--warmup', type=int, default=120, help='untimed frames before timing starts')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--levels', help='comma separated levels, all maps by default')
+    parser.add_argument('--maps', default=MAP_PATH, help='folder of maps to play, e.g. stress maps from generate_map.py --sizes')
+    parser.add_argument('--script', help='json file of scripted actions to loop instead of the default run')
+    parser.add_argument('--stress', type=parse_stress, action='append', default=[], help='e.g. cats:0,10,50 or particles:100,500 or projectiles:20,80')
+    parser.add_argument('--alloc-frames', type=int, default=ALLOC_FRAMES, help=f'frames traced with tracemalloc after the timed ones to measure what each allocates, 0 to skip ({ALLOC_FRAMES} by default)')
+    parser.add_argument('--out', default='bench_output.json', help='where to write the results')
+    parser.add_argument('--compare', help='results json from an earlier run to check against')
+    parser.add_argument('--threshold', type=float, default=10, help='percent slowdown that counts as a regression')
+    args = parser.parse_args()
+
+    if args.levels:
+        levels = [int(level) for level in args.levels.split(',')]
+    else:
+        levels = [level['id'] for level in load_index(levels_for(args.maps), args.maps)['levels']]
+
+    script, script_length = DEFAULT_SCRIPT, SCRIPT_LENGTH
+    if args.script:
+        script = ScriptedInput.load(args.script).script
+        script_length = max(script) + 60
+
+    scenarios = [(level, None, 0) for level in levels]
+    for kind, counts in args.stress:
+        scenarios += [(level, kind, count) for level in levels for count in counts]
+
+    results = {}
+    for level, kind, count in scenarios:
+        name = f'level_{level}' + (f'/{kind}={count}' if kind else '')
+        results[name] = run_scenario(level, args.frames, args.warmup, args.seed, script, script_length, kind, count, args.alloc_frames, args.maps)
+        r = results[name]
+        print(f"{name:28} p50 {r['p50_ms']:7.3f}  p95 {r['p95_ms']:7.3f}  p99 {r['p99_ms']:7.3f}  worst {r['worst_ms']:7.3f} ms  alloc {r.get('alloc_kib_per_frame', 0):7.1f} KiB/frame  net blocks/frame {r['net_blocks_per_frame']:7.2f}  load {r['load_ms']:7.2f} ms  {r['tiles']} tiles")
+
+    output = {
+        'meta': {
+            'python': platform.python_version(),
+            'pygame': pygame.version.ver,
+            'platform': platform.platform(),
+            'frames': args.frames,
+            'warmup': args.warmup,
+            'seed': args.seed,
+            'maps': args.maps,
+        },
+        'results': results,
+    }
+    f = open(args.out, 'w')
+    json.dump(output, f, indent=2)
+    f.close()
+    print('wrote', args.out)
+
+    if args.compare:
+        f = open(args.compare, 'r')
+        baseline = json.load(f)['results']
+        f.close()
+        regressions = compare(results, baseline, args.threshold)
+        for line in regressions:
+            print('REGRESSION', line)
+        if regressions:
+            sys.exit(1)
+        print(f'no regressions over {args.threshold}% against {args.compare}')
+
+
+if __name__ == '__main__':
+    main()
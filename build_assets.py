@@ -0,0 +1,154 @@
+import os
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+# data/build/images/    same layout and names as data/images, game.spec packs it in place of the originals
+SRC = 'data/images/'
+OUT = 'data/build/'
+MANIFEST = 'manifest.json'
+VERSION = 1
+
+# first matching prefix (relative to data/images) wins, steps run left to right
+#   rgba      decode and write a plain RGBA png, drops colour profiles and other chunks
+#   palette   store as an 8 bit palette png when it has at most 256 colours, only kept if it decodes to the same pixels
+# the outputs have to load exactly like the sources: the game flips and outlines at runtime and positions
+# images by their full size, so nothing here crops or adds variants
+RULES = [
+    ('', ['rgba', 'palette']),
+]
+
+def file_hash(path):
+    '''
+    (file path) -> (hex sha1 of its contents)
+    '''
+    f = open(path, 'rb')
+    digest = hashlib.sha1(f.read()).hexdigest()
+    f.close()
+    return digest
+
+def steps_for(path, rules=RULES):
+    '''
+    (path relative to data/images) -> (list of step names)
+    '''
+    for prefix, steps in rules:
+        if path.startswith(prefix):
+            return steps
+    return []
+
+def sources(src=SRC):
+    '''
+    -> (sorted paths of every png under src, relative to it)
+    '''
+    paths = []
+    for root, subdirs, files in os.walk(src):
+        for name in files:
+            if name.endswith('.png'):
+                paths.append(os.path.relpath(os.path.join(root, name), src).replace('\\', '/'))
+    return sorted(paths)
+
+def to_palette(img):
+    '''
+    (RGBA Image) -> (P Image with the exact same colours, or None when there are more than 256)
+    '''
+    colors = img.getcolors(256)
+    if colors is None:
+        return None
+    colors = [color for count, color in colors]
+    index = {bytes(color): i for i, color in enumerate(colors)}
+    raw = img.tobytes()
+    pal = Image.frombytes('P', img.size, bytes(index[raw[i:i + 4]] for i in range(0, len(raw), 4)))
+    pal.putpalette([channel for color in colors for channel in color[:3]])
+    pal.info['transparency'] = bytes(color[3] for color in colors)
+    return pal
+
+def build_one(path, steps, src=SRC, out=OUT):
+    '''
+    runs on a worker process, applies one image's steps
+    (path relative to data/images, step names, source root, build root) -> (path, manifest entry)
+    '''
+    start = time.perf_counter()
+    img = Image.open(os.path.join(src, path)).convert('RGBA')
+    entry = {'steps': steps, 'outputs': [], 'size': list(img.size)}
+
+    target = os.path.join(out, 'images', path)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    pal = to_palette(img) if 'palette' in steps else None
+    if pal is not None:
+        pal.save(target, optimize=True, transparency=pal.info['transparency'])
+        if Image.open(target).convert('RGBA').tobytes() != img.tobytes(): # never ship a palette that changed a pixel
+            pal = None
+    if pal is None:
+        img.save(target, optimize=True)
+    entry['format'] = 'palette' if pal is not None else 'rgba'
+    entry['outputs'].append(os.path.relpath(target, out).replace('\\', '/'))
+
+    entry['bytes'] = sum(os.path.getsize(os.path.join(out, output)) for output in entry['outputs'])
+    entry['ms'] = round((time.perf_counter() - start) * 1000, 2)
+    return path, entry
+
+def load_manifest(path):
+    try:
+        f = open(path, 'r')
+        manifest = json.load(f)
+        f.close()
+    except (FileNotFoundError, ValueError):
+        return {}
+    return manifest['images'] if manifest.get('version') == VERSION else {}
+
+def build(src=SRC, out=OUT, workers=None, force=False, rules=RULES):
+    '''
+    brings the build folder up to date, only images whose contents or steps changed are processed
+    (source root, build root, worker processes (None -> one per core), rebuild everything, rules) -> (manifest dict, number built)
+    '''
+    old = {} if force else load_manifest(os.path.join(out, MANIFEST))
+    images = {}
+    jobs = []
+    for path in sources(src):
+        digest = file_hash(os.path.join(src, path))
+        steps = steps_for(path, rules)
+        entry = old.get(path)
+        if entry and entry['hash'] == digest and entry['steps'] == steps and all(os.path.exists(os.path.join(out, output)) for output in entry['outputs']):
+            images[path] = entry
+        else:
+            jobs.append((path, steps, digest))
+
+    if jobs:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [(digest, pool.submit(build_one, path, steps, src, out)) for path, steps, digest in jobs]
+            for digest, future in futures:
+                path, entry = future.result()
+                entry['hash'] = digest
+                images[path] = entry
+
+    # outputs nothing makes any more, images that were deleted / renamed or whose steps changed
+    current = {output for entry in images.values() for output in entry['outputs']}
+    for entry in old.values():
+        for output in entry['outputs']:
+            if output not in current and os.path.exists(os.path.join(out, output)):
+                os.remove(os.path.join(out, output))
+
+    os.makedirs(out, exist_ok=True)
+    tmp = os.path.join(out, MANIFEST + '.tmp')
+    f = open(tmp, 'w')
+    json.dump({'version': VERSION, 'images': dict(sorted(images.items()))}, f, indent=1)
+    f.close()
+    os.replace(tmp, os.path.join(out, MANIFEST))
+    return images, len(jobs)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='incremental asset build, data/images -> data/build')
+    parser.add_argument('--workers', type=int, help='worker processes, one per core by default')
+    parser.add_argument('--force', action='store_true', help='rebuild everything, ignoring the manifest')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    images, built = build(workers=args.workers, force=args.force)
+    source_bytes = sum(os.path.getsize(os.path.join(SRC, path)) for path in images)
+    out_bytes = sum(entry['bytes'] for entry in images.values())
+    print(f'{built} of {len(images)} images built in {time.perf_counter() - start:.2f}s, {source_bytes / 1024:.0f} KiB -> {out_bytes / 1024:.0f} KiB')
@@ -1,16 +1,25 @@
 import sys
+import argparse
 import pygame
 
-from scripts.utils import load_images, Animation
+from scripts.utils import load_images, preload, Animation
 from scripts.tilemap import Tilemap
+from scripts.editlog import EditLog
+from scripts.edittools import rect_cells, flood_cells, bounds
+from scripts.editview import MapView
+from scripts.autosave import Autosave, recover, INTERVAL, BACKUPS
+from scripts.minimap import ChunkImages, Minimap, ZOOMS
 
-RENDER_SCALE = 2.0
+RENDER_SCALE = 2
 
 class Editor:
-    def __init__(self):
+    def __init__(self, path='map.json', autosave=INTERVAL, backups=BACKUPS, chunked=False):
         '''
         initializes Editor
+        (map file to open and save to, seconds after a change to autosave (0 -> off), older saves to keep,
+         autosave only the changed chunks)
         '''
+        self.path = path
         pygame.init()
 
         # change the window caption
@@ -22,6 +31,7 @@ class Editor:
 
         self.clock = pygame.time.Clock()
         
+        preload(['tiles/grass', 'tiles/stone', 'tiles/spawners']) # decoded on a thread pool, load_images only converts them
         self.assets = {
             'grass': load_images('tiles/grass'),
             'stone': load_images('tiles/stone'),
@@ -34,9 +44,21 @@ class Editor:
         self.tilemap = Tilemap(self, tile_size=16)
 
         try: # only load the map if it exists
-            self.tilemap.load('map.json')
+            self.tilemap.load(self.path)
         except FileNotFoundError:
             pass
+        recovered = recover(self.tilemap, self.path) # chunks autosaved after the last full save
+        if recovered:
+            print(f'recovered {recovered} autosaved files from {self.path}.autosave/, press O to save them into the map', file=sys.stderr)
+        self.autosave = Autosave(self.tilemap, self.path, autosave, backups, chunked) # saves on a background thread
+        self.history = EditLog(self.tilemap) # every change goes through here, ctrl+z / ctrl+y
+        self.view = MapView(self.tilemap, self.assets, self.display.get_size(), RENDER_SCALE) # only redraws what changed
+        self.overlays = [] # window rects the cursor preview / icon were drawn over last frame
+        self.chunks = ChunkImages(self.tilemap, self.assets) # small pictures of each chunk for the minimap / zoomed out views
+        self.minimap = Minimap(self.chunks, self.screen.get_size(), self.display.get_size()) # M hides it
+        self.show_minimap = True
+        self.zoom = None # window pixels per tile when zoomed out (one of ZOOMS), None -> the normal editing view
+        self.zoom_view = ((0, 0), 1) # (world pixel at the window's top left, window pixels per world pixel) of the last zoomed frame
 
         # creating 'camera'  scroll for it's movement
         self.scroll = [0, 0]
@@ -50,6 +72,64 @@ class Editor:
         self.right_clicking = False
         self.shift = False
         self.ongrid = True
+        self.tool = 'brush' # brush, rect (drag a rectangle) or fill (flood fill), rect and fill only work ongrid
+        self.rect_start = None # (tile pos, mouse button) while a rectangle is being dragged
+
+    def center_on(self, pos):
+        '''
+        (world pixel to put in the middle of the editing view)
+        '''
+        self.scroll = [int(pos[0] - self.display.get_width() / 2), int(pos[1] - self.display.get_height() / 2)]
+
+    def navigate(self, button):
+        '''
+        clicks on the minimap or the zoomed out view move the camera instead of editing, left click jumps there
+        (zooming back in if zoomed out)
+        (mouse button) -> (bool, the click was used up)
+        '''
+        window = pygame.mouse.get_pos()
+        if self.show_minimap and self.minimap.rect.collidepoint(window):
+            if button == 1:
+                self.center_on(self.minimap.world_pos(window))
+            return True
+        if self.zoom:
+            if button == 1:
+                (left, top), scale = self.zoom_view
+                self.center_on((left + window[0] / scale, top + window[1] / scale))
+                self.zoom = None
+            return True
+        return False
+
+    def bulk(self, cells, erase=False):
+        '''
+        paints (or erases) a batch of cells as its own undo step, then autotiles only around what changed
+        (list of (x, y), bool) -> (list of (x, y) that changed)
+        '''
+        self.history.commit()
+        self.history.begin()
+        if erase:
+            changed = self.history.erase_cells(cells)
+        else:
+            changed = self.history.fill(cells, self.tile_list[self.tile_group], self.tile_variant)
+        self.history.autotile(changed)
+        self.history.commit()
+        return changed
+
+    def flood(self, tile_pos, erase=False):
+        '''
+        flood fills from a cell, empty space spreads as far as the map and the view reach
+        '''
+        view = (self.scroll[0] // self.tilemap.tile_size, self.scroll[1] // self.tilemap.tile_size,
+                (self.scroll[0] + self.display.get_width()) // self.tilemap.tile_size, (self.scroll[1] + self.display.get_height()) // self.tilemap.tile_size)
+        area = bounds(self.tilemap) or view
+        area = (min(area[0], view[0]), min(area[1], view[1]), max(area[2], view[2]), max(area[3], view[3]))
+        cells = flood_cells(self.tilemap, tile_pos, area)
+        if cells is None:
+            print('flood fill too big, use a rectangle', file=sys.stderr)
+            return []
+        if erase and str(tile_pos[0]) + ';' + str(tile_pos[1]) not in self.tilemap.tilemap:
+            return [] # nothing to erase
+        return self.bulk(cells, erase)
 
     def run(self):
         '''
@@ -57,60 +137,56 @@ class Editor:
         '''
         # creating an infinite game loop
         while True:
-            # clear the screen for new image generation in loop
-            self.display.fill((255,255,255))
-
-            self.scroll[0] += (self.movement[1] - self.movement[0]) * 2 # camera x axis
-            self.scroll[1] += (self.movement[3] - self.movement[2]) * 2 # camera y axis
-            render_scroll = (int(self.scroll[0]), int(self.scroll[1]))
-
-            # render the tile map
-            self.tilemap.render(self.display, offset=render_scroll)
-
-            current_tile_img = self.assets[self.tile_list[self.tile_group]][self.tile_variant] # select the tile
-            current_tile_img.set_alpha(200) # partially transparent, 0 -> full, 255 -> none
+            speed = 64 // self.zoom if self.zoom else 2 # the same speed on screen when zoomed out
+            self.scroll[0] += (self.movement[1] - self.movement[0]) * speed # camera x axis
+            self.scroll[1] += (self.movement[3] - self.movement[2]) * speed # camera y axis
 
             mpos = pygame.mouse.get_pos() # gets mouse positon
             mpos = (mpos[0] / RENDER_SCALE, mpos[1] / RENDER_SCALE) # since screen scales x2
             tile_pos = (int((mpos[0] + self.scroll[0]) // self.tilemap.tile_size), int((mpos[1] + self.scroll[1]) // self.tilemap.tile_size)) #coord of mouse in refernce to tile map, snaps img to grid
 
-            # indicate where tile will be placed
-            if self.ongrid:
-                self.display.blit(current_tile_img, (tile_pos[0] * self.tilemap.tile_size - self.scroll[0], tile_pos[1] * self.tilemap.tile_size - self.scroll[1]))
-            else: 
-                self.display.blit(current_tile_img, mpos)
-
-            if self.clicking and self.ongrid: # assing positon on tile map to that asset
-                self.tilemap.tilemap[str(tile_pos[0]) + ';' + str(tile_pos[1])] = {'type': self.tile_list[self.tile_group], 'variant': self.tile_variant, 'pos': tile_pos}
-            if self.right_clicking:
-                tile_loc = str(tile_pos[0]) + ';' + str(tile_pos[1])
-                if tile_loc in self.tilemap.tilemap:
-                    # if location exists
-                    del self.tilemap.tilemap[tile_loc]
+            bulk_tool = self.ongrid and self.tool != 'brush'
+            if self.clicking and self.ongrid and not bulk_tool: # assing positon on tile map to that asset, part of the stroke's transaction
+                self.history.set(tile_pos[0], tile_pos[1], self.tile_list[self.tile_group], self.tile_variant)
+            if self.right_clicking and not bulk_tool:
+                self.history.erase(tile_pos[0], tile_pos[1]) # if location exists
                 for tile in self.tilemap.offgrid_tiles.copy(): # take a copy of refernce so we dont mess up the actual iteration
                     tile_img = self.assets[tile['type']][tile['variant']]
                     tile_r = pygame.Rect(tile['pos'][0] - self.scroll[0], tile['pos'][1] - self.scroll[1], tile_img.get_width(), tile_img.get_height())
                     if tile_r.collidepoint(mpos): # if this tile is colliding with mouse
-                        self.tilemap.offgrid_tiles.remove(tile)
-
-            self.display.blit(current_tile_img, (5,5))
+                        self.history.remove_offgrid(tile)
 
             for event in pygame.event.get():
                 if event.type == pygame.QUIT: # have to code the window closing
+                    self.autosave.wait() # let a save that's being written finish, a failed one is reported and the window still closes
                     pygame.quit()
                     sys.exit()
-                if event.type == pygame.MOUSEBUTTONDOWN:
+                if event.type == pygame.MOUSEBUTTONDOWN and event.button in (1, 3) and self.navigate(event.button):
+                    pass
+                elif event.type == pygame.MOUSEBUTTONDOWN and bulk_tool and event.button in (1, 3):
+                    if self.tool == 'fill': # left fills, right erases the connected tiles of that type
+                        self.flood(tile_pos, erase=event.button == 3)
+                    elif not self.rect_start:
+                        self.rect_start = (tile_pos, event.button)
+                elif event.type == pygame.MOUSEBUTTONDOWN:
                     if event.button == 1: # left click, places
                         self.clicking = True
+                        self.history.begin() # everything until the buttons are let go is one undo step
                         if not self.ongrid:
-                            self.tilemap.offgrid_tiles.append({'type': self.tile_list[self.tile_group], 'variant': self.tile_variant, 'pos': (mpos[0] + self.scroll[0], mpos[1] + self.scroll[1])})
+                            self.history.add_offgrid({'type': self.tile_list[self.tile_group], 'variant': self.tile_variant, 'pos': (mpos[0] + self.scroll[0], mpos[1] + self.scroll[1])})
                     if event.button == 3: # right click
                         self.right_clicking = True
+                        self.history.begin()
                 if event.type == pygame.MOUSEBUTTONUP:
+                    if self.rect_start and event.button == self.rect_start[1]: # left fills the rectangle, right erases it
+                        self.bulk(rect_cells(self.rect_start[0], tile_pos), erase=event.button == 3)
+                        self.rect_start = None
                     if event.button == 1: # left click
                         self.clicking = False
                     if event.button == 3: # right click
                         self.right_clicking = False
+                    if not self.clicking and not self.right_clicking:
+                        self.history.commit()
                     
                     if self.shift:
                         # scroll between variants
@@ -141,10 +217,31 @@ class Editor:
                         self.shift = True
                     if event.key == pygame.K_g: # switch drawing on/offgrid 
                         self.ongrid = not self.ongrid
+                    if event.key == pygame.K_b: # brush / rectangle / flood fill tools
+                        self.tool = 'brush'
+                    if event.key == pygame.K_r:
+                        self.tool = 'rect'
+                    if event.key == pygame.K_f:
+                        self.tool = 'fill'
+                    if event.key == pygame.K_m: # minimap on / off
+                        self.show_minimap = not self.show_minimap
+                    if event.key == pygame.K_MINUS and self.zoom != ZOOMS[-1]: # zoom out / in, zoomed out views only move the camera
+                        self.zoom = ZOOMS[0] if self.zoom is None else ZOOMS[ZOOMS.index(self.zoom) + 1]
+                    if event.key == pygame.K_EQUALS and self.zoom:
+                        self.zoom = None if self.zoom == ZOOMS[0] else ZOOMS[ZOOMS.index(self.zoom) - 1]
                     if event.key == pygame.K_o: # same tilemap
-                        self.tilemap.save('map.json') # path we are saving it to
+                        self.autosave.save() # the whole map, written in the background, the map before it becomes map.json.1
                     if event.key == pygame.K_t:
-                        self.tilemap.autotile()
+                        self.history.begin()
+                        self.history.autotile()
+                        self.history.commit()
+                    if event.key == pygame.K_z and event.mod & pygame.KMOD_CTRL: # ctrl+z undo, ctrl+shift+z redo
+                        if event.mod & pygame.KMOD_SHIFT:
+                            self.history.redo()
+                        else:
+                            self.history.undo()
+                    if event.key == pygame.K_y and event.mod & pygame.KMOD_CTRL:
+                        self.history.redo()
                 if event.type == pygame.KEYUP: # when key is released
                     if event.key == pygame.K_a: 
                         self.movement[0] = False
@@ -157,9 +254,79 @@ class Editor:
                     if event.key == pygame.K_LSHIFT:
                         self.shift = False
             
-            self.screen.blit(pygame.transform.scale(self.display, self.screen.get_size()), (0,0)) # render (now scaled) display image on big screen
-            pygame.display.update()
+            self.draw()
+            self.autosave.update()
             self.clock.tick(60) # run at 60 fps, like a sleep
 
-# returns the editor then runs it
-Editor().run()
\ No newline at end of file
+    def draw(self):
+        '''
+        puts the frame on screen, only the parts that changed: the cached map where it was edited / scrolled and the
+        cursor preview, drawn straight onto the window (already scaled up) so the map under it stays cached
+        '''
+        render_scroll = (int(self.scroll[0]), int(self.scroll[1]))
+        cells, offgrid = self.history.take_dirty()
+        self.autosave.note(cells, offgrid)
+        keys = self.chunks.invalidate(cells)
+        center = (render_scroll[0] + self.display.get_width() // 2, render_scroll[1] + self.display.get_height() // 2)
+        if self.zoom:
+            self.draw_zoomed(center, keys)
+            return
+        changed = self.view.update(render_scroll, cells, offgrid) + self.overlays
+        for rect in changed: # the map back over last frame's preview
+            self.screen.blit(self.view.scaled, rect, rect)
+
+        current_tile_img = self.assets[self.tile_list[self.tile_group]][self.tile_variant] # select the tile
+        preview = pygame.transform.scale(current_tile_img, (current_tile_img.get_width() * RENDER_SCALE, current_tile_img.get_height() * RENDER_SCALE))
+        preview.set_alpha(200) # partially transparent, 0 -> full, 255 -> none
+
+        mpos = pygame.mouse.get_pos()
+        mpos = (int(mpos[0] / RENDER_SCALE), int(mpos[1] / RENDER_SCALE)) # on the display pixel grid, like the rest of the map
+        tile_pos = ((mpos[0] + render_scroll[0]) // self.tilemap.tile_size, (mpos[1] + render_scroll[1]) // self.tilemap.tile_size)
+
+        # indicate where tile will be placed
+        self.overlays = []
+        if self.rect_start:
+            (x0, y0), button = self.rect_start
+            rect = pygame.Rect(min(x0, tile_pos[0]) * self.tilemap.tile_size - render_scroll[0], min(y0, tile_pos[1]) * self.tilemap.tile_size - render_scroll[1],
+                               (abs(tile_pos[0] - x0) + 1) * self.tilemap.tile_size, (abs(tile_pos[1] - y0) + 1) * self.tilemap.tile_size)
+            rect = pygame.Rect(rect.x * RENDER_SCALE, rect.y * RENDER_SCALE, rect.w * RENDER_SCALE, rect.h * RENDER_SCALE)
+            self.overlays.append(pygame.draw.rect(self.screen, (255, 0, 0) if button == 3 else (0, 0, 255), rect, RENDER_SCALE))
+        elif self.ongrid:
+            self.overlays.append(self.screen.blit(preview, ((tile_pos[0] * self.tilemap.tile_size - render_scroll[0]) * RENDER_SCALE, (tile_pos[1] * self.tilemap.tile_size - render_scroll[1]) * RENDER_SCALE)))
+        else:
+            self.overlays.append(self.screen.blit(preview, (mpos[0] * RENDER_SCALE, mpos[1] * RENDER_SCALE)))
+        self.overlays.append(self.screen.blit(preview, (5 * RENDER_SCALE, 5 * RENDER_SCALE)))
+        if self.show_minimap:
+            self.minimap.update(center, keys)
+            self.overlays.append(self.screen.blit(self.minimap.surface, self.minimap.rect))
+
+        pygame.display.update(changed + self.overlays)
+
+    def draw_zoomed(self, center, keys):
+        '''
+        the zoomed out view, one blit per chunk on screen, with the editing view's outline
+        (world pixel at the middle, set of chunk keys changed this frame)
+        '''
+        self.screen.fill((255, 255, 255))
+        self.zoom_view = self.chunks.render(self.screen, center, self.zoom)
+        (left, top), scale = self.zoom_view
+        view = pygame.Rect(round((self.scroll[0] - left) * scale), round((self.scroll[1] - top) * scale),
+                           round(self.display.get_width() * scale), round(self.display.get_height() * scale))
+        pygame.draw.rect(self.screen, (255, 0, 0), view, 1)
+        if self.show_minimap:
+            self.minimap.update(center, keys)
+            self.screen.blit(self.minimap.surface, self.minimap.rect)
+        pygame.display.update()
+        self.view.scroll = None # the cached view gets painted again when zooming back in
+        self.overlays = []
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='tilemap editor')
+    parser.add_argument('map', nargs='?', default='map.json', help='map to edit, created on the first save if it doesn\'t exist')
+    parser.add_argument('--autosave', type=float, default=INTERVAL, metavar='SECONDS', help=f'save this long after a change, 0 turns it off ({INTERVAL} by default)')
+    parser.add_argument('--backups', type=int, default=BACKUPS, help=f'maps kept as map.json.1, .2 ... from before each O save ({BACKUPS} by default)')
+    parser.add_argument('--autosave-chunks', action='store_true', help='autosave only the changed 16x16 chunks into map.json.autosave/ (big maps), O still saves the whole map')
+    args = parser.parse_args()
+
+    # returns the editor then runs it
+    Editor(args.map, args.autosave, args.backups, args.autosave_chunks).run()
\ No newline at end of file
@@ -1,22 +1,97 @@
 import sys
 import os
+import argparse
+import hashlib
+import json
 import math
 import random
+import time
 import pygame
 
-from scripts.utils import load_image, load_images, Animation
-from scripts.entities import PhysicsEntity, Player, Cat, Trap, Prize, CatnipRecharge, Button, Turbine, Toy
+from scripts.utils import load_image, load_images, load_pixels, load_sound, preload, Animation
+from scripts import loader
+from scripts.entities import PhysicsEntity, Player
 from scripts.tilemap import Tilemap
 from scripts.clouds import Clouds
 from scripts.particle import Particle
 from scripts.spark import Spark
 from scripts.UI import Levelbar
+from scripts.inputs import KeyboardInput, ScriptedInput
+from scripts.replay import Recording, InputRecorder, ReplayInput
+from scripts.profiler import Profiler
+from scripts.memtrace import MemoryTracer
+from scripts.assets import AssetManager
+from scripts.audio import AudioManager
+from scripts.music import MusicPlayer
+from scripts.levels import LevelLoader, ENTITY_LISTS, ENTITY_CLASSES, MAP_PATH
+from scripts import snapshot
+
+SIM_RATE = 60 # simulation steps per second, gameplay speed is tied to this and not to the frame rate
+SIM_STEP = 1 / SIM_RATE
+MAX_FRAME_TIME = 0.25 # longest real frame we try to catch up on, in seconds
+MAX_STEPS_PER_FRAME = 5 # default cap on simulation steps run before drawing again
+REWIND_STEPS = SIM_RATE * 2 # how far one press of R goes back with --history
+
+# full screen pictures, story frames then the end scenes
+SCENES = {
+    'story1': 'Intro/Story1.png',
+    'story2': 'Intro/Story2.png',
+    'story3': 'Intro/Story3.png',
+    'story4': 'Intro/Story4.png',
+    'story5': 'Intro/Story5.png',
+    '1': 'endScene/1.png',
+    '2': 'endScene/2.png',
+    '3': 'endScene/3.png',
+    '4': 'endScene/4.png',
+}
+# images the gameplay assets come from, decoded together at startup
+GAMEPLAY_IMAGES = ['tiles/grass', 'tiles/stone', 'entities', 'particles', 'UI', 'clouds', 'background.png']
+ICON = SCENES['2'] # window icon, decoded with the gameplay images
+# sound name -> (file under data/sfx, volume, priority (higher steals channels from lower), cooldown in steps, max voices at once)
+SFX = {
+    'jump': ('jump.wav', 0.7, 2, 0, 2),
+    'dash': ('dash.wav', 0.5, 2, 0, 2),
+    'win': ('win.wav', 0.3, 3, 0, 1),
+    'hit': ('hit.wav', 0.8, 2, 6, 2),
+    'shoot': ('shoot.wav', 0.4, 1, 8, 3), # any number of cats can shoot on the same step
+    'bad': ('bad.mp3', 0.7, 3, 0, 1),
+    'get': ('get.mp3', 0.4, 2, 0, 2),
+    'stun': ('stun.wav', 0.6, 1, 8, 2),
+    'transition': ('transition.wav', 0.3, 3, 30, 1), # asked for on every step of the win screen
+    'pickup': ('pickup.wav', 0.4, 2, 0, 1),
+    'drop': ('drop.wav', 0.6, 2, 0, 1),
+    'button': ('button.wav', 0.2, 2, 0, 1),
+}
+SFX_CHANNELS = 16
+MUSIC = 'data/music.mp3'
+STORY = ['story1', 'story2', 'story3', 'story4', 'story5']
+BAD_ENDING = ['1', '2', '3']
 
 class Game:
-    def __init__(self):
+    def __init__(self, max_steps=MAX_STEPS_PER_FRAME, render_fps=120, time_scale=1.0, headless=False, input_source=None, seed=None, profile=None, memory=None, asset_budget=4 * 1024 * 1024, load_workers=None, history=0, stream_radius=0, maps=MAP_PATH):
         '''
         initializes Game
+        (max simulation steps per rendered frame, render frame cap (0 -> uncapped), simulation speed multiplier,
+         run without a real window or sound card, where actions come from (defaults to the keyboard),
+         seed for every random thing the simulation does (None -> pick one),
+         time every frame stage and write the trace to this file on quit (.json or .csv),
+         trace allocations / gc / live objects and write the report to this file on quit,
+         bytes of story / end scene pictures kept loaded, threads decoding assets at startup (None -> one per core),
+         steps of snapshots kept for rewinding (0 -> none), chunks kept loaded around the camera (0 -> whole levels),
+         folder of numbered editor maps to play)
         '''
+        self.headless = headless
+
+        # all gameplay randomness goes through self.rng so a seed + the inputs reproduce a run exactly,
+        # purely visual randomness (screenshake) uses its own generator so drawing or not can't change the outcome
+        self.seed = seed if seed is not None else random.getrandbits(63)
+        self.rng = random.Random(self.seed)
+        self.render_rng = random.Random(self.seed)
+        if headless:
+            # SDL's dummy drivers still give us a display surface so convert_alpha works, nothing ever shows up
+            os.environ['SDL_VIDEODRIVER'] = 'dummy'
+            os.environ['SDL_AUDIODRIVER'] = 'dummy'
+
         pygame.init()
 
         # change the window caption
@@ -25,101 +100,89 @@ class Game:
         # create window
         self.screen = pygame.display.set_mode((640,480))
 
-        # icon
-        pygame.display.set_icon(pygame.image.load("data/images/endScene/2.png").convert())
-
         self.display = pygame.Surface((320, 240), pygame.SRCALPHA) # render on smaller resolution then scale it up to bigger screen
         self.display_black = pygame.Surface((320, 240), pygame.SRCALPHA) # render on smaller resolution then scale it up to bigger screen
         self.display_2 = pygame.Surface((320, 240))
 
         self.clock = pygame.time.Clock()
+        self.max_steps = max_steps
+        self.render_fps = render_fps
+        self.time_scale = time_scale # > 1 runs the simulation faster than real time
+        self.alpha = 1 # how far between the last two simulation steps we are drawing
+        self.tick = 0 # simulation steps taken so far
+        self.input = input_source or KeyboardInput()
+        self.profile = profile
+        self.profiler = Profiler(enabled=bool(profile)) # F3 toggles the overlay
+        self.memtrace = MemoryTracer(memory) if memory else None
+        self.history = snapshot.SnapshotHistory(history) if history else None # every step's state, for rewind / retry
+        self.history_action = None # 'rewind', 'checkpoint' or 'retry', done once the step is over
         
         self.movement = [False, False, False, False]
 
-        self.assets = {
-            'grass': load_images('tiles/grass'),
-            'stone': load_images('tiles/stone'),
-            'player': load_image('entities/player/player.png'),
-            'background': load_image('background.png'),
-            'story1': load_image('intro/Story1.png'),
-            'story2': load_image('intro/Story2.png'),
-            'story3': load_image('intro/Story3.png'),
-            'story4': load_image('intro/Story4.png'),
-            'story5': load_image('intro/Story5.png'),
-            '1': load_image('endScene/1.png'),
-            '2': load_image('endScene/2.png'),
-            '3': load_image('endScene/3.png'),
-            '4': load_image('endScene/4.png'),
-            'clouds': load_images('clouds'),
-            'catnip': load_image('UI/catnipUI.png'),
-            'toy': load_image('UI/toy.png'),
-            'catnip/idle': Animation(load_images('entities/catnip/catnip')),
-            'toy/idle': Animation(load_images('entities/toy/idle')),
-            'button/idle': Animation(load_images('entities/button/idle')),
-            'button/on': Animation(load_images('entities/button/on')),
-            'wind/idle': Animation(load_images('entities/windturbine/idle')),
-            'wind/on': Animation(load_images('entities/windturbine/powered')),
-            'trap/idle': Animation(load_images('entities/trap/idle')),
-            'prize/idle': Animation(load_images('entities/prize/idle')),
-            'prize/wind': Animation(load_images('entities/prize/wind')),
-            'player/idle': Animation(load_images('entities/player/idle'), img_dur=10),
-            'player/run': Animation(load_images('entities/player/run'), img_dur=6),
-            'player/jump': Animation(load_images('entities/player/jump')),
-            'player/slide': Animation(load_images('entities/player/slide')),
-            'player/wall_slide': Animation(load_images('entities/player/wall_slide')),
-            'enemy/stun': Animation(load_images('entities/cat/stun')),
-            'enemy/run': Animation(load_images('entities/cat/run'), img_dur=8),
-            'enemy/idle': Animation(load_images('entities/cat/idle'), img_dur=8),
-            'enemy/shoot': Animation(load_images('entities/cat/shoot'), img_dur=4),
-            'enemy/run': Animation(load_images('entities/cat/run'), img_dur=8),
-            'particle/leaf': Animation(load_images('particles/leaf'), img_dur=20, loop=False),
-            'particle/particle': Animation(load_images('particles/particle'), img_dur=6, loop=False),
-            'particle/particle_2': Animation(load_images('particles/particle_2'), img_dur=6, loop=False),
-            'particle/confetti': Animation(load_images('particles/confetti'), img_dur=3, loop=False),
-            'projectile': load_image('entities/cat/projectile.png'),
+        # entity frames and the UI icons draw their black pixels (they used to go through flip() / copy(), which drop the colorkey),
+        # everything else keys black out
+        # gameplay assets are pinned, the full screen story / end scene pictures load when their screen comes up and can be evicted
+        self.assets = AssetManager(budget=asset_budget)
+        gameplay = {
+            'grass': lambda: load_images('tiles/grass'),
+            'stone': lambda: load_images('tiles/stone'),
+            'player': lambda: load_image('entities/player/player.png'),
+            'background': lambda: load_image('background.png'),
+            'clouds': lambda: load_images('clouds'),
+            'catnip': lambda: load_image('UI/catnipUI.png', colorkey=None),
+            'toy': lambda: load_image('UI/toy.png', colorkey=None),
+            'catnip/idle': lambda: Animation(load_images('entities/catnip/catnip', colorkey=None)),
+            'toy/idle': lambda: Animation(load_images('entities/toy/idle', colorkey=None)),
+            'button/idle': lambda: Animation(load_images('entities/button/idle', colorkey=None)),
+            'button/on': lambda: Animation(load_images('entities/button/on', colorkey=None)),
+            'wind/idle': lambda: Animation(load_images('entities/windturbine/idle', colorkey=None)),
+            'wind/on': lambda: Animation(load_images('entities/windturbine/powered', colorkey=None)),
+            'trap/idle': lambda: Animation(load_images('entities/trap/idle', colorkey=None)),
+            'prize/idle': lambda: Animation(load_images('entities/prize/idle', colorkey=None)),
+            'prize/wind': lambda: Animation(load_images('entities/prize/wind', colorkey=None)),
+            'player/idle': lambda: Animation(load_images('entities/player/idle', colorkey=None), img_dur=10),
+            'player/run': lambda: Animation(load_images('entities/player/run', colorkey=None), img_dur=6),
+            'player/jump': lambda: Animation(load_images('entities/player/jump', colorkey=None)),
+            'player/slide': lambda: Animation(load_images('entities/player/slide', colorkey=None)),
+            'player/wall_slide': lambda: Animation(load_images('entities/player/wall_slide', colorkey=None)),
+            'enemy/stun': lambda: Animation(load_images('entities/cat/stun', colorkey=None)),
+            'enemy/run': lambda: Animation(load_images('entities/cat/run', colorkey=None), img_dur=8),
+            'enemy/idle': lambda: Animation(load_images('entities/cat/idle', colorkey=None), img_dur=8),
+            'enemy/shoot': lambda: Animation(load_images('entities/cat/shoot', colorkey=None), img_dur=4),
+            'particle/leaf': lambda: Animation(load_images('particles/leaf'), img_dur=20, loop=False),
+            'particle/particle': lambda: Animation(load_images('particles/particle'), img_dur=6, loop=False),
+            'particle/particle_2': lambda: Animation(load_images('particles/particle_2'), img_dur=6, loop=False),
+            'particle/confetti': lambda: Animation(load_images('particles/confetti'), img_dur=3, loop=False),
+            'projectile': lambda: load_image('entities/cat/projectile.png'),
         }
+        for key, load in gameplay.items():
+            self.assets.add(key, load, pin=True)
+        for key, path in SCENES.items():
+            self.assets.add(key, lambda path=path: load_image(path))
 
-        # adding sound
-        self.sfx = {
-            'jump': pygame.mixer.Sound('data/sfx/jump.wav'),
-            'dash': pygame.mixer.Sound('data/sfx/dash.wav'),
-            'win': pygame.mixer.Sound('data/sfx/win.wav'),
-            'hit': pygame.mixer.Sound('data/sfx/hit.wav'),
-            'shoot': pygame.mixer.Sound('data/sfx/shoot.wav'),
-            'bad': pygame.mixer.Sound('data/sfx/bad.mp3'),
-            'get': pygame.mixer.Sound('data/sfx/get.mp3'),
-            'stun': pygame.mixer.Sound('data/sfx/stun.wav'),
-            'transition': pygame.mixer.Sound('data/sfx/transition.wav'),
-            'pickup': pygame.mixer.Sound('data/sfx/pickup.wav'),
-            'drop': pygame.mixer.Sound('data/sfx/drop.wav'),
-            'button': pygame.mixer.Sound('data/sfx/button.wav'),
+        # everything gameplay needs is decoded up front on a thread pool, only the convert step is left for the main thread
+        start = time.perf_counter()
+        preload(GAMEPLAY_IMAGES + [ICON], [sound[0] for sound in SFX.values()], load_workers)
+        self.assets.load_pinned()
+        pygame.display.set_icon(load_pixels(ICON)) # the decoded pixels as they are, no convert and not kept around
 
-        }
-        
-        self.sfx['win'].set_volume(0.3)
-        self.sfx['transition'].set_volume(0.3)
-        self.sfx['bad'].set_volume(0.7)
-        self.sfx['get'].set_volume(0.4)
-        self.sfx['pickup'].set_volume(0.4)
-        self.sfx['drop'].set_volume(0.6)
-        self.sfx['stun'].set_volume(0.6)
-        self.sfx['button'].set_volume(0.2)
-        self.sfx['shoot'].set_volume(0.4)
-        self.sfx['hit'].set_volume(0.8)
-        self.sfx['dash'].set_volume(0.5)
-        self.sfx['jump'].set_volume(0.7)
-
-        self.clouds = Clouds(self.assets['clouds'], count=4)
+        # adding sound, everything plays through the voice manager so storms of the same sound can't take every channel
+        self.audio = AudioManager(SFX, channels=SFX_CHANNELS)
+        loader.discard() # anything decoded that nothing asked for
+        self.load_time = time.perf_counter() - start
+
+        self.clouds = Clouds(self.assets['clouds'], count=4, rng=self.rng)
 
         # initalizing player
         self.player = Player(self, (100, 100), (15, 14))
 
         # initalizing tilemap
         self.tilemap = Tilemap(self, tile_size=16)
+        self.levels = LevelLoader(maps, stream_radius=stream_radius) # compiled bundles from data/levels, see scripts/levels.py
 
         # tracking level
         self.level = 0
-        self.max_level = len(os.listdir('data/maps')) - 1 # max level
+        self.max_level = self.levels.max_level
         # loading the level
         self.load_level(self.level)
 
@@ -131,10 +194,15 @@ class Game:
         self.win_delay = 100
 
         self.music = 1
+        self.music_player = MusicPlayer(enabled=not headless)
+        self.music_player.cue(MUSIC) # read and opened while the story plays so gameplay starts without a load
 
 
     def load_level(self, map_id):
-        self.tilemap.load('data/maps/' + str(map_id) + '.json')
+        # a copy of the level's pristine template, parsed once on the loader's thread (usually while the last level was
+        # played), so respawns never touch the disk or json
+        self.tilemap, spawns = self.levels.take(map_id)
+        self.tilemap.game = self
 
         # keep track
         self.particles = []
@@ -153,355 +221,620 @@ class Game:
         self.transition = -30
 
 
-        # spawn the ememies
-        self.enemies = []
-        self.trap = []
-        self.prize = []
-        self.catnip = []
-        self.button = []
-        self.turbine= []
-        self.toy = []
-        for spawner in self.tilemap.extract([('spawners', 0), ('spawners', 1), ('spawners', 2), ('spawners', 3), ('spawners', 4), ('spawners', 5), ('spawners', 6), ('spawners', 7)]):
-            if spawner['variant'] == 0: 
-                self.player.pos = spawner['pos']
-            elif spawner['variant'] == 1:
-                self.enemies.append(Cat(self, spawner['pos'], (16, 13)))
-            elif spawner['variant'] == 2:
-                self.trap.append(Trap(self, spawner['pos'], (10, 16)))
-            elif spawner['variant'] == 3:
-                self.prize.append(Prize(self, spawner['pos'], (17, 100)))
-            elif spawner['variant'] == 4:
-                self.catnip.append(CatnipRecharge(self, spawner['pos'], (14, 16)))
-            elif spawner['variant'] == 5:
-                self.button.append(Button(self, (spawner['pos'][0]+2, spawner['pos'][1] + 3), (8, 16)))
-            elif spawner['variant'] == 6:
-                self.turbine.append(Turbine(self,spawner['pos'], (100, 300)))
+        # spawn the ememies, the level compiler already worked out which list, size and position each one gets
+        for name, cls in ENTITY_LISTS:
+            setattr(self, name, [])
+        for name, pos, size in spawns:
+            if name == 'player':
+                self.player.pos = pos
             else:
-                self.toy.append(Toy(self, spawner['pos'], (16, 16)))
+                getattr(self, name).append(ENTITY_CLASSES[name](self, pos, size))
 
         # creating 'camera' 
         self.scroll = [self.prize[0].pos[0] + 100, self.prize[0].pos[1]]
+        self.prev_scroll = list(self.scroll)
+        self.player.prev_pos = tuple(self.player.pos) # no blending across a respawn
+
+        if self.levels.stream_radius: # start loading around the spawn before the first frame needs it
+            self.tilemap.stream([(self.player.pos, None), (self.scroll, None)])
+
+        # the next level gets parsed while this one is played
+        if map_id < self.max_level:
+            self.levels.preload(map_id + 1)
 
         self.player.catnip = 3
 
         self.pickup = 0 # toy pickup
+
+        if self.memtrace:
+            self.memtrace.level_loaded(self)
     
     def playmusic(self, play):
         '''
-        plays game music once and loops it
+        plays game music once and loops it, the file was already read and opened during the story (MusicPlayer.cue)
         '''
         if self.music == 1 and play:
-            pygame.mixer.music.load('data/music.mp3')
-            pygame.mixer.music.set_volume(0.2)
-            pygame.mixer.music.play(-1)
+            self.music_player.play(MUSIC, volume=0.2)
             self.music = 0
 
         if self.prize[0].dead == 1:
             self.music = 1 # reset music and stop it
-            pygame.mixer.music.stop()
+            self.music_player.stop()
             
 
-    def run(self):
+    def process_events(self, controls=True):
         '''
-        runs the Game
+        applies this step's actions from the input source
+        (apply the gameplay actions: bool)
         '''
-        #pygame.mixer.music.load('data/music.wav')
-        #pygame.mixer.music.set_volume(0.5)
-        #pygame.mixer.music.play(-1)
-
-        #self.sfx['ambience'].play(-1)
-
-        # creating an infinite game loop
-        while True:
-            self.display.fill((0, 0, 0, 0))    # outlines
-            if self.story_timer > 0:
-                if self.story_timer > 400:
-                    self.screen.blit(self.assets['story1'], (0,0)) # no outline
-
-                elif self.story_timer > 300:
-                    self.screen.blit(self.assets['story2'], (0,0)) # no outline
-
-                elif self.story_timer > 200:
-                    self.screen.blit(self.assets['story3'], (0,0)) # no outline
-
-                elif self.story_timer > 100:
-                    # clear the screen for new image generation in loop
-                    self.screen.blit(self.assets['story4'], (0,0)) # no outline
-                    # text = pygame.font.SysFont('', 300).render("Bruh?", True, (255, 255, 255)) # tired to get it to be less fuzzy
-                    # scaled_text = pygame.transform.scale(text, (text.get_width() * 0.1, text.get_height() * 0.1))
-                    # self.screen.blit(scaled_text, (self.screen.get_width()/4 - 60, 410))
+        for action in self.input.poll(self.tick):
+            if action == 'quit': # have to code the window closing
+                self.quit()
+            if action == 'toggle_profiler':
+                self.profiler.toggle_overlay()
+            if action == 'rewind' and self.history:
+                self.history_action = 'rewind'
+            if not controls:
+                continue
+            if action == 'checkpoint' and self.history and not self.dead:
+                self.history_action = 'checkpoint'
+            if action == 'left_down':
+                self.movement[0] = True
+            if action == 'right_down':
+                self.movement[1] = True
+            if action == 'jump':
+                if self.player.jump():  # velocity pointing upwards, gravity will pull player back down over time
+                    self.audio.play('jump')
+            if action == 'dash':
+                self.player.dash()
+            if action == 'pickup':
+                self.toy[0].pickup()
+            if action == 'drop':
+                self.toy[0].drop()
+            if action == 'left_up':
+                self.movement[0] = False
+            if action == 'right_up':
+                self.movement[1] = False
+
+    def step(self):
+        '''
+        advances the simulation by one fixed step, never draws anything
+        '''
+        if self.story_timer > 0:
+            self.process_events(controls=False)
+            self.story_timer -= 1
+            if self.story_timer == 0:
+                self.assets.release(*STORY) # the intro never comes back
+
+        elif self.prize[0].dead == 1: # when prize = 1 --> Lose
+            self.process_events(controls=False)
+            self.playmusic(0)
+            if self.bad_ending == 0: # end game kick people out
+                self.load_level(self.level)
+                self.assets.release(*BAD_ENDING)
+            self.bad_ending -= 1
+
+        elif self.prize[0].dead == 0 and not self.win_delay and self.level == self.max_level:  # when prize = 0 --> win
+            self.process_events(controls=False)
+            self.audio.play('transition')
+
+        elif self.prize[0].dead == 0 and not self.win_delay:
+            self.process_events(controls=False)
+            self.transition += 1 # start timer, increasing value past 0
+            if self.transition > 30:
+                self.level = min(self.level + 1, self.max_level) # increase level
+                self.audio.play('transition')
+                self.load_level(self.level) # self.load_level(self.level)
+            if self.transition < 0:
+                self.transition += 1 # goes up automatically until 0
+
+        else:
+            self.process_events()
+            self.update()
+
+        self.tick += 1
+        self.audio.update(self.tick)
+        self.music_player.update()
+        self.input.step_done(self)
+        if self.history:
+            self.end_history_step()
+
+    def end_history_step(self):
+        '''
+        keeps this step's snapshot, or carries out the rewind / checkpoint / retry asked for during the step
+        (between steps so a restored state is never half updated)
+        '''
+        action, self.history_action = self.history_action, None
+        if action == 'rewind':
+            self.history.rewind(self, REWIND_STEPS) # the newest snapshot left is the state we're back at
+            return
+        if action == 'retry':
+            self.history.retry(self, self.level)
+        self.history.record(self)
+        if action == 'checkpoint':
+            self.history.checkpoint(self, self.level)
+
+    def update(self):
+        '''
+        one gameplay step: camera, entities, projectiles and effects
+        '''
+        self.playmusic(1)
+
+        # remember where things were so render() can blend between steps
+        self.prev_scroll = list(self.scroll)
+        for entity in [self.player] + self.enemies:
+            entity.prev_pos = tuple(entity.pos)
+
+        self.screenshake = max(0, self.screenshake-1) # resets screenshake value
+
+        if self.dead: # get hit once
+            self.dead += 1
+            if self.dead >= 10: # to make the level transitions smoother
+                self.transition = min(self.transition + 1, 30) # go as high as it can without changing level
+            if self.dead > 40: # timer that starts when you die
+                if self.history and self.level in self.history.checkpoints:
+                    self.history_action = 'retry' # back to the checkpoint (C) once this step is done
                 else:
-                    self.screen.blit(self.assets['story5'], (0,0)) # no outline
-                    # text = pygame.font.SysFont('FFF Forward', 30).render("Bruh.", False, (255, 255, 255))
-                    # self.screen.blit(text, (self.screen.get_width()/4 + 20, 410))
-                
-                for event in pygame.event.get():
-                    if event.type == pygame.QUIT: # have to code the window closing
-                        pygame.quit()
-                        sys.exit()
-                self.story_timer -= 1 
+                    self.load_level(self.level) # self.level
+
+        with self.profiler.stage('update/camera'):
+            # move 'camera' to focus on player, make him the center of the screen
+            # scroll = current scroll + (where we want the camera to be - what we have/can see currently)
+            self.scroll[0] += (self.player.rect().centerx - self.display.get_width()/2 - self.scroll[0])  / 30  # x axis
+            self.scroll[1] += (self.player.rect().centery - self.display.get_height()/2 - self.scroll[1]) / 30
+
+            self.clouds.update() # updates clouds before the rest of the tiles
+
+        with self.profiler.stage('update/entities'):
+            self.prize[0].update(self.tilemap)
+
+            self.turbine[0].update(self.tilemap)
+
+            for enemy in self.enemies.copy():
+                enemy.update(self.tilemap, (0,0))
+
+            for recharge in self.catnip.copy():
+                recharge.update(self.tilemap, (0,0))
+
+        with self.profiler.stage('update/projectiles'):
+            # move bullet projectiles
+            # [[x, y], direction, timer]
+            for projectile in self.projectiles.copy():
+                projectile[0][0] += projectile[1]
+                projectile[2] += 1
+
+                if self.tilemap.solid_check(projectile[0]): # if location is a solid tile
+                    self.projectiles.remove(projectile)
+                    for i in range(4):
+                        self.sparks.append(Spark(projectile[0], self.rng.random() - 0.5 + (math.pi if projectile[1] > 0 else 0), 2 + self.rng.random())) # (math.pi if projectile[1] > 0 else 0), sparks bounce in oppositie direction if hit wall which depends on projectile direction
+                elif projectile[2] > 360: #if timer > 6 seconds
+                    self.projectiles.remove(projectile)
+                elif abs(self.player.dashing) < 50: # if not in dash
+                    if self.player.rect().collidepoint(projectile[0]):
+                        self.projectiles.remove(projectile)
+                        self.dead += 1
+                        self.audio.play('hit')
+                        self.screenshake = max(16, self.screenshake)  # apply screenshake, larger wont be overrided by a smaller screenshake
+                        for i in range(5): # when projectile hits player
+                            # on death sparks
+                            angle = self.rng.random() * math.pi * 2 # random angle in a circle
+                            speed = self.rng.random() * 5
+                            self.sparks.append(Spark(self.player.rect().center, angle, 2 + self.rng.random()))
+                            # on death particles
+                            self.particles.append(Particle(self, 'particle', self.player.rect().center, velocity=[math.cos(angle +math.pi) * speed * 0.5, math.sin(angle * math.pi) * speed * 0.5], frame=self.rng.randint(0, 7)))
+
+                if self.prize[0].rect().collidepoint(projectile[0]): # cat hits traps, code that activates bad ending
+                    self.prize[0].lower = 1 # lower prize
+                    self.screenshake = max(10, self.screenshake)  # apply screenshake, larger wont be overrided by a smaller screenshake
+
+                if self.button[0].rect().collidepoint(projectile[0]): # cat hits traps, code that activates bad ending
+                    self.button[0].activate = 1
+
+        with self.profiler.stage('update/traps'):
+            for enemy in self.trap.copy():
+                kill =  enemy.update(self.tilemap, (0,0))
+                if abs(self.player.dashing) < 50: # not dashing
+                    if self.player.rect().colliderect(enemy): # player collides with enemy
+                        self.dead += 1 # die
+                        self.audio.play('hit')
+                        self.screenshake = max(16, self.screenshake)  # apply screenshake, larger wont be overrided by a smaller screenshake
+                        for i in range(10): # when projectile hits player
+                            # on death sparks
+                            angle = self.rng.random() * math.pi * 2 # random angle in a circle
+                            speed = self.rng.random() * 5
+                            self.sparks.append(Spark(self.player.rect().center, angle, 2 + self.rng.random()))
+                            # on death particles
+                            self.particles.append(Particle(self, 'particle', self.player.rect().center, velocity=[math.cos(angle + math.pi) * speed * 0.5, math.sin(angle * math.pi) * speed * 0.5], frame=self.rng.randint(0, 7)))
+
+                if self.prize[0].rect().colliderect(enemy): # cat hits traps, code that activates bad ending
+                    self.prize[0].dead = True # prize dies
+                    self.audio.play('bad')
+                    self.screenshake = max(16, self.screenshake)  # apply screenshake, larger wont be overrided by a smaller screenshake
+                    for i in range(10): # when projectile hits player
+                        # on death sparks
+                        angle = self.rng.random() * math.pi * 2 # random angle in a circle
+                        speed = self.rng.random() * 5
+                        self.sparks.append(Spark(self.player.rect().center, angle, 2 + self.rng.random()))
+                        # on death particles
+                        self.particles.append(Particle(self, 'particle', self.player.rect().center, velocity=[math.cos(angle + math.pi) * speed * 0.5, math.sin(angle * math.pi) * speed * 0.5], frame=self.rng.randint(0, 7)))
+
+        with self.profiler.stage('update/entities'):
+            if not self.dead:
+                # update player movement
+                self.player.update(self.tilemap, (self.movement[1] - self.movement[0], 0))
+
+            for enemy in self.prize.copy():
+                kill =  enemy.update(self.tilemap, [0,0])
+                # add mechanics later
+
+            self.toy[0].update(self.tilemap, (0,0)) # update cat toy
+
+            self.button[0].update(self.tilemap)
+
+        if self.levels.stream_radius:
+            with self.profiler.stage('update/streaming'):
+                # chunks around the camera and player load ahead of time, cats and furballs keep the ones they're in
+                center = (self.scroll[0] + self.display.get_width() / 2, self.scroll[1] + self.display.get_height() / 2)
+                self.tilemap.stream([(center, None), (self.player.pos, None)] + [(enemy.pos, 0) for enemy in self.enemies] + [(projectile[0], 0) for projectile in self.projectiles])
+
+        with self.profiler.stage('update/effects'):
+            # spark affect
+            for spark in self.sparks.copy():
+                kill = spark.update()
+                if kill:
+                    self.sparks.remove(spark)
+
+            for particle in self.particles.copy():
+                kill = particle.update()
+                if particle.type == 'leaf':
+                    particle.pos[0] += math.sin(particle.animation.frame * 0.035) * 0.3 # making the parlitcle move back and forth smooth'y
+                if kill:
+                    self.particles.remove(particle)
+
+    def render(self):
+        '''
+        draws whatever screen the game is currently on
+        '''
+        if self.story_timer > 0:
+            # the next story frame loads in the background while this one is up
+            frame = min(4, (500 - self.story_timer) // 100)
+            if frame < 4:
+                self.assets.prefetch(STORY[frame + 1])
 
-            
-            elif self.prize[0].dead == 1: # when prize = 1 --> Lose
-                self.playmusic(0)
-                if self.bad_ending > 340:
-                    self.screen.blit(self.assets['1'], (0,0)) # no outline   # change to noot noot
+            if self.story_timer > 400:
+                self.screen.blit(self.assets['story1'], (0,0)) # no outline
 
-                elif self.bad_ending > 90:
-                    self.screen.blit(self.assets['2'], (0,0)) # no outline
-                else:
-                    # clear the screen for new image generation in loop
-                    self.screen.blit(self.assets['3'], (0,0)) # no outline
-                
-                if self.bad_ending == 0: # end game kick people out
-                    self.load_level(self.level)
-
-                for event in pygame.event.get():
-                    if event.type == pygame.QUIT: # have to code the window closing
-                        pygame.quit()
-                        sys.exit()
-                self.bad_ending -= 1 
-            
-            elif self.prize[0].dead == 0 and not self.win_delay and self.level == self.max_level:  # when prize = 0 --> win
-                self.sfx['transition'].play()
-                self.screen.blit(self.assets['4'], (0,0)) # no outline       # change to you win! nice picture with mouses together
-                for event in pygame.event.get():
-                    if event.type == pygame.QUIT: # have to code the window closing
-                        pygame.quit()
-                        sys.exit()
-
-            elif self.prize[0].dead == 0 and not self.win_delay:
-                self.transition += 1 # start timer, increasing value past 0
-                if self.transition > 30: 
-                    self.level = min(self.level + 1, self.max_level) # increase level
-                    self.sfx['transition'].play()
-                    self.load_level(self.level) # self.load_level(self.level) 
-                if self.transition < 0:
-                    self.transition += 1 # goes up automatically until 0
+            elif self.story_timer > 300:
+                self.screen.blit(self.assets['story2'], (0,0)) # no outline
+
+            elif self.story_timer > 200:
+                self.screen.blit(self.assets['story3'], (0,0)) # no outline
 
+            elif self.story_timer > 100:
+                # clear the screen for new image generation in loop
+                self.screen.blit(self.assets['story4'], (0,0)) # no outline
+                # text = pygame.font.SysFont('', 300).render("Bruh?", True, (255, 255, 255)) # tired to get it to be less fuzzy
+                # scaled_text = pygame.transform.scale(text, (text.get_width() * 0.1, text.get_height() * 0.1))
+                # self.screen.blit(scaled_text, (self.screen.get_width()/4 - 60, 410))
             else:
+                self.screen.blit(self.assets['story5'], (0,0)) # no outline
+                # text = pygame.font.SysFont('FFF Forward', 30).render("Bruh.", False, (255, 255, 255))
+                # self.screen.blit(text, (self.screen.get_width()/4 + 20, 410))
 
-                self.playmusic(1)
+        elif self.prize[0].dead == 1: # when prize = 1 --> Lose
+            self.assets.prefetch(*BAD_ENDING)
+            if self.bad_ending > 340:
+                self.screen.blit(self.assets['1'], (0,0)) # no outline   # change to noot noot
 
+            elif self.bad_ending > 90:
+                self.screen.blit(self.assets['2'], (0,0)) # no outline
+            else:
                 # clear the screen for new image generation in loop
-                self.display_black.fill((0, 0, 0, 0))    # black outlines
-                self.display_2.blit(self.assets['background'], (0,0)) # no outline
+                self.screen.blit(self.assets['3'], (0,0)) # no outline
 
-                self.screenshake = max(0, self.screenshake-1) # resets screenshake value
+        elif self.prize[0].dead == 0 and not self.win_delay and self.level == self.max_level:  # when prize = 0 --> win
+            self.screen.blit(self.assets['4'], (0,0)) # no outline       # change to you win! nice picture with mouses together
 
-                if self.dead: # get hit once
-                    self.dead += 1
-                    if self.dead >= 10: # to make the level transitions smoother
-                        self.transition = min(self.transition + 1, 30) # go as high as it can without changing level
-                    if self.dead > 40: # timer that starts when you die
-                        self.load_level(self.level) # self.level
+        elif self.prize[0].dead == 0 and not self.win_delay:
+            pass # level transition, last frame stays on screen
 
-                # move 'camera' to focus on player, make him the center of the screen
-                # scroll = current scroll + (where we want the camera to be - what we have/can see currently) 
-                self.scroll[0] += (self.player.rect().centerx - self.display.get_width()/2 - self.scroll[0])  / 30  # x axis
-                self.scroll[1] += (self.player.rect().centery - self.display.get_height()/2 - self.scroll[1]) / 30
+        else:
+            self.render_level()
 
-                # fix the jitter
-                render_scroll = (int(self.scroll[0]), int(self.scroll[1]))
+    def render_level(self):
+        '''
+        draws the level, camera and moving entities are blended between the last two steps by self.alpha
+        '''
+        # about to need an end scene, get it loaded before its first frame
+        if self.prize[0].lower:
+            self.assets.prefetch(BAD_ENDING[0])
+        if self.prize[0].start and self.level == self.max_level:
+            self.assets.prefetch('4')
+
+        with self.profiler.stage('render/background'):
+            # clear the screen for new image generation in loop
+            self.display.fill((0, 0, 0, 0))    # outlines
+            self.display_black.fill((0, 0, 0, 0))    # black outlines
+            self.display_2.blit(self.assets['background'], (0,0)) # no outline
+
+            # fix the jitter
+            render_scroll = (int(self.prev_scroll[0] + (self.scroll[0] - self.prev_scroll[0]) * self.alpha), int(self.prev_scroll[1] + (self.scroll[1] - self.prev_scroll[1]) * self.alpha))
+
+            self.clouds.render(self.display_2, offset=render_scroll)
 
-                self.clouds.update() # updates clouds before the rest of the tiles
-                self.clouds.render(self.display_2, offset=render_scroll)
+        with self.profiler.stage('render/tilemap'):
+            self.tilemap.render(self.display_black, offset=render_scroll)
 
-                self.prize[0].update(self.tilemap)
-                self.prize[0].render(self.display_black, offset=render_scroll) # render prize
+            # for testing
+            #pygame.draw.rect(self.display_black, (255, 0, 0), (self.prize[0].pos[0] - render_scroll[0], self.prize[0].pos[1] - render_scroll[1] + 30, self.prize[0].size[0], self.prize[0].size[1]), 3)
+            #pygame.draw.rect(self.display_black, (0, 225, 0), (self.prize[0].pos[0] - render_scroll[0] + 10, self.prize[0].pos[1] - render_scroll[1] + 90, self.prize[0].size[0], self.prize[0].size[1] - 60), 3)
 
-                self.tilemap.render(self.display_black, offset=render_scroll)
+        with self.profiler.stage('render/entities'):
+            # render turbine before everything
+            self.turbine[0].render(self.display_2, offset=render_scroll)
 
+            # render the enemies
+            for enemy in self.enemies:
+                enemy.render(self.display, offset=render_scroll)
+
+            for recharge in self.catnip:
+                recharge.render(self.display_black, offset=render_scroll)
+                # hitbox testing
+                #pygame.draw.rect(self.display_black, (255, 0, 0), (recharge.pos[0] - render_scroll[0] - 6, recharge.pos[1] - render_scroll[1], recharge.size[0], recharge.size[1]), 3)
+
+        with self.profiler.stage('render/projectiles'):
+            # render bullet projectiles
+            for projectile in self.projectiles:
+                img = self.assets['projectile']
+                self.display.blit(img, (projectile[0][0] - img.get_width() / 2 - render_scroll[0], projectile[0][1] - img.get_height() / 2 - render_scroll[1])) # spawns it the center of the projectile
+
+        with self.profiler.stage('render/entities'):
+            for enemy in self.trap:
+                enemy.render(self.display_black, offset=render_scroll) # change outline here
                 # for testing
-                #pygame.draw.rect(self.display_black, (255, 0, 0), (self.prize[0].pos[0] - render_scroll[0], self.prize[0].pos[1] - render_scroll[1] + 30, self.prize[0].size[0], self.prize[0].size[1]), 3)
-                #pygame.draw.rect(self.display_black, (0, 225, 0), (self.prize[0].pos[0] - render_scroll[0] + 10, self.prize[0].pos[1] - render_scroll[1] + 90, self.prize[0].size[0], self.prize[0].size[1] - 60), 3)
-                
-                # render turbine before everything
-                self.turbine[0].update(self.tilemap)
-                self.turbine[0].render(self.display_2, offset=render_scroll)
-
-
-                # render the enemies
-                for enemy in self.enemies.copy():
-                    enemy.update(self.tilemap, (0,0))
-                    enemy.render(self.display, offset=render_scroll)
-
-                # render the enemies
-                for recharge in self.catnip.copy():
-                    recharge.update(self.tilemap, (0,0))
-                    recharge.render(self.display_black, offset=render_scroll)
-                    # hitbox testing
-                    #pygame.draw.rect(self.display_black, (255, 0, 0), (recharge.pos[0] - render_scroll[0] - 6, recharge.pos[1] - render_scroll[1], recharge.size[0], recharge.size[1]), 3)
-
-
-                # render/spawn bullet projectiles
-                # [[x, y], direction, timer]
-                for projectile in self.projectiles.copy():
-                    projectile[0][0] += projectile[1]
-                    projectile[2] += 1
-                    img = self.assets['projectile']
-                    self.display.blit(img, (projectile[0][0] - img.get_width() / 2 - render_scroll[0], projectile[0][1] - img.get_height() / 2 - render_scroll[1])) # spawns it the center of the projectile
-                    
-                    if self.tilemap.solid_check(projectile[0]): # if location is a solid tile
-                        self.projectiles.remove(projectile)
-                        for i in range(4):
-                            self.sparks.append(Spark(projectile[0], random.random() - 0.5 + (math.pi if projectile[1] > 0 else 0), 2 + random.random())) # (math.pi if projectile[1] > 0 else 0), sparks bounce in oppositie direction if hit wall which depends on projectile direction
-                    elif projectile[2] > 360: #if timer > 6 seconds
-                        self.projectiles.remove(projectile)
-                    elif abs(self.player.dashing) < 50: # if not in dash
-                        if self.player.rect().collidepoint(projectile[0]):
-                            self.projectiles.remove(projectile)
-                            self.dead += 1
-                            self.sfx['hit'].play()
-                            self.screenshake = max(16, self.screenshake)  # apply screenshake, larger wont be overrided by a smaller screenshake
-                            for i in range(5): # when projectile hits player
-                                # on death sparks
-                                angle = random.random() * math.pi * 2 # random angle in a circle
-                                speed = random.random() * 5
-                                self.sparks.append(Spark(self.player.rect().center, angle, 2 + random.random())) 
-                                # on death particles
-                                self.particles.append(Particle(self, 'particle', self.player.rect().center, velocity=[math.cos(angle +math.pi) * speed * 0.5, math.sin(angle * math.pi) * speed * 0.5], frame=random.randint(0, 7)))
-                    
-                    if self.prize[0].rect().collidepoint(projectile[0]): # cat hits traps, code that activates bad ending
-                        self.prize[0].lower = 1 # lower prize
-                        self.screenshake = max(10, self.screenshake)  # apply screenshake, larger wont be overrided by a smaller screenshake
-                    
-                    if self.button[0].rect().collidepoint(projectile[0]): # cat hits traps, code that activates bad ending
-                        self.button[0].activate = 1
-                    
-
-                # render the enemies
-                for enemy in self.trap.copy():
-                    kill =  enemy.update(self.tilemap, (0,0))
-                    enemy.render(self.display_black, offset=render_scroll) # change outline here
-                    # for testing
-                    #pygame.draw.rect(self.display_black, (255, 0, 0), (enemy.pos[0] - render_scroll[0] + 8, enemy.pos[1] - render_scroll[1] + 5, enemy.size[0], enemy.size[1]), 3)
-                    if abs(self.player.dashing) < 50: # not dashing
-                        if self.player.rect().colliderect(enemy): # player collides with enemy
-                            self.dead += 1 # die
-                            self.sfx['hit'].play()
-                            self.screenshake = max(16, self.screenshake)  # apply screenshake, larger wont be overrided by a smaller screenshake
-                            for i in range(10): # when projectile hits player
-                                # on death sparks
-                                angle = random.random() * math.pi * 2 # random angle in a circle
-                                speed = random.random() * 5
-                                self.sparks.append(Spark(self.player.rect().center, angle, 2 + random.random())) 
-                                # on death particles
-                                self.particles.append(Particle(self, 'particle', self.player.rect().center, velocity=[math.cos(angle + math.pi) * speed * 0.5, math.sin(angle * math.pi) * speed * 0.5], frame=random.randint(0, 7)))
-
-                    if self.prize[0].rect().colliderect(enemy): # cat hits traps, code that activates bad ending
-                        self.prize[0].dead = True # prize dies
-                        self.sfx['bad'].play()
-                        self.screenshake = max(16, self.screenshake)  # apply screenshake, larger wont be overrided by a smaller screenshake
-                        for i in range(10): # when projectile hits player
-                            # on death sparks
-                            angle = random.random() * math.pi * 2 # random angle in a circle
-                            speed = random.random() * 5
-                            self.sparks.append(Spark(self.player.rect().center, angle, 2 + random.random())) 
-                            # on death particles
-                            self.particles.append(Particle(self, 'particle', self.player.rect().center, velocity=[math.cos(angle + math.pi) * speed * 0.5, math.sin(angle * math.pi) * speed * 0.5], frame=random.randint(0, 7)))
+                #pygame.draw.rect(self.display_black, (255, 0, 0), (enemy.pos[0] - render_scroll[0] + 8, enemy.pos[1] - render_scroll[1] + 5, enemy.size[0], enemy.size[1]), 3)
+
+            if not self.dead:
+                self.player.render(self.display_black, offset=render_scroll)
+                # hitbox testing
+                # pygame.draw.rect(self.display_black, (255, 0, 0), (self.player.pos[0] - render_scroll[0], self.player.pos[1] - render_scroll[1], self.player.size[0], self.player.size[1]), 3)
+
+            for enemy in self.prize:
+                enemy.render(self.display_black, offset=render_scroll) # change outline here
+
+            self.toy[0].render(self.display_black, offset=render_scroll) # in the level, or in the UI once picked up
+            # for hitbox testing
+            # pygame.draw.rect(self.display_black, (255, 0, 0), (self.toy[0].pos[0] - render_scroll[0], self.toy[0].pos[1] - render_scroll[1], self.toy[0].size[0], self.toy[0].size[1]), 3)
+
+            self.button[0].render(self.display_2, offset=render_scroll)
+            # for testing
+            # pygame.draw.rect(self.display_black, (255, 0, 0), (self.button[0].pos[0] - render_scroll[0] + 6, self.button[0].pos[1] - render_scroll[1], self.button[0].size[0], self.button[0].size[1]), 3)
+
+        with self.profiler.stage('render/effects'):
+            # spark affect
+            for spark in self.sparks:
+                spark.render(self.display, offset=render_scroll)
+
+        with self.profiler.stage('render/ui'):
+            level_bar = Levelbar(self.level, pos=(self.display_black.get_width() // 2 - 25, 13))
+            level_bar.render(self.display_black, 22)
+
+        with self.profiler.stage('render/outline'):
+            # black ouline based on display_black
+            display_mask = pygame.mask.from_surface(self.display_black)
+            display_sillhouette = display_mask.to_surface(setcolor=(0, 0, 0, 180), unsetcolor=(0, 0, 0, 0)) # 180 opaque, 0 transparent
+            self.display_2.blit(display_sillhouette, (0, 0))
+            for offset in [(-2, 0), (2, 0), (0, -2), (0, 2)]:
+                self.display_2.blit(display_sillhouette, offset) # putting what we drew onframe back into display
+
+            # ouline based on display
+            display_mask = pygame.mask.from_surface(self.display)
+            display_sillhouette = display_mask.to_surface(setcolor=(0, 0, 0, 180), unsetcolor=(0, 0, 0, 0)) # 180 opaque, 0 transparent
+            self.display_2.blit(display_sillhouette, (0, 0))
+            for offset in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
+                self.display_2.blit(display_sillhouette, offset) # putting what we drew onframe back into display
+
+        with self.profiler.stage('render/particles'):
+            for particle in self.particles:
+                particle.render(self.display, offset=render_scroll)
+
+        with self.profiler.stage('render/upscale'):
+            if self.transition == 1:
+                transition_surf = pygame.Surface(self.display_black.get_size())
+                pygame.draw.circle(transition_surf, (255, 255, 255), (self.display_black.get_width() // 2, self.display_black.get_height() // 2), (30 - abs(self.transition)) * 8) # display center of screen, 30 is the timer we chose, 30 * 8 = 180
+                transition_surf.set_colorkey((255, 255, 255)) # making the circle transparent now
+                self.display.blit(transition_surf, (0, 0))
+
+            self.display_2.blit(self.display_black, (0, 0)) # black
+            self.display_2.blit(self.display, (0, 0)) # cast display 2 on display
+            screenshake_offset = (self.render_rng.random() * self.screenshake - self.screenshake / 2, self.render_rng.random() * self.screenshake - self.screenshake / 2)
+            self.screen.blit(pygame.transform.scale(self.display_2, self.screen.get_size()), screenshake_offset) # render (now scaled) display image on big screen
+
+    def run(self):
+        '''
+        runs the Game
+        the simulation moves in fixed SIM_STEP steps paid for out of an accumulator of real time,
+        rendering happens once per loop and blends between the last two steps
+        '''
+        #pygame.mixer.music.load('data/music.wav')
+        #pygame.mixer.music.set_volume(0.5)
+        #pygame.mixer.music.play(-1)
 
+        #self.sfx['ambience'].play(-1)
 
-                if not self.dead:
-                    # update player movement
-                    self.player.update(self.tilemap, (self.movement[1] - self.movement[0], 0))
-                    self.player.render(self.display_black, offset=render_scroll)
-                    # hitbox testing
-                    # pygame.draw.rect(self.display_black, (255, 0, 0), (self.player.pos[0] - render_scroll[0], self.player.pos[1] - render_scroll[1], self.player.size[0], self.player.size[1]), 3)
+        accumulator = 0
+        last_time = time.perf_counter()
 
+        # creating an infinite game loop
+        while True:
+            self.profiler.begin_frame()
+            if self.memtrace:
+                self.memtrace.begin_frame()
+            now = time.perf_counter()
+            frame_time = min(now - last_time, MAX_FRAME_TIME) # a long stall (dragging the window) shouldn't turn into a burst of steps
+            last_time = now
+            accumulator += frame_time * self.time_scale
+
+            steps = 0
+            while accumulator >= SIM_STEP and steps < self.max_steps:
+                self.step()
+                accumulator -= SIM_STEP
+                steps += 1
+                if self.input.done(self.tick): # a replay ran out of recorded steps
+                    self.quit()
+            if steps == self.max_steps:
+                accumulator = min(accumulator, SIM_STEP) # too far behind to catch up, drop the backlog and slow down instead
+
+            self.alpha = accumulator / SIM_STEP
+            self.render()
+            self.profiler.render_overlay(self.screen)
+            with self.profiler.stage('assets/prefetch'):
+                self.assets.pump()
+
+            with self.profiler.stage('display.update'):
+                pygame.display.update()
+            self.profiler.end_frame()
+            if self.memtrace:
+                self.memtrace.end_frame()
+            self.clock.tick(self.render_fps) # cap how often we draw, 0 -> as fast as possible
+
+    def start_at(self, level):
+        '''
+        jumps straight into a level, skipping the intro
+        '''
+        self.level = level
+        self.load_level(self.level)
+        self.story_timer = 0
 
-                # render the enemies
-                for enemy in self.prize.copy():
-                    kill =  enemy.update(self.tilemap, [0,0])
-                    enemy.render(self.display_black, offset=render_scroll) # change outline here
-                    # add mechanics later
+    def state_hash(self):
+        '''
+        fingerprint of the simulation state, equal hashes mean two runs haven't diverged
+        -> (8 bytes)
+        '''
+        entities = [self.player] + self.enemies + self.trap + self.prize + self.catnip + self.button + self.turbine + self.toy
+        state = (
+            self.tick, self.level, self.story_timer, self.bad_ending, self.win_delay, self.transition, self.dead, self.wind, self.pickup,
+            self.screenshake, tuple(self.scroll), tuple(self.movement),
+            tuple((tuple(e.pos), tuple(e.velocity), e.action, e.animation.frame, e.flip) for e in entities),
+            (self.player.air_time, self.player.jumps, self.player.dashing, self.player.catnip),
+            tuple((tuple(p[0]), p[1], p[2]) for p in self.projectiles),
+            tuple((tuple(s.pos), s.angle, s.speed) for s in self.sparks),
+            tuple((p.type, tuple(p.pos), p.animation.frame) for p in self.particles),
+            self.rng.getstate(),
+        )
+        return hashlib.blake2b(repr(state).encode(), digest_size=8).digest()
+
+    def save_state(self):
+        '''
+        -> (bytes, the whole simulation state, see scripts/snapshot.py)
+        '''
+        return snapshot.snapshot(self)
 
-                self.toy[0].update(self.tilemap, (0,0)) # update cat toy
-                if not self.pickup: # if not picked up, render
-                    self.toy[0].render(self.display_black, offset=render_scroll)
-                    # for hitbox testing
-                    # pygame.draw.rect(self.display_black, (255, 0, 0), (self.toy[0].pos[0] - render_scroll[0], self.toy[0].pos[1] - render_scroll[1], self.toy[0].size[0], self.toy[0].size[1]), 3)
-                else:
-                    pass
+    def load_state(self, blob):
+        '''
+        jumps back (or forward) to a saved state in place, no level reload unless it's from another level
+        '''
+        snapshot.restore(self, blob)
 
-                self.button[0].update(self.tilemap)
-                self.button[0].render(self.display_2, offset=render_scroll)
-                # for testing
-                # pygame.draw.rect(self.display_black, (255, 0, 0), (self.button[0].pos[0] - render_scroll[0] + 6, self.button[0].pos[1] - render_scroll[1], self.button[0].size[0], self.button[0].size[1]), 3)
-
-                # spark affect
-                for spark in self.sparks.copy():
-                    kill = spark.update()
-                    spark.render(self.display, offset=render_scroll)
-                    if kill:
-                        self.sparks.remove(spark)
-                
-                level_bar = Levelbar(self.level, pos=(self.display_black.get_width() // 2 - 25, 13))
-                level_bar.render(self.display_black, 22)
-
-                # black ouline based on display_black
-                display_mask = pygame.mask.from_surface(self.display_black)
-                display_sillhouette = display_mask.to_surface(setcolor=(0, 0, 0, 180), unsetcolor=(0, 0, 0, 0)) # 180 opaque, 0 transparent
-                self.display_2.blit(display_sillhouette, (0, 0))
-                for offset in [(-2, 0), (2, 0), (0, -2), (0, 2)]:
-                    self.display_2.blit(display_sillhouette, offset) # putting what we drew onframe back into display
-
-                # ouline based on display
-                display_mask = pygame.mask.from_surface(self.display)
-                display_sillhouette = display_mask.to_surface(setcolor=(0, 0, 0, 180), unsetcolor=(0, 0, 0, 0)) # 180 opaque, 0 transparent
-                self.display_2.blit(display_sillhouette, (0, 0))
-                for offset in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-                    self.display_2.blit(display_sillhouette, offset) # putting what we drew onframe back into display
-                
-
-                for particle in self.particles.copy():
-                    kill = particle.update()
-                    particle.render(self.display, offset=render_scroll)
-                    if particle.type == 'leaf':
-                        particle.pos[0] += math.sin(particle.animation.frame * 0.035) * 0.3 # making the parlitcle move back and forth smooth'y
-                    if kill:
-                        self.particles.remove(particle)
-
-                for event in pygame.event.get():
-                    if event.type == pygame.QUIT: # have to code the window closing
-                        pygame.quit()
-                        sys.exit()
-                    if event.type == pygame.KEYDOWN:
-                        if event.key == pygame.K_a: # referencing WASD
-                            self.movement[0] = True
-                        if event.key == pygame.K_d:
-                            self.movement[1] = True
-                        if event.key == pygame.K_SPACE:
-                            if self.player.jump():  # velocity pointing upwards, gravity will pull player back down over time
-                                self.sfx['jump'].play()
-                        if event.key == pygame.K_e:
-                            self.player.dash()
-                        if event.key == pygame.K_s:
-                            self.toy[0].pickup()
-                        if event.key == pygame.K_f:
-                            self.toy[0].drop()
-                    if event.type == pygame.KEYUP: # when key is released
-                        if event.key == pygame.K_a: # referencing WASD
-                            self.movement[0] = False
-                        if event.key == pygame.K_d:
-                            self.movement[1] = False
-                        if event.key == pygame.K_w:
-                            self.movement[2] = False
-                
-                if self.transition == 1:
-                    transition_surf = pygame.Surface(self.display_black.get_size())
-                    pygame.draw.circle(transition_surf, (255, 255, 255), (self.display_black.get_width() // 2, self.display_black.get_height() // 2), (30 - abs(self.transition)) * 8) # display center of screen, 30 is the timer we chose, 30 * 8 = 180
-                    transition_surf.set_colorkey((255, 255, 255)) # making the circle transparent now
-                    self.display.blit(transition_surf, (0, 0))
-
-                self.display_2.blit(self.display_black, (0, 0)) # black 
-                self.display_2.blit(self.display, (0, 0)) # cast display 2 on display
-                screenshake_offset = (random.random() * self.screenshake - self.screenshake / 2, random.random() * self.screenshake - self.screenshake / 2)
-                self.screen.blit(pygame.transform.scale(self.display_2, self.screen.get_size()), screenshake_offset) # render (now scaled) display image on big screen
-
-            pygame.display.update()
-            self.clock.tick(60) # run at 60 fps, like a sleep
-
-
-# returns the game then runs it
-Game().run()
\ No newline at end of file
+    def quit(self):
+        '''
+        closes the input source (recorders save here), writes the profile and exits
+        '''
+        self.input.close()
+        if isinstance(self.input, ReplayInput) and not self.headless:
+            print(self.input.report(self.tick))
+        if self.profile:
+            self.profiler.export(self.profile)
+        if self.memtrace:
+            self.memtrace.stop()
+        pygame.quit()
+        sys.exit()
+
+    def simulate(self, steps, render=False):
+        '''
+        runs the simulation as fast as possible with no clock, used for headless runs
+        (number of steps, also draw every step offscreen) -> (seconds taken)
+        '''
+        start = time.perf_counter()
+        for i in range(steps):
+            self.profiler.begin_frame()
+            if self.memtrace:
+                self.memtrace.begin_frame()
+            self.step()
+            if render:
+                self.render()
+                self.assets.pump()
+            self.profiler.end_frame()
+            if self.memtrace:
+                self.memtrace.end_frame()
+        return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Mouse Disconnected')
+    parser.add_argument('--headless', action='store_true', help='simulate with no window, sound or frame cap')
+    parser.add_argument('--steps', type=int, default=3600, help='steps to simulate in headless mode')
+    parser.add_argument('--script', help='json file of scripted actions, {"step": ["action", ...]}')
+    parser.add_argument('--level', type=int, help='start on this level and skip the intro')
+    parser.add_argument('--render', action='store_true', help='still draw every step offscreen in headless mode')
+    parser.add_argument('--seed', type=int, help='seed for the simulation, random by default')
+    parser.add_argument('--record', help='record the inputs and state hashes of this run to a file')
+    parser.add_argument('--replay', help='play back a recorded run and check it stays in sync')
+    parser.add_argument('--profile', help='time every frame stage and write the last frames to this .json (chrome trace) or .csv on quit')
+    parser.add_argument('--memory', help='trace allocations per frame and live objects per level, report written to this json on quit')
+    parser.add_argument('--asset-budget', type=float, default=4, metavar='MB', help='memory the story / end scene pictures may keep loaded')
+    parser.add_argument('--load-workers', type=int, help='threads decoding assets at startup, one per core by default')
+    parser.add_argument('--load-report', help='write per asset decode / convert timings to this json')
+    parser.add_argument('--history', type=float, default=0, metavar='SECONDS', help='keep a snapshot of every step this far back, R rewinds 2 seconds, C sets a checkpoint that dying goes back to')
+    parser.add_argument('--load-state', help='start from a state saved with --save-state instead of the level start')
+    parser.add_argument('--save-state', help='write the simulation state to this file when a headless run ends')
+    parser.add_argument('--stream', type=int, default=0, metavar='RADIUS', help='stream levels in chunks, keeping this many chunks loaded around the camera and player')
+    parser.add_argument('--maps', default=MAP_PATH, help='play the maps in this folder (e.g. from generate_map.py) instead of the shipped ones')
+    parser.add_argument('--leak-check', type=int, metavar='RELOADS', help='with --memory, reload the start level this many times and report what grows')
+    args = parser.parse_args()
+
+    seed = args.seed
+    level = args.level
+    if args.replay:
+        recording = Recording.load(args.replay)
+        input_source = ReplayInput(recording)
+        seed = recording.seed
+        level = recording.level if recording.skip_intro else None
+    elif args.script:
+        input_source = ScriptedInput.load(args.script)
+    elif args.headless:
+        input_source = ScriptedInput()
+    else:
+        input_source = KeyboardInput()
+
+    if args.record:
+        recording = Recording(seed, level or 0, level is not None)
+        input_source = InputRecorder(input_source, recording, args.record)
+
+    # returns the game then runs it
+    game = Game(headless=args.headless, input_source=input_source, seed=seed, profile=args.profile, memory=args.memory, asset_budget=int(args.asset_budget * 1024 * 1024), load_workers=args.load_workers, history=int(args.history * SIM_RATE), stream_radius=args.stream, maps=args.maps)
+    if args.record:
+        recording.seed = game.seed
+    if args.load_report:
+        f = open(args.load_report, 'w')
+        json.dump(dict(loader.report(), startup_ms=round(game.load_time * 1000, 3)), f, indent=2)
+        f.close()
+    if level is not None:
+        game.start_at(level)
+    if args.load_state:
+        game.load_state(snapshot.load(args.load_state))
+    if args.leak_check and game.memtrace:
+        game.memtrace.leak_check(game, game.level, args.leak_check)
+
+    if args.replay and args.headless:
+        seconds = game.simulate(input_source.recording.steps, render=args.render)
+        print(input_source.report(game.tick) + f', {seconds:.2f}s')
+        game.quit()
+    elif args.headless:
+        seconds = game.simulate(args.steps, render=args.render)
+        print(f'{args.steps} steps in {seconds:.2f}s ({args.steps / seconds:.0f} steps/s), level {game.level}')
+        if args.save_state:
+            snapshot.save(game.save_state(), args.save_state)
+        game.quit()
+    else:
+        game.run()
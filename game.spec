@@ -1,14 +1,23 @@
 # -*- mode: python ; coding: utf-8 -*-
 
 
+import os
+
 block_cipher = None
 
+# images come from the asset build (python build_assets.py), same layout as data/images so the game finds them as usual
+if not os.path.exists('data/build/manifest.json'):
+    raise SystemExit('data/build is missing, run python build_assets.py first')
+# levels ship as compiled bundles (python -m scripts.levels), the editor maps stay behind
+if not os.path.exists('data/levels/index.json'):
+    raise SystemExit('data/levels is missing, run python -m scripts.levels first')
+
 
 a = Analysis(
     ['game.py'],
     pathex=[],
     binaries=[],
-    datas=[],
+    datas=[('data/build/images', 'data/images'), ('data/sfx', 'data/sfx'), ('data/levels', 'data/levels')],
     hiddenimports=[],
     hookspath=[],
     hooksconfig={},
@@ -0,0 +1,131 @@
+import os
+import time
+import random
+import argparse
+
+from scripts.tilemap import Tilemap
+
+# spawner variants by option name, the player (variant 0) is always placed once
+SPAWNER_VARIANTS = {'cats': 1, 'traps': 2, 'prizes': 3, 'catnip': 4, 'buttons': 5, 'turbines': 6, 'toys': 7}
+DEFAULT_SPAWNS = {'cats': 4, 'traps': 2, 'prizes': 1, 'catnip': 2, 'buttons': 1, 'turbines': 1, 'toys': 1}
+REQUIRED = ['prizes', 'buttons', 'turbines', 'toys'] # game.py uses the first of each, a level can't do without them
+DECOR_TYPES = ['grass', 'stone']
+VARIANTS = 9 # grass / stone images
+FLOOR_DEPTH = 3 # rows of floor under the surface before the underground starts
+HEADROOM = 4 # free rows kept between a platform and the floor under it
+
+def terrain(rng, width, height, density):
+    '''
+    a rolling floor, then two row thick platforms over it, then underground rows until density is reached
+    (random.Random, width and height in tiles, fraction of cells that are solid) -> (set of solid (x, y), list of floor heights)
+    '''
+    solid = set()
+    surface = []
+    y = height * 2 // 3
+    for x in range(width):
+        if rng.random() < 0.3:
+            y = max(height // 3, min(height - 2, y + rng.choice([-1, 1])))
+        surface.append(y)
+        for row in range(y, min(height, y + FLOOR_DEPTH)):
+            solid.add((x, row))
+
+    target = int(density * width * height)
+    for attempt in range(target * 4):
+        if len(solid) >= target:
+            break
+        length = rng.randint(3, 12)
+        x0 = rng.randrange(0, max(1, width - length))
+        top = min(surface[x0:x0 + length]) - HEADROOM - 2
+        if top < 1:
+            continue
+        y0 = rng.randrange(1, top + 1)
+        for x in range(x0, min(width, x0 + length)):
+            solid.add((x, y0))
+            solid.add((x, y0 + 1))
+
+    for row in range(height): # still short, fill in under the floor
+        for x in range(width):
+            if len(solid) >= target:
+                return solid, surface
+            if row >= surface[x]:
+                solid.add((x, row))
+    return solid, surface
+
+def generate(width=200, height=60, density=0.3, decor=0, spawns=None, seed=0, tile_size=16):
+    '''
+    builds a playable map, the same seed and parameters always give the same map
+    (width and height in tiles, fraction of cells that are solid, offgrid decor tiles,
+     dict of spawner counts by SPAWNER_VARIANTS name (missing -> DEFAULT_SPAWNS), seed, tile size) -> (Tilemap)
+    '''
+    spawns = dict(DEFAULT_SPAWNS, **(spawns or {}))
+    for name in REQUIRED:
+        if spawns[name] < 1:
+            raise ValueError('a map needs at least one of ' + name)
+    rng = random.Random(seed)
+    solid, surface = terrain(rng, width, height, density)
+
+    tilemap = Tilemap(None, tile_size=tile_size)
+    for x, y in sorted(solid):
+        # grass on top of the ground, stone for the platforms
+        tile_type = 'grass' if y >= surface[x] else 'stone'
+        tilemap.tilemap[str(x) + ';' + str(y)] = {'type': tile_type, 'variant': 8, 'pos': [x, y]}
+    tilemap.autotile()
+
+    # somewhere to stand: an empty cell right above a solid one
+    spots = sorted((x, y - 1) for x, y in solid if y > 0 and (x, y - 1) not in solid)
+    start = [spot for spot in spots if spot[0] < max(3, width // 10)] or spots
+    player = rng.choice(start)
+    spots.remove(player)
+    tilemap.tilemap[str(player[0]) + ';' + str(player[1])] = {'type': 'spawners', 'variant': 0, 'pos': list(player)}
+
+    for name in ['cats', 'traps', 'catnip', 'buttons', 'turbines', 'toys']:
+        count = min(spawns[name], len(spots))
+        for spot in rng.sample(spots, count):
+            spots.remove(spot)
+            tilemap.tilemap[str(spot[0]) + ';' + str(spot[1])] = {'type': 'spawners', 'variant': SPAWNER_VARIANTS[name], 'pos': list(spot)}
+
+    # prizes hang offgrid in the air towards the far end, like the shipped maps
+    for i in range(spawns['prizes']):
+        x = rng.randrange(width * 3 // 4, width) if width > 4 else 0
+        tilemap.offgrid_tiles.append({'type': 'spawners', 'variant': 3, 'pos': [x * tile_size, (surface[x] - 10) * tile_size]})
+
+    for i in range(decor):
+        pos = [round(rng.random() * width * tile_size, 1), round(rng.random() * height * tile_size, 1)]
+        tilemap.offgrid_tiles.append({'type': rng.choice(DECOR_TYPES), 'variant': rng.randrange(VARIANTS), 'pos': pos})
+    return tilemap
+
+def parse_size(value):
+    '''
+    ('400x80') -> (400, 80)
+    '''
+    width, height = value.lower().split('x')
+    return int(width), int(height)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='deterministic stress maps in the editor / Tilemap.save format')
+    parser.add_argument('--out', default='map.json', help='map file to write, map.json is the one editor.py opens')
+    parser.add_argument('--out-dir', help='with --sizes, folder to write 0.json, 1.json ... into (play it with game.py --maps)')
+    parser.add_argument('--size', type=parse_size, default=(200, 60), help='width x height in tiles, e.g. 400x80')
+    parser.add_argument('--sizes', help='comma separated sizes, one map each, e.g. 100x40,400x80,1600x160')
+    parser.add_argument('--density', type=float, default=0.3, help='fraction of cells that are solid')
+    parser.add_argument('--decor', type=int, default=0, help='offgrid decor tiles')
+    parser.add_argument('--seed', type=int, default=0)
+    for name, count in DEFAULT_SPAWNS.items():
+        parser.add_argument('--' + name, type=int, default=count, help=f'{name} spawners ({count} by default)')
+    args = parser.parse_args()
+
+    spawns = {name: getattr(args, name) for name in DEFAULT_SPAWNS}
+    if args.sizes:
+        if not args.out_dir:
+            parser.error('--sizes needs --out-dir')
+        os.makedirs(args.out_dir, exist_ok=True)
+        jobs = [(os.path.join(args.out_dir, str(i) + '.json'), parse_size(size)) for i, size in enumerate(args.sizes.split(','))]
+    else:
+        jobs = [(args.out, args.size)]
+
+    for path, (width, height) in jobs:
+        start = time.perf_counter()
+        tilemap = generate(width, height, args.density, args.decor, spawns, args.seed)
+        tilemap.save(path)
+        print(f'{path}: {width}x{height}, {len(tilemap.tilemap)} tiles, {len(tilemap.offgrid_tiles)} offgrid, {os.path.getsize(path) / 1024:.0f} KiB in {time.perf_counter() - start:.2f}s')
@@ -1,6 +1,8 @@
 import pygame
 import math
 
+level_text = {} # (level, font size) -> rendered text
+
 class UI:
     def __init__(self, img, pos, speed):
         '''
@@ -45,5 +47,6 @@ class Levelbar:
         (surface, font size)
         '''
         self.fontsize = fontsize
-        current_level = pygame.font.SysFont('Superstar', fontsize).render(f"Level {self.level}", False, (255, 255, 255))
-        surf.blit(current_level, self.pos)
+        if (self.level, fontsize) not in level_text: # looking the font up and rendering the text every frame was a big chunk of render/ui
+            level_text[(self.level, fontsize)] = pygame.font.SysFont('Superstar', fontsize).render(f"Level {self.level}", False, (255, 255, 255))
+        surf.blit(level_text[(self.level, fontsize)], self.pos)
@@ -0,0 +1,176 @@
+import os
+import json
+import mmap
+import atexit
+import struct
+import hashlib
+import threading
+
+import pygame
+
+CACHE_PATH = 'data/cache/'
+INDEX = 'index.json'
+VERSION = 1
+
+# entry files start with a small header so a truncated or foreign file is never mistaken for pixels
+IMAGE_HEADER = struct.Struct('<4sII') # magic, width, height, then width * height * 4 bytes of RGBA
+SOUND_HEADER = struct.Struct('<4sI') # magic, byte count, then raw samples in the mixer's format
+IMAGE_MAGIC = b'TIMG'
+SOUND_MAGIC = b'TSND'
+
+def file_hash(path):
+    '''
+    (file path) -> (hex sha1 of its contents)
+    '''
+    f = open(path, 'rb')
+    digest = hashlib.sha1(f.read()).hexdigest()
+    f.close()
+    return digest
+
+def to_rgba(img):
+    '''
+    turns whatever pygame.image.load gave back into plain 32 bit RGBA, colorkeyed / palette pixels become alpha 0
+    (Surface) -> (Surface)
+    '''
+    if img.get_flags() & pygame.SRCALPHA and img.get_bitsize() == 32 and img.get_colorkey() is None:
+        return img
+    rgba = pygame.Surface(img.get_size(), pygame.SRCALPHA, 32)
+    rgba.blit(img, (0, 0))
+    return rgba
+
+class AssetCache:
+    def __init__(self, path=CACHE_PATH):
+        '''
+        on disk cache of decoded images and sounds, keyed by the sha1 of the source file
+        (cache folder)
+        '''
+        self.path = path
+        self.entries = {} # source path -> [size, mtime_ns, sha1], lets unchanged files skip re-hashing
+        self.dirty = False
+        self.lock = threading.Lock() # the parallel loader decodes from several threads
+        try:
+            f = open(os.path.join(path, INDEX), 'r')
+            index = json.load(f)
+            f.close()
+            if index.get('version') == VERSION and index.get('pygame') == pygame.version.ver:
+                self.entries = index['entries']
+        except (FileNotFoundError, ValueError):
+            pass
+
+    def key(self, source):
+        '''
+        (source file path) -> (sha1 of the source, only re-hashed when its size or mtime changed)
+        '''
+        stat = os.stat(source)
+        entry = self.entries.get(source)
+        if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            return entry[2]
+        digest = file_hash(source)
+        with self.lock:
+            self.entries[source] = [stat.st_size, stat.st_mtime_ns, digest]
+            self.mark_dirty()
+        return digest
+
+    def mark_dirty(self):
+        if not self.dirty:
+            self.dirty = True
+            atexit.register(self.flush)
+
+    def flush(self):
+        '''
+        writes the index if anything new went into the cache
+        '''
+        if not self.dirty:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        with self.lock:
+            f = open(os.path.join(self.path, INDEX), 'w')
+            json.dump({'version': VERSION, 'pygame': pygame.version.ver, 'entries': self.entries}, f)
+            f.close()
+            self.dirty = False
+
+    def write(self, name, data):
+        '''
+        writes through a temp file so a crash can't leave a half written entry behind
+        '''
+        os.makedirs(self.path, exist_ok=True)
+        tmp = os.path.join(self.path, name + '.' + str(threading.get_ident()) + '.tmp') # identical files share an entry, so two threads can write the same one
+        f = open(tmp, 'wb')
+        f.write(data)
+        f.close()
+        os.replace(tmp, os.path.join(self.path, name))
+
+    def read(self, name):
+        '''
+        (entry file name) -> (read only mmap of it, or None)
+        '''
+        try:
+            f = open(os.path.join(self.path, name), 'rb')
+        except FileNotFoundError:
+            return None
+        try:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: # empty file
+            return None
+        finally:
+            f.close()
+
+    def load_image(self, source):
+        '''
+        decoded pixels for an image file, straight out of the cache when the source hasn't changed
+        (image file path) -> (32 bit RGBA Surface, not converted to the display format yet)
+        '''
+        name = self.key(source) + '.img'
+        data = self.read(name)
+        if data is not None:
+            magic, w, h = IMAGE_HEADER.unpack_from(data, 0)
+            if magic == IMAGE_MAGIC and len(data) == IMAGE_HEADER.size + w * h * 4:
+                # frombuffer shares the mapped pages, copy() makes a surface that outlives the mapping
+                view = memoryview(data)[IMAGE_HEADER.size:]
+                img = pygame.image.frombuffer(view, (w, h), 'RGBA').copy()
+                view.release()
+                data.close()
+                return img
+            data.close()
+
+        img = to_rgba(pygame.image.load(source))
+        self.write(name, IMAGE_HEADER.pack(IMAGE_MAGIC, img.get_width(), img.get_height()) + pygame.image.tobytes(img, 'RGBA'))
+        return img
+
+    def load_sound(self, source):
+        '''
+        pre decoded samples for a sound file, mp3 / wav decoding only happens the first time
+        (sound file path) -> (pygame.mixer.Sound)
+        '''
+        # raw samples only make sense for the mixer format they were decoded for
+        mixer = pygame.mixer.get_init()
+        name = self.key(source) + '_' + '_'.join(str(v) for v in mixer) + '.pcm'
+        data = self.read(name)
+        if data is not None:
+            magic, size = SOUND_HEADER.unpack_from(data, 0)
+            if magic == SOUND_MAGIC and len(data) == SOUND_HEADER.size + size:
+                view = memoryview(data)[SOUND_HEADER.size:]
+                sound = pygame.mixer.Sound(buffer=view) # the mixer keeps its own copy of the samples
+                view.release()
+                data.close()
+                return sound
+            data.close()
+
+        sound = pygame.mixer.Sound(source)
+        raw = sound.get_raw()
+        self.write(name, SOUND_HEADER.pack(SOUND_MAGIC, len(raw)) + raw)
+        return sound
+
+cache = None
+cache_lock = threading.Lock() # the first use can come from several loader threads at once
+
+def get_cache():
+    '''
+    -> (the shared AssetCache, made on first use)
+    '''
+    global cache
+    if cache is None:
+        with cache_lock:
+            if cache is None: # another thread may have made it while this one waited, its entries have to be the ones flushed
+                cache = AssetCache()
+    return cache
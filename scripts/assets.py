@@ -0,0 +1,134 @@
+from collections import OrderedDict, deque
+
+import pygame
+
+from scripts.utils import Animation
+
+def asset_size(asset):
+    '''
+    rough resident size of an asset, subsurfaces share their sheet's pixels so they count as nothing
+    (Surface, Animation or list of them) -> (bytes)
+    '''
+    if isinstance(asset, pygame.Surface):
+        if asset.get_parent() is not None:
+            return 0
+        return asset.get_width() * asset.get_height() * asset.get_bytesize()
+    if isinstance(asset, Animation):
+        return asset_size(asset.images)
+    if isinstance(asset, (list, tuple)):
+        return sum(asset_size(item) for item in asset)
+    return 0
+
+class AssetManager:
+    def __init__(self, budget=4 * 1024 * 1024):
+        '''
+        drop in for the old assets dict, every asset is loaded the first time it's asked for,
+        pinned ones stay for good and the rest are evicted least recently used first once they go over the budget
+        (bytes the unpinned assets may keep resident)
+        '''
+        self.budget = budget
+        self.loaders = {} # key -> function that loads it
+        self.pinned = set()
+        self.loaded = OrderedDict() # key -> asset, least recently used first
+        self.sizes = {}
+        self.resident = 0 # bytes held by unpinned assets
+        self.queue = deque() # keys waiting to be prefetched
+        self.stats = {'loads': 0, 'hits': 0, 'evictions': 0}
+
+    def add(self, key, loader, pin=False):
+        '''
+        registers an asset without loading it
+        (key, function returning the asset, never evict it)
+        '''
+        self.loaders[key] = loader
+        if pin:
+            self.pinned.add(key)
+
+    def __getitem__(self, key):
+        if key in self.loaded:
+            self.stats['hits'] += 1
+            if key not in self.pinned:
+                self.loaded.move_to_end(key)
+            return self.loaded[key]
+        return self.load(key)
+
+    def __contains__(self, key):
+        return key in self.loaders
+
+    def __iter__(self):
+        return iter(self.loaders)
+
+    def __len__(self):
+        return len(self.loaders)
+
+    def keys(self):
+        return self.loaders.keys()
+
+    def load_pinned(self):
+        '''
+        loads every pinned asset that hasn't been asked for yet, so gameplay never loads mid frame
+        '''
+        for key in self.loaders:
+            if key in self.pinned and key not in self.loaded:
+                self.load(key)
+
+    def load(self, key):
+        '''
+        (key) -> (the asset, loaded now)
+        '''
+        asset = self.loaders[key]()
+        self.stats['loads'] += 1
+        self.loaded[key] = asset
+        if key not in self.pinned:
+            self.sizes[key] = asset_size(asset)
+            self.resident += self.sizes[key]
+            self.evict(keep=key)
+        return asset
+
+    def evict(self, keep=None):
+        '''
+        drops least recently used unpinned assets until they fit in the budget again
+        (key that must stay, the one just loaded)
+        '''
+        for key in list(self.loaded):
+            if self.resident <= self.budget:
+                break
+            if key in self.pinned or key == keep:
+                continue
+            self.release(key)
+            self.stats['evictions'] += 1
+
+    def release(self, *keys):
+        '''
+        forgets unpinned assets now, e.g. a scene that won't come back, they load again if asked for
+        '''
+        for key in keys:
+            if key in self.loaded and key not in self.pinned:
+                del self.loaded[key]
+                self.resident -= self.sizes.pop(key)
+
+    def prefetch(self, *keys):
+        '''
+        queues assets the next scene will want, pump() loads them a few at a time
+        '''
+        for key in keys:
+            if key not in self.loaded and key not in self.queue:
+                self.queue.append(key)
+
+    def pump(self, count=1):
+        '''
+        loads up to count queued assets, called once per frame so prefetching never stalls a whole frame
+        '''
+        while self.queue and count > 0:
+            key = self.queue.popleft()
+            if key not in self.loaded:
+                self.load(key)
+                count -= 1
+
+    def report(self):
+        '''
+        -> (dict of what's resident and how the cache has done)
+        '''
+        pinned = sum(asset_size(self.loaded[key]) for key in self.loaded if key in self.pinned)
+        return dict(self.stats, resident_kib=round(self.resident / 1024, 1), pinned_kib=round(pinned / 1024, 1),
+                    loaded=len(self.loaded), registered=len(self.loaders))
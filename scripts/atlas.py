@@ -0,0 +1,213 @@
+import os
+import sys
+import json
+import time
+
+import pygame
+
+from scripts.assetcache import get_cache, to_rgba
+from scripts import loader
+from scripts.surfaces import BLACK, ALPHA, classify, prepare
+
+IMG_PATH = 'data/images/'
+ATLAS_PATH = 'data/atlas/'
+MANIFEST = 'manifest.json'
+VERSION = 2
+
+# small, frequently drawn images go in the sheets, the full screen story / end scene pictures stay loose
+ATLAS_DIRS = ['tiles', 'entities', 'particles', 'UI', 'clouds']
+SHEET_SIZE = 1024
+PADDING = 1
+# images only share a sheet with ones that can take the same surface format (see page_group)
+SOFT = 'soft' # partly transparent pixels, the sheet stays per pixel alpha
+HARD = 'hard' # every pixel fully there or gone and none of the visible ones black, one colorkeyed copy whatever colorkey is asked for
+HARD_BLACK = 'hard_black' # the same but drawing black pixels, one colorkeyed copy per colorkey asked for
+
+def source_images(src=IMG_PATH, dirs=ATLAS_DIRS):
+    '''
+    every png under the atlas directories
+    (image root, directories to include) -> (sorted list of paths relative to the image root)
+    '''
+    paths = []
+    for folder in dirs:
+        for root, subdirs, files in os.walk(os.path.join(src, folder)):
+            for name in files:
+                if name.endswith('.png'):
+                    paths.append(os.path.relpath(os.path.join(root, name), src).replace('\\', '/'))
+    return sorted(paths)
+
+def pack(sizes, sheet_size=SHEET_SIZE, padding=PADDING):
+    '''
+    shelf packer, tallest images first, a new sheet when one fills up
+    (dict of {path: (w, h)}, sheet width and height, gap between images) -> (dict of {path: (sheet, x, y)}, number of sheets)
+    '''
+    placed = {}
+    sheet = 0
+    x = y = shelf_height = 0
+    for path in sorted(sizes, key=lambda p: (-sizes[p][1], -sizes[p][0], p)):
+        w, h = sizes[path]
+        if w > sheet_size or h > sheet_size:
+            raise ValueError(path + ' is bigger than an atlas sheet')
+        if x + w > sheet_size: # next shelf
+            x = 0
+            y += shelf_height + padding
+            shelf_height = 0
+        if y + h > sheet_size: # next sheet
+            sheet += 1
+            x = y = shelf_height = 0
+        placed[path] = (sheet, x, y)
+        x += w + padding
+        shelf_height = max(shelf_height, h)
+    return placed, sheet + 1
+
+def page_group(img):
+    '''
+    (32 bit RGBA Surface) -> (SOFT, HARD or HARD_BLACK)
+    '''
+    if classify(img)[0] == ALPHA:
+        return SOFT
+    visible = pygame.mask.from_surface(img, 0)
+    if pygame.mask.from_threshold(img, BLACK + (128,), (1, 1, 1, 255)).overlap_area(visible, (0, 0)):
+        return HARD_BLACK
+    return HARD
+
+def build_atlas(src=IMG_PATH, out=ATLAS_PATH, dirs=ATLAS_DIRS, sheet_size=SHEET_SIZE):
+    '''
+    packs the sprite images into a few sheets and writes a manifest of where each one ended up,
+    images with soft edges and hard edged ones go on separate sheets so the hard ones can skip per pixel alpha
+    (image root, output folder, directories to pack, sheet size) -> (manifest dict)
+    '''
+    images = {}
+    for path in source_images(src, dirs):
+        images[path] = to_rgba(pygame.image.load(os.path.join(src, path)))
+    placed = {}
+    groups = []
+    for group in [SOFT, HARD, HARD_BLACK]:
+        sizes = {path: img.get_size() for path, img in images.items() if page_group(img) == group}
+        if not sizes:
+            continue
+        group_placed, count = pack(sizes, sheet_size)
+        for path, (sheet, x, y) in group_placed.items():
+            placed[path] = (len(groups) + sheet, x, y)
+        groups += [group] * count
+
+    sheets = [pygame.Surface((sheet_size, sheet_size), pygame.SRCALPHA, 32) for group in groups]
+    for path, (sheet, x, y) in placed.items():
+        sheets[sheet].blit(images[path], (x, y), special_flags=pygame.BLEND_RGBA_MAX) # copy alpha as is instead of blending onto the empty sheet
+
+    os.makedirs(out, exist_ok=True)
+    names = []
+    for i, sheet in enumerate(sheets):
+        # crop the unused bottom of the sheet
+        used = max([y + images[p].get_height() for p, (s, x, y) in placed.items() if s == i] or [1])
+        names.append('sheet_' + str(i) + '.png')
+        pygame.image.save(sheet.subsurface((0, 0, sheet_size, used)), os.path.join(out, names[-1]))
+
+    listing = {}
+    for path in placed:
+        folder, name = path.rsplit('/', 1)
+        listing.setdefault(folder, []).append(name)
+
+    manifest = {
+        'version': VERSION,
+        'built': time.time(),
+        'sheets': names,
+        'groups': groups,
+        'images': {path: [sheet, x, y] + list(images[path].get_size()) for path, (sheet, x, y) in sorted(placed.items())},
+        'dirs': {folder: sorted(names) for folder, names in sorted(listing.items())},
+    }
+    f = open(os.path.join(out, MANIFEST), 'w')
+    json.dump(manifest, f, indent=1)
+    f.close()
+    return manifest
+
+class Atlas:
+    def __init__(self, manifest, path=ATLAS_PATH):
+        '''
+        hands out subsurfaces of the packed sheets
+        (manifest dict, atlas folder)
+        '''
+        self.manifest = manifest
+        self.path = path
+        self.images = manifest['images']
+        self.dirs = manifest['dirs']
+        self.groups = manifest['groups']
+        self.sheets = {} # (sheet, colorkey or ALPHA) -> converted sheet
+
+    @classmethod
+    def load(cls, path=ATLAS_PATH, src=IMG_PATH):
+        '''
+        loads the manifest, None when there is no atlas or a source image changed after it was built
+        (atlas folder, image root) -> (Atlas or None)
+        '''
+        try:
+            f = open(os.path.join(path, MANIFEST), 'r')
+        except FileNotFoundError:
+            return None
+        manifest = json.load(f)
+        f.close()
+        if manifest.get('version') != VERSION:
+            return None
+        for source in list(manifest['images']) + list(manifest['dirs']): # a folder's mtime changes when files are added / removed
+            try:
+                if os.path.getmtime(os.path.join(src, source)) > manifest['built']:
+                    print('atlas is out of date, loading loose images (rebuild with python -m scripts.atlas)', file=sys.stderr)
+                    return None
+            except FileNotFoundError:
+                return None
+        return cls(manifest, path)
+
+    def sheet_path(self, sheet):
+        return os.path.join(self.path, self.manifest['sheets'][sheet]).replace('\\', '/')
+
+    def has(self, path):
+        return path in self.images
+
+    def page(self, sheet, colorkey):
+        '''
+        (sheet number, transparent colour (None -> only alpha)) -> (the sheet converted for it, subsurfaces share its format)
+        '''
+        group = self.groups[sheet]
+        if group == SOFT:
+            key = ALPHA # each image on it decides on its own colorkey
+        elif group == HARD:
+            key = BLACK # no visible black pixels, keying black out changes nothing
+        else:
+            key = colorkey
+        if (sheet, key) not in self.sheets:
+            sheet_path = self.sheet_path(sheet)
+            start = time.perf_counter()
+            decoded = loader.take(sheet_path) or get_cache().load_image(sheet_path)
+            if group == SOFT:
+                surf, kind = decoded.convert_alpha(), ALPHA
+            else: # flattened onto a colorkey, subsurfaces can't be RLE encoded
+                surf, kind = prepare(decoded, key, rle=False)
+            loader.converted(sheet_path, time.perf_counter() - start, kind)
+            self.sheets[(sheet, key)] = surf
+        return self.sheets[(sheet, key)]
+
+    def image(self, path, colorkey=BLACK):
+        '''
+        (image path relative to data/images, transparent colour (None -> only alpha)) -> (subsurface of its sheet)
+        '''
+        sheet, x, y, w, h = self.images[path]
+        page = self.page(sheet, colorkey)
+        img = page.subsurface((x, y, w, h))
+        if page.get_flags() & pygame.SRCALPHA:
+            if colorkey is not None:
+                img.set_colorkey(colorkey)
+        elif page.get_colorkey() is not None:
+            img.set_colorkey(page.get_colorkey())
+        return img
+
+    def listing(self, folder):
+        '''
+        (folder relative to data/images) -> (sorted file names the atlas has for it, or None)
+        '''
+        return self.dirs.get(folder)
+
+
+if __name__ == '__main__':
+    start = time.perf_counter()
+    manifest = build_atlas()
+    print(f"packed {len(manifest['images'])} images into {len(manifest['sheets'])} sheet(s) in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,94 @@
+import pygame
+
+from scripts.utils import load_sound
+
+class Voice:
+    '''
+    one sound playing on one mixer channel
+    '''
+    def __init__(self, name, channel, sound, priority, tick):
+        self.name = name
+        self.channel = channel
+        self.sound = sound
+        self.priority = priority
+        self.tick = tick
+
+    def playing(self):
+        return self.channel.get_busy() and self.channel.get_sound() is self.sound
+
+class AudioManager:
+    def __init__(self, table, channels=16):
+        '''
+        plays sound effects through a fixed set of mixer channels, with per sound cooldowns and voice limits
+        (dict of {name: (file under data/sfx, volume, priority, cooldown in steps, max voices)}, mixer channels to use)
+        '''
+        pygame.mixer.set_num_channels(channels)
+        self.channel_count = pygame.mixer.get_num_channels()
+        self.channels = [pygame.mixer.Channel(i) for i in range(self.channel_count)]
+        self.sounds = {}
+        self.settings = {} # name -> (priority, cooldown, max voices)
+        for name, (path, volume, priority, cooldown, voices) in table.items():
+            self.sounds[name] = load_sound(path)
+            self.sounds[name].set_volume(volume)
+            self.settings[name] = (priority, cooldown, voices)
+        self.voices = [] # what we started and may still be playing
+        self.last_played = {} # name -> step it last started on
+        self.tick = 0
+        self.stats = {'played': 0, 'cooldown': 0, 'voice_limit': 0, 'no_channel': 0, 'stolen': 0}
+
+    def update(self, tick):
+        '''
+        called once per simulation step, cooldowns count in steps so they don't depend on the frame rate
+        '''
+        self.tick = tick
+        self.voices = [voice for voice in self.voices if voice.playing()]
+
+    def play(self, name):
+        '''
+        starts a sound unless it's cooling down or at its voice limit, steals the oldest lower priority
+        voice when every channel is busy
+        (sound name) -> (bool, did it start)
+        '''
+        priority, cooldown, max_voices = self.settings[name]
+        last = self.last_played.get(name)
+        if last is not None and self.tick - last < cooldown:
+            self.stats['cooldown'] += 1
+            return False
+
+        playing = [voice for voice in self.voices if voice.playing()]
+        if sum(1 for voice in playing if voice.name == name) >= max_voices:
+            self.stats['voice_limit'] += 1
+            return False
+
+        busy = {voice.channel for voice in playing}
+        channel = None
+        for candidate in self.channels:
+            if candidate not in busy and not candidate.get_busy():
+                channel = candidate
+                break
+        if channel is None:
+            victims = [voice for voice in playing if voice.priority < priority]
+            if not victims:
+                self.stats['no_channel'] += 1
+                return False
+            victim = min(victims, key=lambda voice: (voice.priority, voice.tick))
+            victim.channel.stop()
+            playing.remove(victim)
+            channel = victim.channel
+            self.stats['stolen'] += 1
+
+        channel.play(self.sounds[name])
+        playing.append(Voice(name, channel, self.sounds[name], priority, self.tick))
+        self.voices = playing
+        self.last_played[name] = self.tick
+        self.stats['played'] += 1
+        return True
+
+    def stop(self):
+        '''
+        silences everything and forgets the cooldowns, also used when the simulation jumps back in time
+        '''
+        for voice in self.voices:
+            voice.channel.stop()
+        self.voices = []
+        self.last_played = {}
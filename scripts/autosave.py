@@ -0,0 +1,189 @@
+import os
+import sys
+import json
+import time
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+from scripts.tilemap import write_map
+from scripts.streaming import chunk_of, CHUNK_SIZE
+
+INTERVAL = 30 # seconds after the first unsaved change
+BACKUPS = 3 # map.json.1 (newest) ... map.json.3, rotated by saves the user asks for, not by timed ones
+AUTOSAVE_DIR = '.autosave' # next to the map, map.json.autosave/, chunks saved since the last full save
+OFFGRID_FILE = 'offgrid.json'
+
+def write_json(path, data):
+    '''
+    (file path, json-able value), through a temporary file like write_map
+    '''
+    f = open(path + '.tmp', 'w')
+    json.dump(data, f)
+    f.flush()
+    os.fsync(f.fileno())
+    f.close()
+    os.replace(path + '.tmp', path)
+
+def rotate(path, backups):
+    '''
+    keeps the map as it was before this save as path.1, moving the older copies up one, the oldest drops off
+    '''
+    if not backups or not os.path.exists(path):
+        return
+    for i in range(backups - 1, 0, -1):
+        if os.path.exists(path + '.' + str(i)):
+            os.replace(path + '.' + str(i), path + '.' + str(i + 1))
+    shutil.copyfile(path, path + '.1')
+
+def save_full(path, snapshot, backups):
+    '''
+    runs on the autosave thread
+    (map file, (tiles, tile size, offgrid) from Autosave.snapshot, backups to keep)
+    '''
+    tiles, tile_size, offgrid = snapshot
+    rotate(path, backups)
+    write_map(path, tiles, tile_size, offgrid)
+    # everything in the chunk files is in the map now, later chunk saves are queued after this one
+    shutil.rmtree(path + AUTOSAVE_DIR, ignore_errors=True)
+
+def save_chunks(path, chunks, offgrid):
+    '''
+    runs on the autosave thread, only the chunks that changed
+    (map file, dict of chunk key -> that chunk's tiles, offgrid tiles or None if they didn't change)
+    '''
+    folder = path + AUTOSAVE_DIR
+    os.makedirs(folder, exist_ok=True)
+    for key, tiles in chunks.items():
+        write_json(os.path.join(folder, str(key[0]) + '_' + str(key[1]) + '.json'), {'chunk': key, 'tilemap': tiles})
+    if offgrid is not None:
+        write_json(os.path.join(folder, OFFGRID_FILE), {'offgrid': offgrid})
+
+def recover(tilemap, path):
+    '''
+    puts chunks autosaved after the last full save back on top of the map loaded from path
+    (Tilemap, map file) -> (number of files applied)
+    '''
+    folder = path + AUTOSAVE_DIR
+    if not os.path.isdir(folder):
+        return 0
+    names = [name for name in sorted(os.listdir(folder)) if name.endswith('.json')]
+    for name in names:
+        f = open(os.path.join(folder, name), 'r')
+        data = json.load(f)
+        f.close()
+        if name == OFFGRID_FILE:
+            tilemap.offgrid_tiles = data['offgrid']
+            continue
+        cx, cy = data['chunk']
+        for x in range(cx * CHUNK_SIZE, (cx + 1) * CHUNK_SIZE): # the file holds the whole chunk, tiles not in it were erased
+            for y in range(cy * CHUNK_SIZE, (cy + 1) * CHUNK_SIZE):
+                tilemap.tilemap.pop(str(x) + ';' + str(y), None)
+        tilemap.tilemap.update(data['tilemap'])
+    return len(names)
+
+class Autosave:
+    '''
+    saves the map being edited without stopping the editor
+
+    the main thread only takes a snapshot (a shallow copy, the editor never changes a tile dict once it's in the map,
+    see EditLog), the json is written on a background thread through a temporary file and renamed into place
+    so a crash never leaves half a map, the maps before the last few saves asked for (O) are kept as rolling backups,
+    timed saves only rotate them the first time in a session (so the map as it was opened is always kept)
+    and a long session can't push every older version out
+    '''
+    pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='autosave')
+
+    def __init__(self, tilemap, path, interval=INTERVAL, backups=BACKUPS, chunked=False):
+        '''
+        (Tilemap, map file, seconds after a change to save (0 -> only save when asked), backups to keep,
+         autosave just the changed chunks into path.autosave/ instead of the whole map, for big maps)
+        '''
+        self.tilemap = tilemap
+        self.path = path
+        self.interval = interval
+        self.backups = backups
+        self.chunked = chunked
+        self.changed_at = None # time of the first change that isn't saved, None -> nothing to save
+        self.chunks = set() # chunk keys changed since the last chunk save
+        self.offgrid_changed = False
+        self.future = None # the last save handed to the thread
+        self.failed = False # the last save raised, the changed chunks it had are gone so the next one saves everything
+        self.rotated = False # a full save this session has kept the map as it was opened as path.1
+        self.stats = {'full': 0, 'chunked': 0, 'chunks': 0, 'snapshot_ms': 0}
+
+    def note(self, cells, offgrid):
+        '''
+        (dict of changed (x, y) -> anything, list of offgrid tiles added or removed), from EditLog.take_dirty
+        '''
+        if not cells and not offgrid:
+            return
+        if self.changed_at is None:
+            self.changed_at = time.perf_counter()
+        for x, y in cells:
+            self.chunks.add(chunk_of(x, y))
+        if offgrid:
+            self.offgrid_changed = True
+
+    def busy(self):
+        return self.future is not None and not self.future.done()
+
+    def update(self):
+        '''
+        called once a frame, saves once interval seconds have gone by since the first unsaved change,
+        unless the last save is still being written
+        '''
+        if self.future is not None and self.future.done() and self.future.exception():
+            print('autosave failed:', self.future.exception(), file=sys.stderr) # the file is still as it was, try again with the whole map
+            self.future = None
+            self.changed_at = self.changed_at or time.perf_counter()
+            self.failed = True
+        if self.interval and self.changed_at is not None and time.perf_counter() - self.changed_at >= self.interval and not self.busy():
+            self.save(full=self.failed or not self.chunked, backup=False)
+
+    def snapshot(self):
+        return dict(self.tilemap.tilemap), self.tilemap.tile_size, list(self.tilemap.offgrid_tiles)
+
+    def save(self, full=True, backup=True):
+        '''
+        queues a save, returns straight away
+        (the whole map (True) or only the chunks changed since the last save, rotate the backups first)
+        '''
+        start = time.perf_counter()
+        if full:
+            backup = backup or not self.rotated
+            self.future = self.pool.submit(save_full, self.path, self.snapshot(), self.backups if backup else 0)
+            self.rotated = self.rotated or backup
+            self.stats['full'] += 1
+        else:
+            chunks = {}
+            for cx, cy in self.chunks:
+                tiles = {}
+                for x in range(cx * CHUNK_SIZE, (cx + 1) * CHUNK_SIZE):
+                    for y in range(cy * CHUNK_SIZE, (cy + 1) * CHUNK_SIZE):
+                        loc = str(x) + ';' + str(y)
+                        if loc in self.tilemap.tilemap:
+                            tiles[loc] = self.tilemap.tilemap[loc]
+                chunks[(cx, cy)] = tiles
+            offgrid = list(self.tilemap.offgrid_tiles) if self.offgrid_changed else None
+            self.future = self.pool.submit(save_chunks, self.path, chunks, offgrid)
+            self.stats['chunked'] += 1
+            self.stats['chunks'] += len(chunks)
+        self.chunks = set()
+        self.offgrid_changed = False
+        self.changed_at = None
+        self.failed = False
+        self.stats['snapshot_ms'] = round((time.perf_counter() - start) * 1000, 3)
+
+    def wait(self):
+        '''
+        blocks until everything queued is on disk, before quitting
+        -> (bool, false if the last save failed, the error is printed and the map file is as it was before it)
+        '''
+        if self.future is None:
+            return True
+        try:
+            self.future.result()
+        except Exception as error:
+            print('save failed:', error, file=sys.stderr)
+            return False
+        return True
@@ -0,0 +1,269 @@
+from array import array
+
+EMPTY = -1 # cell code for no tile
+
+class EditLog:
+    '''
+    undo / redo history for a Tilemap being edited, one transaction per stroke
+
+    a transaction only keeps the cells whose tile actually changed, packed four ints per cell
+    (x, y, code before, code after) with code = type index * 256 + variant, so memory grows with
+    the number of changed cells and not with the size of the map
+    '''
+    def __init__(self, tilemap):
+        self.tilemap = tilemap
+        self.types = [] # tile type names, index -> name, codes use the index
+        self.undo_stack = []
+        self.redo_stack = []
+        self.open = None # (dict of location -> (x, y, code before), list of offgrid ops) while a stroke is going
+        self.dirty = {} # (x, y) -> (type, variant) or None the cell held before, for whatever redraws the map
+        self.dirty_offgrid = [] # offgrid tiles added or removed
+
+    def code(self, tile):
+        '''
+        (tile dict or None) -> (int)
+        '''
+        if tile is None:
+            return EMPTY
+        if tile['type'] not in self.types:
+            self.types.append(tile['type'])
+        return self.types.index(tile['type']) * 256 + tile['variant']
+
+    def tile(self, code, x, y):
+        '''
+        (int from code(), tile position) -> (fresh tile dict or None)
+        '''
+        if code == EMPTY:
+            return None
+        return {'type': self.types[code // 256], 'variant': code % 256, 'pos': [x, y]}
+
+    def mark(self, x, y, tile):
+        '''
+        notes a cell as changed for take_dirty, with the tile it held before the first change
+        '''
+        if (x, y) not in self.dirty:
+            self.dirty[(x, y)] = None if tile is None else (tile['type'], tile['variant'])
+
+    def take_dirty(self):
+        '''
+        -> (dict of (x, y) -> (type, variant) or None the cell held before, list of offgrid tiles added or removed), everything changed since the last call
+        '''
+        dirty, offgrid = self.dirty, self.dirty_offgrid
+        self.dirty = {}
+        self.dirty_offgrid = []
+        return dirty, offgrid
+
+    def begin(self):
+        '''
+        starts a transaction, does nothing if one is already open so overlapping strokes (both buttons) become one,
+        every change calls it too, so a change after undo / redo / autotile closed the stroke mid drag starts a new one
+        '''
+        if self.open is None:
+            self.open = ({}, [])
+
+    def touch(self, x, y):
+        '''
+        remembers a cell as it was before the transaction changed it, only the first touch counts
+        '''
+        self.begin()
+        loc = str(x) + ';' + str(y)
+        if loc not in self.open[0]:
+            self.open[0][loc] = (x, y, self.code(self.tilemap.tilemap.get(loc)))
+        return loc
+
+    def set(self, x, y, tile_type, variant):
+        '''
+        paints one cell inside the open transaction, skips cells that already hold that tile
+        (tile x, tile y, tile type, variant) -> (bool, changed anything)
+        '''
+        loc = str(x) + ';' + str(y)
+        current = self.tilemap.tilemap.get(loc)
+        if current is not None and current['type'] == tile_type and current['variant'] == variant:
+            return False
+        self.touch(x, y)
+        self.mark(x, y, current)
+        self.tilemap.tilemap[loc] = {'type': tile_type, 'variant': variant, 'pos': [x, y]}
+        return True
+
+    def erase(self, x, y):
+        '''
+        (tile x, tile y) -> (bool, removed a tile)
+        '''
+        loc = str(x) + ';' + str(y)
+        if loc not in self.tilemap.tilemap:
+            return False
+        self.touch(x, y)
+        self.mark(x, y, self.tilemap.tilemap.pop(loc))
+        return True
+
+    def fill(self, cells, tile_type, variant):
+        '''
+        paints many cells in one go inside the open transaction
+        (list of (x, y), tile type, variant) -> (list of (x, y) that changed)
+        '''
+        self.begin()
+        tilemap = self.tilemap.tilemap
+        changed = []
+        for x, y in cells:
+            loc = str(x) + ';' + str(y)
+            current = tilemap.get(loc)
+            if current is not None and current['type'] == tile_type and current['variant'] == variant:
+                continue
+            if loc not in self.open[0]:
+                self.open[0][loc] = (x, y, self.code(current))
+            self.mark(x, y, current)
+            tilemap[loc] = {'type': tile_type, 'variant': variant, 'pos': [x, y]}
+            changed.append((x, y))
+        return changed
+
+    def erase_cells(self, cells):
+        '''
+        (list of (x, y)) -> (list of (x, y) that had a tile)
+        '''
+        return [cell for cell in cells if self.erase(cell[0], cell[1])]
+
+    def autotile(self, cells=None):
+        '''
+        autotiles inside the open transaction, just around the cells given or the whole map
+        (list of (x, y) cells that changed, None -> everything)
+        '''
+        self.begin()
+        locs = self.tilemap.tilemap if cells is None else self.tilemap.autotile_locs(cells)
+        touched = self.open[0]
+        fresh = {}
+        for loc, tile in locs.items():
+            if loc not in touched:
+                touched[loc] = (tile['pos'][0], tile['pos'][1], self.code(tile))
+            self.mark(tile['pos'][0], tile['pos'][1], tile)
+            fresh[loc] = dict(tile) # autotile changes variants in place, a snapshot being saved (scripts/autosave.py) may still hold the old dict
+        self.tilemap.tilemap.update(fresh)
+        self.tilemap.autotile(fresh)
+
+    def add_offgrid(self, tile):
+        self.begin()
+        self.open[1].append(('add', len(self.tilemap.offgrid_tiles), tile))
+        self.tilemap.offgrid_tiles.append(tile)
+        self.dirty_offgrid.append(tile)
+
+    def remove_offgrid(self, tile):
+        self.begin()
+        index = self.tilemap.offgrid_tiles.index(tile)
+        self.open[1].append(('remove', index, tile))
+        del self.tilemap.offgrid_tiles[index]
+        self.dirty_offgrid.append(tile)
+
+    def commit(self):
+        '''
+        closes the open transaction, cells that ended up as they started are dropped, an empty transaction isn't kept
+        -> (list of (x, y) cells that changed)
+        '''
+        if self.open is None:
+            return []
+        touched, offgrid = self.open
+        self.open = None
+        cells = array('i')
+        changed = []
+        for loc, (x, y, before) in touched.items():
+            after = self.code(self.tilemap.tilemap.get(loc))
+            if after != before:
+                cells.extend((x, y, before, after))
+                changed.append((x, y))
+        if cells or offgrid:
+            self.undo_stack.append((cells, offgrid))
+            self.redo_stack = []
+        return changed
+
+    def apply(self, transaction, column):
+        '''
+        puts every cell of a transaction to its before (column 2) or after (column 3) state
+        -> (list of (x, y) cells that changed)
+        '''
+        cells, offgrid = transaction
+        changed = []
+        for i in range(0, len(cells), 4):
+            x, y, code = cells[i], cells[i + 1], cells[i + column]
+            loc = str(x) + ';' + str(y)
+            self.mark(x, y, self.tilemap.tilemap.get(loc))
+            tile = self.tile(code, x, y)
+            if tile is None:
+                self.tilemap.tilemap.pop(loc, None)
+            else:
+                self.tilemap.tilemap[loc] = tile
+            changed.append((x, y))
+        return changed
+
+    def undo(self):
+        '''
+        -> (list of (x, y) cells that changed, None when there's nothing to undo)
+        '''
+        self.commit()
+        if not self.undo_stack:
+            return None
+        transaction = self.undo_stack.pop()
+        for op, index, tile in reversed(transaction[1]):
+            if op == 'add':
+                del self.tilemap.offgrid_tiles[index]
+            else:
+                self.tilemap.offgrid_tiles.insert(index, tile)
+            self.dirty_offgrid.append(tile)
+        self.redo_stack.append(transaction)
+        return self.apply(transaction, 2)
+
+    def redo(self):
+        '''
+        -> (list of (x, y) cells that changed, None when there's nothing to redo)
+        '''
+        if not self.redo_stack:
+            return None
+        transaction = self.redo_stack.pop()
+        for op, index, tile in transaction[1]:
+            if op == 'add':
+                self.tilemap.offgrid_tiles.insert(index, tile)
+            else:
+                del self.tilemap.offgrid_tiles[index]
+            self.dirty_offgrid.append(tile)
+        self.undo_stack.append(transaction)
+        return self.apply(transaction, 3)
+
+    def report(self):
+        '''
+        -> (dict of transactions, cells and bytes held for undo / redo)
+        '''
+        stacks = self.undo_stack + self.redo_stack
+        return {
+            'undo': len(self.undo_stack),
+            'redo': len(self.redo_stack),
+            'cells': sum(len(cells) // 4 for cells, offgrid in stacks),
+            'bytes': sum(cells.buffer_info()[1] * cells.itemsize for cells, offgrid in stacks),
+        }
+
+
+if __name__ == '__main__':
+    # regression check: changes made while a stroke is held after undo / redo / autotile closed it (python -m scripts.editlog)
+    from scripts.tilemap import Tilemap
+
+    log = EditLog(Tilemap(None))
+    log.begin()
+    log.set(0, 0, 'grass', 1)
+    log.undo() # ctrl+z with the button still down
+    log.set(1, 0, 'grass', 1)
+    log.commit()
+    assert '0;0' not in log.tilemap.tilemap and '1;0' in log.tilemap.tilemap
+    log.undo()
+    assert not log.tilemap.tilemap
+
+    log.begin()
+    log.set(2, 0, 'stone', 0)
+    log.begin() # T mid stroke
+    log.autotile()
+    log.commit()
+    log.set(3, 0, 'stone', 0)
+    log.add_offgrid({'type': 'stone', 'variant': 0, 'pos': (1.0, 2.0)})
+    log.commit()
+    assert log.open is None and len(log.undo_stack) == 2
+    log.undo()
+    assert list(log.tilemap.tilemap) == ['2;0'] and not log.tilemap.offgrid_tiles
+    log.redo()
+    log.redo() # nothing left to redo
+    assert sorted(log.tilemap.tilemap) == ['2;0', '3;0'] and len(log.tilemap.offgrid_tiles) == 1
+    print('editlog ok')
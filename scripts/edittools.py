@@ -0,0 +1,48 @@
+from collections import deque
+
+MAX_FILL = 250000 # cells a flood fill may cover before it gives up, an open region can go on a long way
+
+def rect_cells(a, b):
+    '''
+    ((x, y) corner, (x, y) opposite corner) -> (list of every cell in the rectangle, corners included)
+    '''
+    return [(x, y) for x in range(min(a[0], b[0]), max(a[0], b[0]) + 1) for y in range(min(a[1], b[1]), max(a[1], b[1]) + 1)]
+
+def bounds(tilemap, margin=1):
+    '''
+    (Tilemap, extra tiles around it) -> (min x, min y, max x, max y of the grid tiles, None for an empty map)
+    '''
+    if not tilemap.tilemap:
+        return None
+    xs = [tile['pos'][0] for tile in tilemap.tilemap.values()]
+    ys = [tile['pos'][1] for tile in tilemap.tilemap.values()]
+    return min(xs) - margin, min(ys) - margin, max(xs) + margin, max(ys) + margin
+
+def flood_cells(tilemap, start, area=None, limit=MAX_FILL):
+    '''
+    the 4-connected region around start holding the same tile type (or nothing), variants don't matter since
+    autotiling changes them, empty space is kept inside the map's bounds plus a tile
+    (Tilemap, (x, y) cell, (min x, min y, max x, max y) or None for the map bounds, max cells) -> (list of (x, y), None if over the limit)
+    '''
+    area = area or bounds(tilemap) or (start[0], start[1], start[0], start[1])
+    x0, y0, x1, y1 = min(area[0], start[0]), min(area[1], start[1]), max(area[2], start[0]), max(area[3], start[1])
+    tiles = tilemap.tilemap
+    first = tiles.get(str(start[0]) + ';' + str(start[1]))
+    target = first['type'] if first else None
+
+    seen = {start}
+    queue = deque([start])
+    cells = []
+    while queue:
+        x, y = queue.popleft()
+        cells.append((x, y))
+        if len(cells) > limit:
+            return None
+        for nx, ny in ((x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)):
+            if (nx, ny) in seen or nx < x0 or ny < y0 or nx > x1 or ny > y1:
+                continue
+            tile = tiles.get(str(nx) + ';' + str(ny))
+            if (tile['type'] if tile else None) == target:
+                seen.add((nx, ny))
+                queue.append((nx, ny))
+    return cells
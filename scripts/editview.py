@@ -0,0 +1,121 @@
+import pygame
+
+FULL_REPAINT = 0.25 # fraction of the view that's dirty before it's cheaper to paint all of it again
+
+class MapView:
+    '''
+    the editor's cached render of a Tilemap, at display size and scaled up to the window
+
+    nothing is drawn again unless it changed: edits repaint the cells they touched (over the area of the
+    image before and after), scrolling moves the cached pixels and paints only the strips that came into view
+    '''
+    def __init__(self, tilemap, assets, size, scale=2, background=(255, 255, 255)):
+        '''
+        (Tilemap, dict of tile type -> list of images, display size, window pixels per display pixel, clear colour)
+        '''
+        self.tilemap = tilemap
+        self.assets = assets
+        self.scale = scale
+        self.background = background
+        self.surface = pygame.Surface(size)
+        self.scaled = pygame.Surface((size[0] * scale, size[1] * scale))
+        self.scroll = None # scroll the cache was painted at, None -> nothing painted yet
+        # how far (in tiles) a grid tile's image can reach right / down past its own cell
+        ts = tilemap.tile_size
+        self.reach = (max((img.get_width() - 1) // ts for images in assets.values() for img in images),
+                      max((img.get_height() - 1) // ts for images in assets.values() for img in images))
+        self.stats = {'full': 0, 'scrolls': 0, 'rects': 0}
+
+    def image_rect(self, x, y, tile):
+        '''
+        (cell, (type, variant) or None) -> (Rect the tile's image covers in world pixels)
+        '''
+        ts = self.tilemap.tile_size
+        if tile is None:
+            return pygame.Rect(x * ts, y * ts, ts, ts)
+        img = self.assets[tile[0]][tile[1]]
+        return pygame.Rect(x * ts, y * ts, max(ts, img.get_width()), max(ts, img.get_height()))
+
+    def paint(self, rect):
+        '''
+        draws one area of the display from scratch, offgrid decor then grid tiles the same as Tilemap.render,
+        but everything whose image overlaps it and not only the tiles whose cell is inside it
+        (Rect in display pixels, already clipped to the display) -> (Rect in window pixels)
+        '''
+        ts = self.tilemap.tile_size
+        sx, sy = self.scroll
+        self.surface.set_clip(rect)
+        self.surface.fill(self.background, rect)
+        blits = []
+        for tile in self.tilemap.offgrid_tiles:
+            img = self.assets[tile['type']][tile['variant']]
+            # whole world pixels so a tile lands in the same place whichever scroll painted it
+            pos = (int(tile['pos'][0]) - sx, int(tile['pos'][1]) - sy)
+            if rect.colliderect((pos, img.get_size())):
+                blits.append((img, pos))
+        for x in range((rect.left + sx) // ts - self.reach[0], (rect.right - 1 + sx) // ts + 1):
+            for y in range((rect.top + sy) // ts - self.reach[1], (rect.bottom - 1 + sy) // ts + 1):
+                loc = str(x) + ';' + str(y)
+                if loc in self.tilemap.tilemap:
+                    tile = self.tilemap.tilemap[loc]
+                    img = self.assets[tile['type']][tile['variant']]
+                    pos = (tile['pos'][0] * ts - sx, tile['pos'][1] * ts - sy)
+                    if rect.colliderect((pos, img.get_size())):
+                        blits.append((img, pos))
+        self.surface.blits(blits, doreturn=False)
+        self.surface.set_clip(None)
+
+        big = pygame.Rect(rect.x * self.scale, rect.y * self.scale, rect.w * self.scale, rect.h * self.scale)
+        self.scaled.blit(pygame.transform.scale(self.surface.subsurface(rect), big.size), big)
+        return big
+
+    def repaint(self):
+        self.surface.set_clip(None)
+        rect = self.surface.get_rect()
+        self.paint(rect)
+        self.stats['full'] += 1
+        return [self.scaled.get_rect()]
+
+    def update(self, scroll, cells, offgrid):
+        '''
+        brings the cache up to date, called once a frame
+        (camera scroll, dict of (x, y) -> (type, variant) or None the cell held before it changed, list of offgrid tiles
+         added or removed, both from EditLog.take_dirty) -> (list of Rects of the window that changed)
+        '''
+        view = self.surface.get_rect()
+        if self.scroll is None:
+            self.scroll = tuple(scroll)
+            return self.repaint()
+
+        dx, dy = scroll[0] - self.scroll[0], scroll[1] - self.scroll[1]
+        self.scroll = tuple(scroll)
+        if abs(dx) >= view.w or abs(dy) >= view.h:
+            return self.repaint()
+
+        rects = []
+        if dx or dy: # move what's already drawn, then fill in the uncovered strips
+            self.surface.scroll(-dx, -dy)
+            self.scaled.scroll(-dx * self.scale, -dy * self.scale)
+            if dx:
+                rects.append(pygame.Rect(view.w - dx, 0, dx, view.h) if dx > 0 else pygame.Rect(0, 0, -dx, view.h))
+            if dy:
+                rects.append(pygame.Rect(0, view.h - dy, view.w, dy) if dy > 0 else pygame.Rect(0, 0, view.w, -dy))
+            self.stats['scrolls'] += 1
+
+        for (x, y), before in cells.items():
+            loc = str(x) + ';' + str(y)
+            after = self.tilemap.tilemap.get(loc)
+            area = self.image_rect(x, y, before).union(self.image_rect(x, y, after and (after['type'], after['variant'])))
+            rects.append(area.move(-self.scroll[0], -self.scroll[1]))
+        for tile in offgrid:
+            img = self.assets[tile['type']][tile['variant']]
+            rects.append(pygame.Rect(int(tile['pos'][0]) - self.scroll[0], int(tile['pos'][1]) - self.scroll[1], img.get_width(), img.get_height()))
+
+        rects = [rect.clip(view) for rect in rects if rect.colliderect(view)]
+        if sum(rect.w * rect.h for rect in rects) > view.w * view.h * FULL_REPAINT:
+            return self.repaint()
+        changed = [self.paint(rect) for rect in rects]
+        self.stats['rects'] += len(rects)
+        if dx or dy:
+            return [self.scaled.get_rect()] # everything on screen moved
+        return changed
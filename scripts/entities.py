@@ -1,6 +1,5 @@
 import pygame
 import math
-import random
 
 from scripts.particle import Particle
 from scripts.spark import Spark
@@ -25,6 +24,7 @@ class PhysicsEntity:
         self.set_action('idle')
 
         self.last_movement = [0, 0]
+        self.prev_pos = None # position before the last simulation step, set by the game for things that move smoothly
 
     def rect(self):
         '''
@@ -96,11 +96,22 @@ class PhysicsEntity:
         self.animation.update() # update animation
 
 
+    def render_pos(self):
+        '''
+        position to draw at, blended between the last two simulation steps
+        -> (x, y)
+        '''
+        if self.prev_pos is None:
+            return self.pos
+        alpha = self.game.alpha
+        return (self.prev_pos[0] + (self.pos[0] - self.prev_pos[0]) * alpha, self.prev_pos[1] + (self.pos[1] - self.prev_pos[1]) * alpha)
+
     def render(self, surf, offset={0,0}):
         '''
         renders entitiy asset
         '''
-        surf.blit(pygame.transform.flip(self.animation.img(), self.flip, False), (self.pos[0] - offset[0] + self.anim_offset[0], self.pos[1] - offset[1] + self.anim_offset[1]))
+        pos = self.render_pos()
+        surf.blit(self.animation.img(self.flip), (pos[0] - offset[0] + self.anim_offset[0], pos[1] - offset[1] + self.anim_offset[1]))
 
 
 
@@ -165,10 +176,10 @@ class Player(PhysicsEntity):
         if abs(self.dashing) in (60, 50): # if at start or end of dash
             for i in range(20): # do 20 times
                 # for burst of particles
-                angle = random.random() * math.pi * 2
-                speed = random.random() * 0.5 + 0.5 # random from 0.5 to 1
+                angle = self.game.rng.random() * math.pi * 2
+                speed = self.game.rng.random() * 0.5 + 0.5 # random from 0.5 to 1
                 pvelocity = [math.cos(angle) * speed, math.sin(angle) * speed]
-                self.game.particles.append(Particle(self.game, 'particle_2', self.rect().center, velocity=pvelocity, frame=random.randint(0, 7)))
+                self.game.particles.append(Particle(self.game, 'particle_2', self.rect().center, velocity=pvelocity, frame=self.game.rng.randint(0, 7)))
         
         # dash cooldown
         if self.dashing > 0:
@@ -182,8 +193,8 @@ class Player(PhysicsEntity):
                 self.velocity[0] *= 0.1
                 self.catnip -= 1 # only happens for one frame
             # trail of particles in the middle of dash
-            pvelocity = [abs(self.dashing)/self.dashing * random.random() * 3, 0] # particles move in the direction of the dash
-            self.game.particles.append(Particle(self.game, 'particle_2', self.rect().center, velocity=pvelocity, frame=random.randint(0, 7)))
+            pvelocity = [abs(self.dashing)/self.dashing * self.game.rng.random() * 3, 0] # particles move in the direction of the dash
+            self.game.particles.append(Particle(self.game, 'particle_2', self.rect().center, velocity=pvelocity, frame=self.game.rng.randint(0, 7)))
 
         
         if abs(self.velocity[0]) < 0.1: # stops small sliding across screen after dash
@@ -204,9 +215,9 @@ class Player(PhysicsEntity):
             super().render(surf, offset=offset) # show player
 
         # rendering the hearts, we want 6 heart levels, gold heart is a shield, red is actually hit
-        cn_1 = UI(self.game.assets['catnip'].copy(), [250, 10], 15)
-        cn_2 = UI(self.game.assets['catnip'].copy(), [270, 10], 15)
-        cn_3 = UI(self.game.assets['catnip'].copy(), [290, 10], 15)
+        cn_1 = UI(self.game.assets['catnip'], [250, 10], 15) # UI only blits the image, no need to copy it every frame
+        cn_2 = UI(self.game.assets['catnip'], [270, 10], 15)
+        cn_3 = UI(self.game.assets['catnip'], [290, 10], 15)
         if self.catnip > 2:
             cn_1.render(self.game.display_black)
         if self.catnip > 1:
@@ -244,7 +255,7 @@ class Player(PhysicsEntity):
         makes the player dash
         '''
         if not self.dashing:
-            self.game.sfx['dash'].play()
+            self.game.audio.play('dash')
             if self.flip:
                 self.dashing = -60
             else:
@@ -281,18 +292,18 @@ class Cat(PhysicsEntity):
                 self.set_action('shoot')
                 self.shoot_anim = 20
                 self.timer = 100 # timer for when furball
-                self.game.sfx['shoot'].play()
+                self.game.audio.play('shoot')
                 self.game.projectiles.append([[self.rect().centerx, self.rect().centery], +1.5, 0])
                 for i in range(4):
-                    self.game.sparks.append(Spark(self.game.projectiles[-1][0], random.random() - 0.5 + math.pi, 2 + random.random()))
+                    self.game.sparks.append(Spark(self.game.projectiles[-1][0], self.game.rng.random() - 0.5 + math.pi, 2 + self.game.rng.random()))
             elif (dis[0] < 0) and not self.timer:
                 self.set_action('shoot')
                 self.shoot_anim = 20
                 self.timer = 100 # timer for when furball
-                self.game.sfx['shoot'].play()
+                self.game.audio.play('shoot')
                 self.game.projectiles.append([[self.rect().centerx, self.rect().centery], -1.5, 0])
                 for i in range(4):
-                    self.game.sparks.append(Spark(self.game.projectiles[-1][0], random.random() - 0.5 + math.pi, 2 + random.random()))
+                    self.game.sparks.append(Spark(self.game.projectiles[-1][0], self.game.rng.random() - 0.5 + math.pi, 2 + self.game.rng.random()))
 
 
 
@@ -311,20 +322,20 @@ class Cat(PhysicsEntity):
                     if (self.flip and dis[0] < 0):
                         self.set_action('shoot')
                         self.shoot_anim = 20
-                        self.game.sfx['shoot'].play()
+                        self.game.audio.play('shoot')
                         self.game.projectiles.append([[self.rect().centerx, self.rect().centery], -1.5, 0])
                         for i in range(4):
-                            self.game.sparks.append(Spark(self.game.projectiles[-1][0], random.random() - 0.5 + math.pi, 2 + random.random()))
+                            self.game.sparks.append(Spark(self.game.projectiles[-1][0], self.game.rng.random() - 0.5 + math.pi, 2 + self.game.rng.random()))
                     if (not self.flip and dis[0] > 0):
                         self.set_action('shoot')
                         self.shoot_anim = 20
-                        self.game.sfx['shoot'].play()
+                        self.game.audio.play('shoot')
                         self.game.projectiles.append([[self.rect().centerx, self.rect().centery], 1.5, 0])
                         for i in range(4):
-                            self.game.sparks.append(Spark(self.game.projectiles[-1][0], random.random() - 0.5, 2 + random.random()))
+                            self.game.sparks.append(Spark(self.game.projectiles[-1][0], self.game.rng.random() - 0.5, 2 + self.game.rng.random()))
        
-        elif random.random() < 0.01:
-            self.walking = random.randint(30, 120)
+        elif self.game.rng.random() < 0.01:
+            self.walking = self.game.rng.randint(30, 120)
         
         super().update(tilemap, movement=movement)
         
@@ -349,15 +360,15 @@ class Cat(PhysicsEntity):
             if self.rect().colliderect(self.game.player.rect()):
                 self.game.screenshake = max(16, self.game.screenshake)
                 for i in range(30):
-                    angle = random.random() * math.pi * 2
-                    speed = random.random() * 5
-                    self.game.sparks.append(Spark(self.rect().center, angle, 2 + random.random()))
-                    self.game.particles.append(Particle(self.game, 'particle_2', self.rect().center, velocity=[math.cos(angle + math.pi) * speed * 0.5, math.sin(angle + math.pi) * speed * 0.5], frame=random.randint(0, 7)))
-                self.game.sparks.append(Spark(self.rect().center, 0, 5 + random.random()))
-                self.game.sparks.append(Spark(self.rect().center, math.pi, 5 + random.random()))
-                self.game.sfx['stun'].play()
+                    angle = self.game.rng.random() * math.pi * 2
+                    speed = self.game.rng.random() * 5
+                    self.game.sparks.append(Spark(self.rect().center, angle, 2 + self.game.rng.random()))
+                    self.game.particles.append(Particle(self.game, 'particle_2', self.rect().center, velocity=[math.cos(angle + math.pi) * speed * 0.5, math.sin(angle + math.pi) * speed * 0.5], frame=self.game.rng.randint(0, 7)))
+                self.game.sparks.append(Spark(self.rect().center, 0, 5 + self.game.rng.random()))
+                self.game.sparks.append(Spark(self.rect().center, math.pi, 5 + self.game.rng.random()))
+                self.game.audio.play('stun')
                 self.set_action('stun')
-                self.walking = random.randint(150, 240) # reset walking timer bigger timer
+                self.walking = self.game.rng.randint(150, 240) # reset walking timer bigger timer
                 self.stun = self.walking
 
         
@@ -396,19 +407,19 @@ class Prize(PhysicsEntity):
 
     def update(self, tilemap, movement=[0,0]):
         if self.rect().colliderect(self.game.player.rect()): # if enemy hitbox collides with player
-            self.game.sfx['win'].play()
+            self.game.audio.play('win')
             self.game.screenshake = max(16, self.game.screenshake)  # apply screenshake
             self.dead = 0 # false
             self.start = 1 # activate end scene countndown
             for i in range(30): # enemy death effect
                 # on death sparks
-                angle = random.random() * math.pi * 4 # random angle in a circle
-                speed = random.random() * 8
-                self.game.sparks.append(Spark(self.rect().center, angle, 2 + random.random())) 
+                angle = self.game.rng.random() * math.pi * 4 # random angle in a circle
+                speed = self.game.rng.random() * 8
+                self.game.sparks.append(Spark(self.rect().center, angle, 2 + self.game.rng.random())) 
                 # on death particles
-                self.game.particles.append(Particle(self.game, 'confetti', self.rect().center, velocity=[math.cos(angle +math.pi) * speed * 0.5, math.sin(angle * math.pi) * speed * 0.5], frame=random.randint(0, 7)))
-            self.game.sparks.append(Spark(self.rect().center, 0, 5 + random.random())) # left
-            self.game.sparks.append(Spark(self.rect().center, math.pi, 5 + random.random())) # right]
+                self.game.particles.append(Particle(self.game, 'confetti', self.rect().center, velocity=[math.cos(angle +math.pi) * speed * 0.5, math.sin(angle * math.pi) * speed * 0.5], frame=self.game.rng.randint(0, 7)))
+            self.game.sparks.append(Spark(self.rect().center, 0, 5 + self.game.rng.random())) # left
+            self.game.sparks.append(Spark(self.rect().center, math.pi, 5 + self.game.rng.random())) # right]
 
         if self.lower:   # if cat furball hits the rope
             self.pos[1] += 0.05
@@ -456,14 +467,14 @@ class CatnipRecharge(PhysicsEntity):
             if self.rect().colliderect(self.game.player.rect()) and not self.timer and self.game.player.catnip != 3: # if enemy hitbox collides with player
                 self.game.screenshake = max(10, self.game.screenshake)  # apply screenshake
                 self.game.player.catnip = min(3, self.game.player.catnip +1) # just to be sure
-                self.game.sfx['get'].play()
+                self.game.audio.play('get')
                 self.timer = 150
                 for i in range(10): # enemy death effect
                     # on death sparks
-                    angle = random.random() * math.pi * 2 # random angle in a circle
-                    speed = random.random() * 5
-                    self.game.sparks.append(Spark(self.rect().center, angle, 2 + random.random())) 
-                    self.game.particles.append(Particle(self.game, 'confetti', self.rect().center, velocity=[math.cos(angle +math.pi) * speed * 0.5, math.sin(angle * math.pi) * speed * 0.5], frame=random.randint(0, 7)))
+                    angle = self.game.rng.random() * math.pi * 2 # random angle in a circle
+                    speed = self.game.rng.random() * 5
+                    self.game.sparks.append(Spark(self.rect().center, angle, 2 + self.game.rng.random())) 
+                    self.game.particles.append(Particle(self.game, 'confetti', self.rect().center, velocity=[math.cos(angle +math.pi) * speed * 0.5, math.sin(angle * math.pi) * speed * 0.5], frame=self.game.rng.randint(0, 7)))
         
         if self.timer > 0:
             self.timer -= 1
@@ -490,7 +501,7 @@ class Button(PhysicsEntity):
         # if player collides with button activate it
         if self.rect().colliderect(self.game.player.rect()) or self.activate:
             self.activate = 0
-            self.game.sfx['button'].play()
+            self.game.audio.play('button')
             self.timer = 200
 
         if self.timer > 0:
@@ -541,12 +552,20 @@ class Toy(PhysicsEntity):
 
     def update(self, tilemap, movement=(0,0)):
         '''
-        updates UI with toy
+        toy follows the player while it's carried
         '''
         if self.game.pickup:
             self.pos = (self.game.player.pos[0], self.game.player.pos[1])
-            toy = UI(self.game.assets['toy'].copy(), [13, 10], 15)
-            toy.render(self.game.display_black)
+
+    def render(self, surf, offset=(0,0)):
+        '''
+        renders the toy in the level, or the UI icon once it's picked up
+        '''
+        if self.game.pickup:
+            toy = UI(self.game.assets['toy'], [13, 10], 15)
+            toy.render(surf)
+        else:
+            super().render(surf, offset=offset)
 
     def pickup(self):
         '''
@@ -556,7 +575,7 @@ class Toy(PhysicsEntity):
             pass
         else:
             self.game.pickup = 1
-            self.game.sfx['pickup'].play()
+            self.game.audio.play('pickup')
 
     def drop(self):
         '''
@@ -564,6 +583,6 @@ class Toy(PhysicsEntity):
         '''
         if self.game.pickup:
             self.game.pickup = 0
-            self.game.sfx['drop'].play()
+            self.game.audio.play('drop')
             
 
@@ -0,0 +1,103 @@
+import json
+
+import pygame
+
+# everything the game reacts to, one name per key press / release
+ACTIONS = ['left_down', 'left_up', 'right_down', 'right_up', 'jump', 'dash', 'pickup', 'drop', 'quit', 'toggle_profiler', 'rewind', 'checkpoint']
+# recordings leave these out, rewinding moves the run back in time so the recorder drops the steps it undid instead
+UI_ACTIONS = {'quit', 'toggle_profiler', 'rewind', 'checkpoint'}
+
+KEYDOWN_ACTIONS = {
+    pygame.K_a: 'left_down', # referencing WASD
+    pygame.K_d: 'right_down',
+    pygame.K_SPACE: 'jump',
+    pygame.K_e: 'dash',
+    pygame.K_s: 'pickup',
+    pygame.K_f: 'drop',
+    pygame.K_F3: 'toggle_profiler',
+    pygame.K_r: 'rewind', # with --history
+    pygame.K_c: 'checkpoint',
+}
+KEYUP_ACTIONS = {
+    pygame.K_a: 'left_up',
+    pygame.K_d: 'right_up',
+}
+
+class InputSource:
+    '''
+    where the game gets its actions from, one poll per simulation step
+    '''
+    def poll(self, tick):
+        '''
+        (simulation step number) -> (list of action names)
+        '''
+        return []
+
+    def step_done(self, game):
+        '''
+        called after every simulation step, lets recorders look at the game state
+        '''
+        pass
+
+    def done(self, tick):
+        '''
+        (simulation step number) -> (bool, the source has nothing more to give and the game should stop)
+        '''
+        return False
+
+    def close(self):
+        '''
+        called once when the game stops
+        '''
+        pass
+
+class KeyboardInput(InputSource):
+    '''
+    reads the actions for a step from the pygame event queue
+    '''
+    def poll(self, tick):
+        '''
+        turns pending window events into actions
+        (simulation step number) -> (list of action names)
+        '''
+        actions = []
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT: # have to code the window closing
+                actions.append('quit')
+            if event.type == pygame.KEYDOWN and event.key in KEYDOWN_ACTIONS:
+                actions.append(KEYDOWN_ACTIONS[event.key])
+            if event.type == pygame.KEYUP and event.key in KEYUP_ACTIONS: # when key is released
+                actions.append(KEYUP_ACTIONS[event.key])
+        return actions
+
+class ScriptedInput(InputSource):
+    '''
+    plays back a fixed list of actions keyed by simulation step, no window needed
+    '''
+    def __init__(self, script=None):
+        '''
+        (dict of {step: [action names]})
+        '''
+        self.script = {}
+        for tick, actions in (script or {}).items():
+            for action in actions:
+                if action not in ACTIONS:
+                    raise ValueError('unknown action ' + repr(action))
+            self.script[int(tick)] = list(actions)
+
+    def poll(self, tick):
+        '''
+        (simulation step number) -> (list of action names)
+        '''
+        return self.script.get(tick, [])
+
+    @classmethod
+    def load(cls, path):
+        '''
+        loads a script from a json file shaped like {"120": ["right_down", "jump"], ...}
+        (file path) -> ScriptedInput
+        '''
+        f = open(path, 'r')
+        script = json.load(f)
+        f.close()
+        return cls(script)
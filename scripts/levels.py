@@ -0,0 +1,259 @@
+import os
+import sys
+import json
+import time
+import argparse
+import struct
+import marshal
+import hashlib
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+import pygame
+
+from scripts.tilemap import Tilemap
+from scripts.streaming import StreamedTilemap, write_chunks
+from scripts.entities import Cat, Trap, Prize, CatnipRecharge, Button, Turbine, Toy
+
+MAP_PATH = 'data/maps/' # editor maps, the source
+LEVEL_PATH = 'data/levels/' # compiled bundles + index.json, and each level split into chunks under <id>.chunks/ for streaming
+INDEX = 'index.json'
+VERSION = 2
+
+# bundle file: header (magic, version, level id) then the marshalled bundle dict
+MAGIC = b'TTLV'
+HEADER = struct.Struct('<4sBH')
+MARSHAL_VERSION = 4
+
+# entity lists on Game and the class each one holds
+ENTITY_LISTS = [('enemies', Cat), ('trap', Trap), ('prize', Prize), ('catnip', CatnipRecharge), ('button', Button), ('turbine', Turbine), ('toy', Toy)]
+ENTITY_CLASSES = dict(ENTITY_LISTS)
+# spawner tile variant -> (Game list the entity goes in, or 'player', hitbox size, offset from the spawner tile)
+SPAWN_TABLE = {
+    0: ('player', None, (0, 0)),
+    1: ('enemies', (16, 13), (0, 0)),
+    2: ('trap', (10, 16), (0, 0)),
+    3: ('prize', (17, 100), (0, 0)),
+    4: ('catnip', (14, 16), (0, 0)),
+    5: ('button', (8, 16), (2, 3)),
+    6: ('turbine', (100, 300), (0, 0)),
+    7: ('toy', (16, 16), (0, 0)),
+}
+SPAWNERS = [('spawners', variant) for variant in SPAWN_TABLE]
+
+def levels_for(maps):
+    '''
+    the game's maps compile into data/levels/, any other maps folder into its own <folder>.levels/ beside it,
+    so two maps folders next to each other never read each other's bundles
+    (maps folder, e.g. data/maps/ or stress/maps/) -> (bundle folder, e.g. data/levels/ or stress/maps.levels/)
+    '''
+    if os.path.normpath(maps) == os.path.normpath(MAP_PATH):
+        return LEVEL_PATH
+    return os.path.normpath(maps) + '.levels/'
+
+def file_hash(path):
+    f = open(path, 'rb')
+    digest = hashlib.sha1(f.read()).hexdigest()
+    f.close()
+    return digest
+
+def source_maps(src=MAP_PATH):
+    '''
+    -> (sorted level ids of the editor maps, they have to run 0, 1, 2 ... with no gaps)
+    '''
+    ids = sorted(int(name.split('.')[0]) for name in os.listdir(src) if name.endswith('.json'))
+    if ids != list(range(len(ids))):
+        raise ValueError('maps in ' + src + ' have to be numbered 0 to ' + str(len(ids) - 1) + ', found ' + str(ids))
+    return ids
+
+def compile_level(map_id, src=MAP_PATH):
+    '''
+    turns an editor map into a bundle: autotiled grid, offgrid decor, spawn table, collision rects and metadata
+    (level id, map folder) -> (bundle dict, only plain values so it marshals)
+    '''
+    tilemap = Tilemap(None)
+    tilemap.load(os.path.join(src, str(map_id) + '.json'))
+    tilemap.autotile()
+    spawns = []
+    for spawner in tilemap.extract(SPAWNERS): # offgrid ones first then grid order, the order entities update in
+        name, size, offset = SPAWN_TABLE[spawner['variant']]
+        spawns.append((name, (spawner['pos'][0] + offset[0], spawner['pos'][1] + offset[1]), size))
+    tilemap.bake_collision()
+
+    xs = [tile['pos'][0] for tile in tilemap.tilemap.values()] or [0]
+    ys = [tile['pos'][1] for tile in tilemap.tilemap.values()] or [0]
+    counts = {}
+    for name, pos, size in spawns:
+        counts[name] = counts.get(name, 0) + 1
+    return {
+        'tile_size': tilemap.tile_size,
+        'tilemap': tilemap.tilemap,
+        'offgrid': tilemap.offgrid_tiles,
+        'spawns': spawns,
+        'solid': {loc: tuple(rect) for loc, rect in tilemap.solid.items()},
+        'meta': {'id': map_id, 'bounds': [min(xs), min(ys), max(xs), max(ys)], 'tiles': len(tilemap.tilemap), 'offgrid': len(tilemap.offgrid_tiles), 'spawns': counts},
+    }
+
+def compile_levels(src=MAP_PATH, out=LEVEL_PATH):
+    '''
+    compiles every editor map and writes the index last, so a half finished build never looks complete,
+    then deletes the bundles of levels the index doesn't list
+    (map folder, output folder) -> (index dict)
+    '''
+    os.makedirs(out, exist_ok=True)
+    levels = []
+    for map_id in source_maps(src):
+        bundle = compile_level(map_id, src)
+        name = str(map_id) + '.bin'
+        f = open(os.path.join(out, name), 'wb')
+        f.write(HEADER.pack(MAGIC, VERSION, map_id) + marshal.dumps(bundle, MARSHAL_VERSION))
+        f.close()
+        chunks = write_chunks(bundle, os.path.join(out, str(map_id) + '.chunks'))
+        digest = file_hash(os.path.join(src, str(map_id) + '.json'))
+        levels.append(dict(bundle['meta'], file=name, chunk_dir=str(map_id) + '.chunks', chunks=len(chunks), source=str(map_id) + '.json', hash=digest))
+
+    index = {'version': VERSION, 'built': time.time(), 'maps': os.path.abspath(src), 'levels': levels}
+    tmp = os.path.join(out, INDEX + '.tmp')
+    f = open(tmp, 'w')
+    json.dump(index, f, indent=1)
+    f.close()
+    os.replace(tmp, os.path.join(out, INDEX))
+
+    # bundles of levels that aren't in the index any more (a map was deleted), the same as write_chunks does for chunks
+    current = {level['file'] for level in levels} | {level['chunk_dir'] for level in levels}
+    for name in os.listdir(out):
+        if name.split('.')[0].isdigit() and name.endswith(('.bin', '.chunks')) and name not in current:
+            if os.path.isdir(os.path.join(out, name)):
+                shutil.rmtree(os.path.join(out, name))
+            else:
+                os.remove(os.path.join(out, name))
+    return index
+
+def stale(index, src):
+    '''
+    (index dict, map folder) -> (reason the index doesn't match the maps in src, or None if it's up to date)
+    '''
+    if index.get('version') != VERSION:
+        return 'built by another version'
+    if index.get('maps') != os.path.abspath(src):
+        return 'built from ' + str(index.get('maps'))
+    # the folder's mtime changes when maps are added / removed
+    if os.path.getmtime(src) > index['built'] and len(source_maps(src)) != len(index['levels']):
+        return 'maps were added or removed'
+    for level in index['levels']:
+        source = os.path.join(src, level['source'])
+        if not os.path.exists(source):
+            return level['source'] + ' is gone'
+        # only hash maps saved after the build, saving without a change doesn't recompile
+        if os.path.getmtime(source) > index['built'] and file_hash(source) != level['hash']:
+            return level['source'] + ' was edited'
+    return None
+
+def load_index(path=LEVEL_PATH, src=MAP_PATH):
+    '''
+    reads the level index, recompiling first when it's missing, was built from another maps folder
+    or a map was edited after it was built (packaged games ship without the maps and take the index as it is)
+    (bundle folder, map folder) -> (index dict)
+    '''
+    try:
+        f = open(os.path.join(path, INDEX), 'r')
+        index = json.load(f)
+        f.close()
+    except (FileNotFoundError, ValueError):
+        index = None
+    if index is None:
+        reason = 'no index in ' + path
+    elif os.path.isdir(src):
+        reason = stale(index, src)
+    else:
+        reason = None if index.get('version') == VERSION else 'built by another version'
+    if reason:
+        print('compiling levels, ' + reason + ' (python -m scripts.levels)', file=sys.stderr)
+        index = compile_levels(src, path)
+    return index
+
+def load_bundle(path):
+    '''
+    (bundle file) -> ((Tilemap with no game yet, spawn table of (Game list, pixel position, size)), metadata)
+    '''
+    f = open(path, 'rb')
+    data = f.read()
+    f.close()
+    magic, version, map_id = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(path + ' is not a version ' + str(VERSION) + ' level bundle, rebuild with python -m scripts.levels')
+    bundle = marshal.loads(data[HEADER.size:])
+
+    tilemap = Tilemap(None, tile_size=bundle['tile_size'])
+    tilemap.tilemap = bundle['tilemap']
+    tilemap.offgrid_tiles = bundle['offgrid']
+    tilemap.solid = {loc: pygame.Rect(rect) for loc, rect in bundle['solid'].items()}
+    return (tilemap, bundle['spawns']), bundle['meta']
+
+def instantiate(template):
+    '''
+    a live copy of a pristine level, only the containers are copied, the tile dicts and collision rects are shared
+    with the template since nothing in the game writes to them (the editor has its own Tilemap)
+    ((Tilemap, spawns) from load_bundle) -> (Tilemap, spawns)
+    '''
+    pristine, spawns = template
+    tilemap = Tilemap(None, tile_size=pristine.tile_size)
+    tilemap.tilemap = dict(pristine.tilemap)
+    tilemap.offgrid_tiles = list(pristine.offgrid_tiles)
+    tilemap.solid = pristine.solid
+    return tilemap, [(name, list(pos), size) for name, pos, size in spawns] # entities move their pos lists in place
+
+class LevelLoader:
+    def __init__(self, maps=MAP_PATH, stream_radius=0):
+        '''
+        reads each compiled level once, on a background thread, and keeps it as a pristine template,
+        loading a level (respawns included) is then just a copy of the template
+        (maps folder, its bundles are read from levels_for(maps),
+         chunks kept resident around the camera / player (0 -> load whole levels, no streaming))
+        '''
+        self.path = levels_for(maps)
+        self.stream_radius = stream_radius
+        self.streamed = {} # map id -> StreamedTilemap, only the current level's
+        self.index = load_index(self.path, maps)
+        self.max_level = len(self.index['levels']) - 1
+        self.pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='levels')
+        self.templates = {} # map id -> Future of load_bundle, never modified once done
+        self.stats = {'preloaded': 0, 'waited': 0, 'loaded_now': 0}
+
+    def prepare(self, map_id):
+        template, meta = load_bundle(os.path.join(self.path, self.index['levels'][map_id]['file']))
+        return template
+
+    def preload(self, map_id):
+        '''
+        starts reading a level in the background unless it's already been read, streamed levels load as they're played
+        '''
+        if not self.stream_radius and map_id not in self.templates:
+            self.templates[map_id] = self.pool.submit(self.prepare, map_id)
+
+    def take(self, map_id):
+        '''
+        (map id) -> (Tilemap, spawns), a fresh copy of the level's template, waiting for it to be read if it has to
+        '''
+        if self.stream_radius:
+            # nothing in the game writes to tiles, so a respawn keeps the same streamed map and its resident chunks
+            if map_id not in self.streamed:
+                self.streamed = {map_id: StreamedTilemap(None, os.path.join(self.path, self.index['levels'][map_id]['chunk_dir']), self.stream_radius)}
+            tilemap = self.streamed[map_id]
+            return tilemap, [(name, list(pos), size) for name, pos, size in tilemap.spawns]
+        if map_id not in self.templates:
+            self.stats['loaded_now'] += 1
+            self.templates[map_id] = self.pool.submit(self.prepare, map_id)
+        else:
+            self.stats['preloaded' if self.templates[map_id].done() else 'waited'] += 1
+        return instantiate(self.templates[map_id].result())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='compiles editor maps into level bundles')
+    parser.add_argument('--maps', default=MAP_PATH, help='folder of numbered maps, data/maps/ compiles into data/levels/, any other folder into <folder>.levels/')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = compile_levels(args.maps, levels_for(args.maps))
+    print(f"compiled {len(index['levels'])} levels in {time.perf_counter() - start:.2f}s")
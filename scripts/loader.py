@@ -0,0 +1,92 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from scripts.assetcache import get_cache
+
+# decoded but not yet converted, full file path -> Surface / Sound, load_image and load_sound take from here first
+decoded = {}
+timings = {} # full file path -> {'decode_ms', 'convert_ms', 'thread'}
+lock = threading.Lock()
+
+def image_files(root, entries):
+    '''
+    every png named by entries, folders are walked
+    (image root, list of files / folders relative to it) -> (list of full paths)
+    '''
+    paths = []
+    for entry in entries:
+        full = os.path.join(root, entry)
+        if os.path.isdir(full):
+            for folder, subdirs, files in os.walk(full):
+                paths += [os.path.join(folder, name).replace('\\', '/') for name in sorted(files) if name.endswith('.png')]
+        else:
+            paths.append(full.replace('\\', '/'))
+    return paths
+
+def decode_file(path, sound):
+    '''
+    runs on a worker, file reading, hashing and decoding don't need the display
+    (full path, is it a sound) -> (path, decoded asset)
+    '''
+    start = time.perf_counter()
+    asset = get_cache().load_sound(path) if sound else get_cache().load_image(path)
+    with lock:
+        timings[path] = {'decode_ms': round((time.perf_counter() - start) * 1000, 3), 'thread': threading.current_thread().name}
+    return path, asset
+
+def decode_all(images=(), sounds=(), workers=None):
+    '''
+    decodes files on a thread pool and leaves them in decoded, the display dependent convert_alpha / colorkey
+    step still happens on the main thread when load_image picks them up
+    (full image paths, full sound paths, worker threads (None -> one per core, 1 -> in order on this thread)) -> (seconds taken)
+    '''
+    start = time.perf_counter()
+    jobs = [(path, False) for path in images if path not in decoded] + [(path, True) for path in sounds if path not in decoded]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        results = [decode_file(path, sound) for path, sound in jobs]
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='decode') as pool:
+            results = list(pool.map(lambda job: decode_file(*job), jobs))
+    for path, asset in results:
+        decoded[path] = asset
+    return time.perf_counter() - start
+
+def take(path):
+    '''
+    (full file path) -> (its decoded asset, or None when it wasn't decoded ahead of time)
+    '''
+    return decoded.pop(path, None)
+
+def converted(path, seconds, kind=None):
+    '''
+    notes how long the main thread spent converting a file and which surface format it ended up in
+    '''
+    entry = timings.setdefault(path, {})
+    entry['convert_ms'] = round(seconds * 1000, 3)
+    if kind:
+        entry['format'] = kind
+
+def discard():
+    '''
+    drops whatever was decoded but never asked for
+    '''
+    decoded.clear()
+
+def report():
+    '''
+    -> (dict, per file timings and totals)
+    '''
+    formats = {}
+    for t in timings.values():
+        if 'format' in t:
+            formats[t['format']] = formats.get(t['format'], 0) + 1
+    return {
+        'decode_ms': round(sum(t.get('decode_ms', 0) for t in timings.values()), 3),
+        'convert_ms': round(sum(t.get('convert_ms', 0) for t in timings.values()), 3),
+        'formats': formats, # anything not 'alpha' was demoted to a cheaper blit
+        'demoted': sorted(path for path, t in timings.items() if t.get('format', 'alpha') != 'alpha'),
+        'files': dict(sorted(timings.items())),
+    }
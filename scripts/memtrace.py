@@ -0,0 +1,264 @@
+import os
+import gc
+import json
+import time
+import re
+import fnmatch
+import linecache
+import tracemalloc
+
+import pygame
+
+from scripts import profiler
+
+TOP_SITES = 25 # call sites kept in the report
+TOP_TYPES = 30 # object types kept per level
+TOP_SURFACES = 15 # surface sizes / formats kept per level
+
+def site_name(trace):
+    '''
+    (tracemalloc StatisticDiff or Statistic) -> ('file.py:line')
+    '''
+    frame = trace.traceback[0]
+    try:
+        filename = os.path.relpath(frame.filename)
+    except ValueError: # different drive on windows
+        filename = frame.filename
+    return filename.replace('\\', '/') + ':' + str(frame.lineno)
+
+def object_counts():
+    '''
+    counts every gc tracked object by type
+    -> (dict of {type name: count})
+    '''
+    counts = {}
+    for obj in gc.get_objects():
+        name = type(obj).__name__
+        counts[name] = counts.get(name, 0) + 1
+    return counts
+
+def surface_kind(surf):
+    '''
+    (Surface) -> ('32x32 alpha' style key, size and pixel format)
+    '''
+    if surf.get_flags() & pygame.SRCALPHA:
+        kind = 'alpha'
+    elif surf.get_colorkey() is not None:
+        kind = 'colorkey'
+    else:
+        kind = 'opaque'
+    return str(surf.get_width()) + 'x' + str(surf.get_height()) + ' ' + str(surf.get_bitsize()) + 'bit ' + kind
+
+def surface_stats():
+    '''
+    surfaces aren't gc tracked themselves, so find them through whatever holds them
+    -> (number of live surfaces, KiB of pixel data, dict of surface_kind -> [count, KiB])
+    '''
+    surfaces = {}
+    for obj in gc.get_objects():
+        for ref in gc.get_referents(obj):
+            if isinstance(ref, pygame.Surface):
+                surfaces[id(ref)] = ref
+    for surf in list(surfaces.values()):
+        parent = surf.get_parent()
+        while parent is not None: # atlas sheets are only held through their subsurfaces
+            surfaces[id(parent)] = parent
+            parent = parent.get_parent()
+    size = 0
+    kinds = {}
+    for surf in surfaces.values():
+        if surf.get_parent() is None: # subsurfaces share their parent's pixels
+            kib = surf.get_width() * surf.get_height() * surf.get_bytesize() / 1024
+            size += kib
+            entry = kinds.setdefault(surface_kind(surf), [0, 0])
+            entry[0] += 1
+            entry[1] += kib
+    return len(surfaces), size, kinds
+
+def top_kinds(kinds):
+    '''
+    (dict of surface_kind -> [count, KiB]) -> (the TOP_SURFACES biggest by KiB, rounded for the report)
+    '''
+    return {kind: [count, round(kib, 1)] for kind, (count, kib) in sorted(kinds.items(), key=lambda item: -item[1][1])[:TOP_SURFACES]}
+
+class MemoryTracer:
+    def __init__(self, path, interval=10):
+        '''
+        memory diagnostics: allocations per frame by call site, gc activity, live objects per level, leak checks
+        (report file, frames between tracemalloc snapshots, 1 -> every frame)
+        '''
+        self.path = path
+        self.interval = interval
+        self.frame = 0
+        self.sampled_frames = 0
+        self.sites = {} # call site -> [bytes, blocks] allocated on net across sampled frames
+        self.frame_start = 0 # traced bytes when the frame began
+        self.churn = 0 # bytes allocated above the frame's starting point and freed again, summed over frames
+        self.max_churn = 0
+        self.max_churn_frame = 0
+        self.collections = [0, 0, 0]
+        self.gc_pause = 0
+        self.gc_max_pause = 0
+        self.gc_start = 0
+        self.levels = []
+        self.leak = None
+        self.last_snapshot = None
+        self.paused = False # leak_check reloads levels without logging each one
+        # built once, making them every snapshot would show up as allocations of its own
+        self.filters = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, linecache.__file__), # tracemalloc reads source lines through it
+            tracemalloc.Filter(False, fnmatch.__file__), # filter_traces compiles these patterns through fnmatch and re
+            tracemalloc.Filter(False, os.path.join(os.path.dirname(re.__file__), '*')),
+            tracemalloc.Filter(False, profiler.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, '<unknown>'),
+        ]
+
+        tracemalloc.start()
+        gc.callbacks.append(self.gc_callback)
+
+    def gc_callback(self, phase, info):
+        '''
+        times every collection, churn shows up as lots of generation 0 collections
+        '''
+        if phase == 'start':
+            self.gc_start = time.perf_counter()
+        else:
+            pause = (time.perf_counter() - self.gc_start) * 1000
+            self.collections[info['generation']] += 1
+            self.gc_pause += pause
+            self.gc_max_pause = max(self.gc_max_pause, pause)
+
+    def snapshot(self):
+        '''
+        -> (tracemalloc snapshot without our own bookkeeping or the profiler's stage timers in it)
+        '''
+        return tracemalloc.take_snapshot().filter_traces(self.filters)
+
+    def begin_frame(self):
+        if self.frame % self.interval == 0:
+            self.last_snapshot = self.snapshot()
+        # after the snapshot so it isn't counted, the peak then shows what the frame allocated and freed in between
+        tracemalloc.reset_peak()
+        self.frame_start = tracemalloc.get_traced_memory()[0]
+
+    def end_frame(self):
+        '''
+        adds the frame's churn (every frame) and what it allocated (net, per call site, sampled frames) to the running totals
+        '''
+        current, peak = tracemalloc.get_traced_memory()
+        churn = peak - max(self.frame_start, current) # short lived garbage never shows up in a net diff
+        self.churn += churn
+        if churn > self.max_churn:
+            self.max_churn, self.max_churn_frame = churn, self.frame
+        if self.frame % self.interval == 0:
+            for stat in self.snapshot().compare_to(self.last_snapshot, 'lineno'):
+                if stat.size_diff > 0:
+                    site = self.sites.setdefault(site_name(stat), [0, 0])
+                    site[0] += stat.size_diff
+                    site[1] += stat.count_diff
+            self.sampled_frames += 1
+            self.last_snapshot = None
+        self.frame += 1
+
+    def level_loaded(self, game):
+        '''
+        live objects and surfaces right after load_level
+        '''
+        if self.paused:
+            return
+        gc.collect()
+        surfaces, surface_kib, kinds = surface_stats()
+        counts = sorted(object_counts().items(), key=lambda item: -item[1])
+        self.levels.append({
+            'level': game.level,
+            'tick': game.tick,
+            'traced_kib': round(tracemalloc.get_traced_memory()[0] / 1024, 1),
+            'surfaces': surfaces,
+            'surface_kib': round(surface_kib, 1),
+            'surface_kinds': top_kinds(kinds),
+            'objects': dict(counts[:TOP_TYPES]),
+            'assets': game.assets.report(),
+        })
+        if game.levels.stream_radius:
+            self.levels[-1]['chunks'] = game.tilemap.report()
+
+    def leak_check(self, game, level, reloads=10):
+        '''
+        reloads a level over and over, anything still growing once the first two reloads have settled is a leak
+        (Game, level, number of reloads)
+        '''
+        self.paused = True
+        game.level = level
+        game.load_level(level)
+        game.load_level(level) # let caches and first time allocations settle
+        # object counts and tracemalloc snapshots in separate passes so the snapshots don't count themselves
+        gc.collect()
+        before_counts = object_counts()
+        before_surfaces, before_kib, before_kinds = surface_stats()
+        for i in range(reloads):
+            game.load_level(level)
+        gc.collect()
+        after_counts = object_counts()
+        after_surfaces, after_kib, after_kinds = surface_stats()
+        kind_growth = {kind: [count - before_kinds.get(kind, [0, 0])[0], kib - before_kinds.get(kind, [0, 0])[1]] for kind, (count, kib) in after_kinds.items()}
+
+        self.snapshot() # the first filtered snapshot of a run fills fnmatch's pattern cache, keep that out of before / after
+        before = self.snapshot()
+        for i in range(reloads):
+            game.load_level(level)
+        gc.collect()
+        after = self.snapshot()
+        self.paused = False
+
+        growth = [stat for stat in after.compare_to(before, 'lineno') if stat.size_diff > 0]
+        self.leak = {
+            'level': level,
+            'reloads': reloads,
+            'traced_growth_kib': round(sum(stat.size_diff for stat in growth) / 1024, 2),
+            'surface_growth': after_surfaces - before_surfaces,
+            'surface_growth_kib': round(after_kib - before_kib, 1),
+            'surface_kind_growth': top_kinds({kind: growth for kind, growth in kind_growth.items() if growth[0] > 0}),
+            'sites': [{'site': site_name(stat), 'kib': round(stat.size_diff / 1024, 2), 'blocks': stat.count_diff} for stat in growth[:TOP_SITES]],
+            'object_growth': {name: after_counts.get(name, 0) - before_counts.get(name, 0) for name in after_counts if after_counts.get(name, 0) != before_counts.get(name, 0)},
+        }
+
+    def report(self):
+        '''
+        -> (dict, the whole report)
+        '''
+        frames = max(1, self.sampled_frames)
+        sites = sorted(self.sites.items(), key=lambda item: -item[1][0])[:TOP_SITES]
+        return {
+            'frames': self.frame,
+            'sampled_frames': self.sampled_frames,
+            'churn': {
+                'kib_per_frame': round(self.churn / 1024 / max(1, self.frame), 3),
+                'max_kib': round(self.max_churn / 1024, 3),
+                'max_frame': self.max_churn_frame,
+            },
+            'gc': {
+                'collections': self.collections,
+                'collections_per_frame': [round(count / max(1, self.frame), 4) for count in self.collections],
+                'pause_ms_total': round(self.gc_pause, 3),
+                'max_pause_ms': round(self.gc_max_pause, 3),
+            },
+            'call_sites': [{'site': name, 'kib_per_frame': round(size / 1024 / frames, 3), 'blocks_per_frame': round(blocks / frames, 2)} for name, (size, blocks) in sites],
+            'levels': self.levels,
+            'leak_check': self.leak,
+        }
+
+    def save(self):
+        f = open(self.path, 'w')
+        json.dump(self.report(), f, indent=2)
+        f.close()
+
+    def stop(self):
+        '''
+        writes the report and stops tracing
+        '''
+        self.save()
+        if self.gc_callback in gc.callbacks:
+            gc.callbacks.remove(self.gc_callback)
+        tracemalloc.stop()
@@ -0,0 +1,163 @@
+import time
+from collections import OrderedDict
+
+import pygame
+
+from scripts.streaming import chunk_of, CHUNK_SIZE
+
+ZOOMS = [16, 8, 4, 2, 1] # window pixels per tile of the zoomed out views, the editor normally shows 32
+BUDGET = 32 * 1024 * 1024 # bytes of chunk images kept, least recently drawn go first
+MINIMAP_SIZE = (192, 112) # window pixels, at 1 pixel a tile
+MINIMAP_MARGIN = 4
+BUILD_BUDGET = 0.006 # seconds a frame spends drawing chunk pictures, the rest show up over the next frames
+
+class ChunkImages:
+    '''
+    one small picture per chunk and zoom level, so a zoomed out view is one blit per chunk whatever the zoom
+
+    each picture is drawn from tile images scaled down once per zoom (grid tiles only, the offgrid decor is left out
+    and tiles bigger than a cell are cut off at the chunk's edge), edited chunks are dropped and drawn again
+    the next time they're on screen
+    '''
+    def __init__(self, tilemap, assets, background=(255, 255, 255), budget=BUDGET):
+        '''
+        (Tilemap, dict of tile type -> list of images, colour of empty cells, bytes of pictures to keep)
+        '''
+        self.tilemap = tilemap
+        self.assets = assets
+        self.background = background
+        self.budget = budget
+        self.images = OrderedDict() # (chunk key, pixels per tile) -> Surface, oldest drawn first
+        self.size = 0 # bytes in images
+        self.scaled = {} # pixels per tile -> dict of tile type -> scaled images
+        self.filled = {chunk_of(tile['pos'][0], tile['pos'][1]) for tile in tilemap.tilemap.values()} # chunks with at least one tile
+        self.missing = 0 # chunks the last render left out because it ran out of time
+        self.stats = {'built': 0, 'dropped': 0, 'evicted': 0}
+
+    def tiles(self, px):
+        '''
+        (pixels per tile) -> (dict of tile type -> images scaled to it)
+        '''
+        if px not in self.scaled:
+            ts = self.tilemap.tile_size
+            self.scaled[px] = {tile_type: [pygame.transform.smoothscale(img.convert_alpha(), (max(1, img.get_width() * px // ts), max(1, img.get_height() * px // ts)))
+                                           for img in images] for tile_type, images in self.assets.items()}
+        return self.scaled[px]
+
+    def build(self, key, px):
+        surf = pygame.Surface((CHUNK_SIZE * px, CHUNK_SIZE * px))
+        surf.fill(self.background)
+        images = self.tiles(px)
+        blits = []
+        for x in range(CHUNK_SIZE):
+            for y in range(CHUNK_SIZE):
+                loc = str(key[0] * CHUNK_SIZE + x) + ';' + str(key[1] * CHUNK_SIZE + y)
+                if loc in self.tilemap.tilemap:
+                    tile = self.tilemap.tilemap[loc]
+                    blits.append((images[tile['type']][tile['variant']], (x * px, y * px)))
+        surf.blits(blits, doreturn=False)
+        self.stats['built'] += 1
+        return surf
+
+    def image(self, key, px):
+        '''
+        (chunk key, pixels per tile) -> (Surface of the chunk), drawn now if it isn't cached
+        '''
+        entry = (key, px)
+        if entry in self.images:
+            self.images.move_to_end(entry)
+            return self.images[entry]
+        surf = self.build(key, px)
+        self.images[entry] = surf
+        self.size += surf.get_width() * surf.get_height() * surf.get_bytesize()
+        while self.size > self.budget and len(self.images) > 1:
+            old = self.images.popitem(last=False)[1]
+            self.size -= old.get_width() * old.get_height() * old.get_bytesize()
+            self.stats['evicted'] += 1
+        return surf
+
+    def invalidate(self, cells):
+        '''
+        drops the pictures of every chunk with a changed cell
+        (iterable of (x, y), e.g. the dict from EditLog.take_dirty) -> (set of chunk keys that changed)
+        '''
+        keys = {chunk_of(x, y) for x, y in cells}
+        if not keys:
+            return keys
+        for key in keys:
+            if any(str(x) + ';' + str(y) in self.tilemap.tilemap for x in range(key[0] * CHUNK_SIZE, (key[0] + 1) * CHUNK_SIZE)
+                   for y in range(key[1] * CHUNK_SIZE, (key[1] + 1) * CHUNK_SIZE)):
+                self.filled.add(key)
+            else:
+                self.filled.discard(key)
+        for entry in [entry for entry in self.images if entry[0] in keys]:
+            surf = self.images.pop(entry)
+            self.size -= surf.get_width() * surf.get_height() * surf.get_bytesize()
+            self.stats['dropped'] += 1
+        return keys
+
+    def render(self, surf, center, px, budget=BUILD_BUDGET):
+        '''
+        draws the map zoomed out, one blit per chunk on screen, chunks with no tiles are left as they are,
+        pictures that aren't cached are drawn until the budget runs out and the rest are counted in missing
+        (Surface, world pixel at the middle of surf, pixels per tile, seconds) -> (world pixel at surf's top left, pixels per world pixel)
+        '''
+        deadline = time.perf_counter() + budget
+        self.missing = 0
+        scale = px / self.tilemap.tile_size
+        left, top = center[0] - surf.get_width() / 2 / scale, center[1] - surf.get_height() / 2 / scale
+        chunk_px = CHUNK_SIZE * self.tilemap.tile_size
+        blits = []
+        for cx in range(int(left // chunk_px), int((left + surf.get_width() / scale) // chunk_px) + 1):
+            for cy in range(int(top // chunk_px), int((top + surf.get_height() / scale) // chunk_px) + 1):
+                if (cx, cy) not in self.filled: # empty space costs nothing
+                    continue
+                if ((cx, cy), px) not in self.images and time.perf_counter() > deadline:
+                    self.missing += 1
+                else:
+                    blits.append((self.image((cx, cy), px), (round((cx * chunk_px - left) * scale), round((cy * chunk_px - top) * scale))))
+        surf.blits(blits, doreturn=False)
+        return (left, top), scale
+
+class Minimap:
+    '''
+    a panel in the window's top right corner with the map around the camera at a pixel a tile and the view's outline,
+    only put together again when the camera moves or a chunk on it changes
+    '''
+    def __init__(self, images, window_size, view_size, size=MINIMAP_SIZE):
+        '''
+        (ChunkImages, window size, world pixels the editor's normal view shows, panel size in window pixels)
+        '''
+        self.images = images
+        self.view_size = view_size
+        self.surface = pygame.Surface(size)
+        self.rect = pygame.Rect(window_size[0] - size[0] - MINIMAP_MARGIN, MINIMAP_MARGIN, size[0], size[1])
+        self.center = None # world pixel the panel was put together around
+        self.keys = set() # chunks on the panel
+        self.missing = 0
+        self.origin, self.scale = (0, 0), 1
+
+    def update(self, center, changed):
+        '''
+        (world pixel at the middle of the editor's view, set of chunk keys edited this frame) -> (bool, the panel was redrawn)
+        '''
+        if center == self.center and not (changed & self.keys) and not self.missing:
+            return False
+        self.center = center
+        self.surface.fill(self.images.background)
+        self.origin, self.scale = self.images.render(self.surface, center, 1)
+        self.missing = self.images.missing # still being drawn, put it together again next frame
+        chunk_px = CHUNK_SIZE * self.images.tilemap.tile_size
+        self.keys = {(cx, cy) for cx in range(int(self.origin[0] // chunk_px), int((self.origin[0] + self.rect.w / self.scale) // chunk_px) + 1)
+                     for cy in range(int(self.origin[1] // chunk_px), int((self.origin[1] + self.rect.h / self.scale) // chunk_px) + 1)}
+        view = pygame.Rect(0, 0, round(self.view_size[0] * self.scale), round(self.view_size[1] * self.scale))
+        view.center = (self.rect.w // 2, self.rect.h // 2)
+        pygame.draw.rect(self.surface, (255, 0, 0), view, 1)
+        pygame.draw.rect(self.surface, (0, 0, 0), self.surface.get_rect(), 1)
+        return True
+
+    def world_pos(self, window_pos):
+        '''
+        (window pixel on the panel) -> (world pixel it shows)
+        '''
+        return (self.origin[0] + (window_pos[0] - self.rect.x) / self.scale, self.origin[1] + (window_pos[1] - self.rect.y) / self.scale)
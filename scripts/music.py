@@ -0,0 +1,167 @@
+import io
+import sys
+import time
+import threading
+
+import pygame
+
+# load states
+IDLE = 'idle'
+LOADING = 'loading'
+READY = 'ready'
+MISSING = 'missing' # file couldn't be read, playing it is a no-op
+
+class Track:
+    '''
+    a music file read into memory on a background thread
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.state = LOADING
+        self.data = None
+        self.thread = threading.Thread(target=self.read, name='music ' + path, daemon=True)
+        self.thread.start()
+
+    def read(self):
+        try:
+            f = open(self.path, 'rb')
+            self.data = f.read()
+            f.close()
+            self.state = READY
+        except OSError:
+            self.state = MISSING
+
+class MusicPlayer:
+    def __init__(self, enabled=True):
+        '''
+        background music without hitches: tracks are read off disk on a thread ahead of time and
+        pygame's music stream decodes them straight from memory
+        (False -> never touch the mixer, for headless runs)
+        '''
+        self.enabled = enabled
+        self.tracks = {} # path -> Track
+        self.current = None # path of the track playing or waiting to play
+        self.pending = None # (path, loops, volume, fade in ms) waiting for its file to finish loading
+        self.fading_to = None # (path, loops, volume, fade in ms, time the fade out ends)
+        self.cued = None # path of a track to open in the music stream ahead of play() once it's read
+        self.loaded = None # path of the track open in the music stream, play() on it starts without a load
+        self.stream = None # its bytes, the music stream reads them as it plays
+        self.warned = set()
+        self.stats = {'load_ms': 0, 'loaded_on_play': 0}
+
+    def state(self, path):
+        '''
+        (music file) -> (IDLE, LOADING, READY or MISSING)
+        '''
+        return self.tracks[path].state if path in self.tracks else IDLE
+
+    def prefetch(self, path):
+        '''
+        starts reading a track in the background, e.g. during the story screens before gameplay wants it
+        '''
+        if self.enabled and path not in self.tracks:
+            self.tracks[path] = Track(path)
+
+    def cue(self, path):
+        '''
+        reads a track and opens it in the music stream as soon as nothing is playing, so the (slow, format probing)
+        load happens during a story / menu screen and play() only starts it
+        '''
+        if self.enabled:
+            self.prefetch(path)
+            self.cued = path
+            self.update()
+
+    def open(self, path):
+        '''
+        loads a read track into the music stream, replacing whatever was in it
+        (music file) -> (bool, false if pygame can't play it)
+        '''
+        track = self.tracks[path]
+        start = time.perf_counter()
+        try:
+            self.stream = io.BytesIO(track.data)
+            pygame.mixer.music.load(self.stream, path.rsplit('.', 1)[-1])
+        except pygame.error as error:
+            print('music ' + path + " couldn't be played: " + str(error), file=sys.stderr)
+            track.state = MISSING
+            self.warned.add(path)
+            self.loaded = self.stream = None
+            return False
+        self.stats['load_ms'] = round((time.perf_counter() - start) * 1000, 3)
+        self.loaded = path
+        return True
+
+    def play(self, path, loops=-1, volume=1.0, fade_ms=0):
+        '''
+        plays a track, straight away if it's loaded, otherwise as soon as it is, never waits for the disk
+        (music file, times to repeat (-1 -> forever), volume, fade in ms)
+        '''
+        if not self.enabled:
+            return
+        self.prefetch(path)
+        self.current = path
+        self.pending = (path, loops, volume, fade_ms)
+        self.fading_to = None
+        self.update()
+
+    def crossfade(self, path, ms=1000, loops=-1, volume=1.0):
+        '''
+        fades the current track out and the new one in, pygame only has one music stream so the two
+        fades run back to back instead of overlapping
+        (music file, length of each fade in ms, times to repeat, volume)
+        '''
+        if not self.enabled:
+            return
+        self.prefetch(path)
+        if not pygame.mixer.music.get_busy():
+            self.play(path, loops, volume, ms)
+            return
+        pygame.mixer.music.fadeout(ms)
+        self.current = path
+        self.pending = None
+        self.fading_to = (path, loops, volume, ms, pygame.time.get_ticks() + ms)
+
+    def stop(self, fade_ms=0):
+        if not self.enabled:
+            return
+        self.current = None
+        self.pending = None
+        self.fading_to = None
+        if pygame.mixer.music.get_busy():
+            if fade_ms:
+                pygame.mixer.music.fadeout(fade_ms)
+            else:
+                pygame.mixer.music.stop()
+
+    def update(self):
+        '''
+        starts whatever was waiting on a load or a fade out, cheap enough to call every step
+        '''
+        if self.fading_to and pygame.time.get_ticks() >= self.fading_to[4]:
+            self.pending = self.fading_to[:4]
+            self.fading_to = None
+        if self.cued and not self.pending and not self.fading_to:
+            # loading stops whatever's playing, so only while the stream is idle
+            if self.tracks[self.cued].state != LOADING and not pygame.mixer.music.get_busy():
+                if self.tracks[self.cued].state == READY and self.loaded != self.cued:
+                    self.open(self.cued)
+                self.cued = None
+        if not self.pending:
+            return
+        path, loops, volume, fade_ms = self.pending
+        track = self.tracks[path]
+        if track.state == LOADING:
+            return
+        self.pending = None
+        if track.state == MISSING:
+            if path not in self.warned:
+                print('music ' + path + ' not found, playing without it', file=sys.stderr)
+                self.warned.add(path)
+            return
+        if self.loaded != path:
+            self.stats['loaded_on_play'] += 1 # not cued, or cued too late, the load lands on this frame
+            if not self.open(path):
+                return
+        pygame.mixer.music.set_volume(volume)
+        pygame.mixer.music.play(loops, fade_ms=fade_ms)
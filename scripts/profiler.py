@@ -0,0 +1,169 @@
+import csv
+import json
+import time
+from collections import deque
+
+import pygame
+
+FRAME_BUDGET = 1000 / 60 # ms, anything over this line on the overlay missed a 60 fps frame
+
+# stage colours on the overlay, handed out in the order stages first show up
+COLORS = [(230, 80, 80), (80, 200, 90), (90, 140, 240), (240, 200, 60), (200, 90, 220), (70, 210, 210),
+          (240, 140, 50), (160, 160, 160), (120, 230, 150), (250, 120, 170), (150, 110, 240), (200, 200, 120)]
+
+class Stage:
+    '''
+    times one named stage, use through Profiler.stage()
+    '''
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.profiler.current.append((self.name, self.start, time.perf_counter() - self.start))
+        return False
+
+class NoStage:
+    '''
+    what stage() hands out while the profiler is off, costs one attribute lookup
+    '''
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+NO_STAGE = NoStage()
+
+class Profiler:
+    def __init__(self, enabled=False, size=300):
+        '''
+        per stage frame timer with a rolling history
+        (start timing straight away, how many frames to keep)
+        '''
+        self.enabled = enabled
+        self.show_overlay = False
+        self.frames = deque(maxlen=size) # (frame start, [(stage, start, duration), ...]) in seconds
+        self.current = []
+        self.frame_start = 0
+        self.colors = {}
+        self.font = None
+
+    def stage(self, name):
+        '''
+        context manager that times the code inside it as one stage of the current frame
+        (stage name) -> context manager
+        '''
+        if not self.enabled:
+            return NO_STAGE
+        return Stage(self, name)
+
+    def begin_frame(self):
+        if self.enabled:
+            self.current = []
+            self.frame_start = time.perf_counter()
+
+    def end_frame(self):
+        if self.enabled:
+            self.frames.append((self.frame_start, self.current))
+
+    def toggle_overlay(self):
+        '''
+        shows / hides the overlay, turns timing on the first time it's shown
+        '''
+        self.show_overlay = not self.show_overlay
+        if self.show_overlay:
+            self.enabled = True
+
+    def totals(self, stages):
+        '''
+        adds up stages that ran more than once in a frame
+        (list of (stage, start, duration)) -> (dict of {stage: ms})
+        '''
+        totals = {}
+        for name, start, duration in stages:
+            totals[name] = totals.get(name, 0) + duration * 1000
+        return totals
+
+    def averages(self):
+        '''
+        -> (dict of {stage: average ms per frame} over the kept history)
+        '''
+        sums = {}
+        for frame_start, stages in self.frames:
+            for name, ms in self.totals(stages).items():
+                sums[name] = sums.get(name, 0) + ms
+        return {name: total / max(1, len(self.frames)) for name, total in sums.items()}
+
+    def color(self, name):
+        if name not in self.colors:
+            self.colors[name] = COLORS[len(self.colors) % len(COLORS)]
+        return self.colors[name]
+
+    def render_overlay(self, surf, pos=(8, 8), size=(300, 120)):
+        '''
+        draws the history as stacked bars (one per frame, one colour per stage) with the 60 fps budget line
+        (surface, top left, width and height of the graph)
+        '''
+        if not self.show_overlay:
+            return
+        if not self.font:
+            self.font = pygame.font.Font(None, 16)
+
+        scale = size[1] / (FRAME_BUDGET * 2) # px per ms, budget line sits halfway up
+        panel = pygame.Surface((size[0], size[1] + 16 * 7), pygame.SRCALPHA)
+        panel.fill((0, 0, 0, 170))
+
+        bar_width = max(1, size[0] // max(1, self.frames.maxlen))
+        x = size[0] - bar_width * len(self.frames)
+        for frame_start, stages in self.frames:
+            y = size[1]
+            for name, ms in self.totals(stages).items():
+                height = ms * scale
+                pygame.draw.rect(panel, self.color(name), (x, y - height, bar_width, max(1, height)))
+                y -= height
+            x += bar_width
+
+        budget_y = size[1] - FRAME_BUDGET * scale
+        pygame.draw.line(panel, (255, 255, 255), (0, budget_y), (size[0], budget_y))
+        panel.blit(self.font.render('16.6 ms', True, (255, 255, 255)), (2, budget_y - 12))
+
+        averages = sorted(self.averages().items(), key=lambda item: -item[1])
+        for i, (name, ms) in enumerate(averages[:14]):
+            text_pos = (4 + (i % 2) * size[0] // 2, size[1] + 4 + (i // 2) * 16)
+            pygame.draw.rect(panel, self.color(name), (text_pos[0], text_pos[1] + 2, 8, 8))
+            panel.blit(self.font.render(f'{name} {ms:.2f}', True, (255, 255, 255)), (text_pos[0] + 12, text_pos[1]))
+
+        surf.blit(panel, pos)
+
+    def export(self, path):
+        '''
+        writes the kept history, .csv gives one row per stage, anything else gives a chrome trace
+        json (open in chrome://tracing, perfetto or speedscope)
+        (file path)
+        '''
+        if not self.frames:
+            return
+        origin = self.frames[0][0]
+        if path.endswith('.csv'):
+            f = open(path, 'w', newline='')
+            writer = csv.writer(f)
+            writer.writerow(['frame', 'stage', 'start_ms', 'duration_ms'])
+            for i, (frame_start, stages) in enumerate(self.frames):
+                for name, start, duration in stages:
+                    writer.writerow([i, name, round((start - origin) * 1000, 4), round(duration * 1000, 4)])
+            f.close()
+        else:
+            events = []
+            for i, (frame_start, stages) in enumerate(self.frames):
+                end = max([start + duration for name, start, duration in stages] or [frame_start])
+                events.append({'name': 'frame', 'ph': 'X', 'pid': 0, 'tid': 0, 'ts': (frame_start - origin) * 1e6, 'dur': (end - frame_start) * 1e6, 'args': {'frame': i}})
+                for name, start, duration in stages:
+                    events.append({'name': name, 'ph': 'X', 'pid': 0, 'tid': 0, 'ts': (start - origin) * 1e6, 'dur': duration * 1e6})
+            f = open(path, 'w')
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+            f.close()
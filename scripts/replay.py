@@ -0,0 +1,204 @@
+import struct
+
+import pygame
+
+from scripts.inputs import ACTIONS, UI_ACTIONS, InputSource
+
+# file layout, all little endian:
+#   header      magic, version, seed, start level, flags, steps, checkpoint interval
+#   actions     count, then (varint step delta, u16 action bitmask) for every step that had input
+#   checkpoints count, then (varint step delta, 8 byte state hash)
+MAGIC = b'TTHR'
+VERSION = 1
+HEADER = struct.Struct('<4sBQhBII')
+MASK = struct.Struct('<H')
+COUNT = struct.Struct('<I')
+HASH_SIZE = 8
+
+FLAG_SKIP_INTRO = 1
+
+def write_varint(out, value):
+    '''
+    appends an unsigned int using 7 bits per byte
+    (bytearray, int)
+    '''
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def read_varint(data, pos):
+    '''
+    (bytes, offset) -> (value, new offset)
+    '''
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+def encode_actions(actions):
+    '''
+    (list of action names) -> (bitmask)
+    '''
+    mask = 0
+    for action in actions:
+        mask |= 1 << ACTIONS.index(action)
+    return mask
+
+def decode_actions(mask):
+    '''
+    (bitmask) -> (list of action names, in ACTIONS order)
+    '''
+    return [action for i, action in enumerate(ACTIONS) if mask & (1 << i)]
+
+class Recording:
+    '''
+    a run's seed, start level, per step input and state hashes
+    '''
+    def __init__(self, seed, level=0, skip_intro=False, checkpoint_interval=60):
+        self.seed = seed
+        self.level = level
+        self.skip_intro = skip_intro
+        self.checkpoint_interval = checkpoint_interval
+        self.steps = 0
+        self.frames = {} # step -> action bitmask, only steps that had input
+        self.checkpoints = {} # step -> state hash
+
+    def save(self, path):
+        '''
+        writes the recording in its compact binary form
+        (file path)
+        '''
+        out = bytearray(HEADER.pack(MAGIC, VERSION, self.seed, self.level, FLAG_SKIP_INTRO if self.skip_intro else 0, self.steps, self.checkpoint_interval))
+
+        out += COUNT.pack(len(self.frames))
+        last = 0
+        for tick in sorted(self.frames):
+            write_varint(out, tick - last)
+            out += MASK.pack(self.frames[tick])
+            last = tick
+
+        out += COUNT.pack(len(self.checkpoints))
+        last = 0
+        for tick in sorted(self.checkpoints):
+            write_varint(out, tick - last)
+            out += self.checkpoints[tick]
+            last = tick
+
+        f = open(path, 'wb')
+        f.write(out)
+        f.close()
+
+    @classmethod
+    def load(cls, path):
+        '''
+        (file path) -> Recording
+        '''
+        f = open(path, 'rb')
+        data = f.read()
+        f.close()
+
+        magic, version, seed, level, flags, steps, interval = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(path + ' is not a version ' + str(VERSION) + ' recording')
+        recording = cls(seed, level, bool(flags & FLAG_SKIP_INTRO), interval)
+        recording.steps = steps
+        pos = HEADER.size
+
+        count = COUNT.unpack_from(data, pos)[0]
+        pos += COUNT.size
+        tick = 0
+        for i in range(count):
+            delta, pos = read_varint(data, pos)
+            tick += delta
+            recording.frames[tick] = MASK.unpack_from(data, pos)[0]
+            pos += MASK.size
+
+        count = COUNT.unpack_from(data, pos)[0]
+        pos += COUNT.size
+        tick = 0
+        for i in range(count):
+            delta, pos = read_varint(data, pos)
+            tick += delta
+            recording.checkpoints[tick] = data[pos:pos + HASH_SIZE]
+            pos += HASH_SIZE
+        return recording
+
+class InputRecorder(InputSource):
+    '''
+    passes another input source through, writing down every step's actions and periodic state hashes
+    '''
+    def __init__(self, source, recording, path):
+        '''
+        (input source being recorded, Recording to fill, file to save it to on close)
+        '''
+        self.source = source
+        self.recording = recording
+        self.path = path
+        self.last_tick = -1
+
+    def poll(self, tick):
+        if tick <= self.last_tick: # rewound or retried, the steps from here on were undone
+            self.recording.frames = {step: mask for step, mask in self.recording.frames.items() if step < tick}
+            self.recording.checkpoints = {step: digest for step, digest in self.recording.checkpoints.items() if step <= tick}
+        self.last_tick = tick
+        actions = self.source.poll(tick)
+        recorded = [action for action in actions if action not in UI_ACTIONS] # closing the window isn't part of the run
+        if recorded:
+            self.recording.frames[tick] = encode_actions(recorded)
+        return actions
+
+    def step_done(self, game):
+        self.recording.steps = game.tick
+        if game.tick % self.recording.checkpoint_interval == 0:
+            self.recording.checkpoints[game.tick] = game.state_hash()
+
+    def done(self, tick):
+        return self.source.done(tick)
+
+    def close(self):
+        self.source.close()
+        self.recording.save(self.path)
+
+class ReplayInput(InputSource):
+    '''
+    feeds a recording back step for step and checks the state hashes along the way
+    '''
+    def __init__(self, recording):
+        self.recording = recording
+        self.mismatches = [] # steps whose state hash didn't match
+        self.checked = 0
+
+    def poll(self, tick):
+        actions = []
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT: # window can still be closed mid replay
+                actions.append('quit')
+        if tick in self.recording.frames:
+            actions += decode_actions(self.recording.frames[tick])
+        return actions
+
+    def step_done(self, game):
+        expected = self.recording.checkpoints.get(game.tick)
+        if expected is not None:
+            self.checked += 1
+            if game.state_hash() != expected:
+                self.mismatches.append(game.tick)
+
+    def done(self, tick):
+        '''
+        (simulation step number) -> (bool, true once every recorded step has been fed back)
+        '''
+        return tick >= self.recording.steps
+
+    def report(self, tick):
+        '''
+        (step the replay stopped at) -> (one line summary, the first step that went out of sync if any did)
+        '''
+        stopped = '' if self.done(tick) else f' (stopped early, recording has {self.recording.steps})'
+        return f'replayed {tick} steps{stopped}, {self.checked} checkpoints, ' + (f'DESYNC at step {self.mismatches[0]}' if self.mismatches else 'in sync')
@@ -0,0 +1,169 @@
+import marshal
+import struct
+from array import array
+from collections import deque
+
+from scripts.particle import Particle
+from scripts.spark import Spark
+from scripts.clouds import Cloud
+from scripts.levels import ENTITY_LISTS
+
+# blob layout: header (magic, version, simulation step) then the marshalled state tuple
+MAGIC = b'TTSN'
+VERSION = 1
+HEADER = struct.Struct('<4sBI')
+MARSHAL_VERSION = 4
+
+# Game attributes that are plain values
+GAME_FIELDS = ['tick', 'level', 'story_timer', 'bad_ending', 'win_delay', 'transition', 'dead', 'wind', 'pickup', 'screenshake', 'music', 'scroll', 'prev_scroll', 'movement']
+# entity attributes that never change or can't be saved, the animation is saved as (frame, done) next to the rest
+ENTITY_SKIP = {'game', 'animation', 'type', 'anim_offset'}
+
+def pack_rng(state):
+    '''
+    (random.Random.getstate()) -> (same thing with the 625 word table as 2.5 KiB of bytes instead of a tuple of ints)
+    '''
+    version, table, gauss = state
+    return version, array('I', table).tobytes(), gauss
+
+def unpack_rng(packed):
+    version, table, gauss = packed
+    return version, tuple(array('I', table)), gauss
+
+def entity_state(entity):
+    '''
+    (PhysicsEntity) -> (dict of its attributes, animation frame, animation done)
+    '''
+    return {key: value for key, value in vars(entity).items() if key not in ENTITY_SKIP}, entity.animation.frame, entity.animation.done
+
+def apply_entity(entity, state):
+    '''
+    puts a saved entity state back onto an entity of the same class
+    '''
+    fields, frame, done = state
+    entity.set_action(fields['action'])
+    vars(entity).update(fields)
+    entity.animation.frame = frame
+    entity.animation.done = done
+
+def snapshot(game):
+    '''
+    the whole simulation state, taken between two steps
+    (Game) -> (bytes)
+    '''
+    state = (
+        tuple(getattr(game, field) for field in GAME_FIELDS),
+        pack_rng(game.rng.getstate()),
+        pack_rng(game.render_rng.getstate()),
+        entity_state(game.player),
+        tuple(tuple(entity_state(entity) for entity in getattr(game, name)) for name, cls in ENTITY_LISTS),
+        game.projectiles,
+        tuple((spark.pos, spark.angle, spark.speed) for spark in game.sparks),
+        tuple((p.type, p.pos, p.velocity, p.frame, p.animation.frame, p.animation.done) for p in game.particles),
+        tuple((cloud.pos, cloud.speed, cloud.depth, game.assets['clouds'].index(cloud.img)) for cloud in game.clouds.clouds), # they were placed by the seed
+    )
+    return HEADER.pack(MAGIC, VERSION, game.tick) + marshal.dumps(state, MARSHAL_VERSION) # marshal copies every list on the way out
+
+def restore(game, blob):
+    '''
+    puts the game back exactly where a snapshot was taken, in place, the level is only rebuilt if the snapshot is from another one
+    (Game, bytes from snapshot())
+    '''
+    magic, version, tick = HEADER.unpack_from(blob, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('not a version ' + str(VERSION) + ' snapshot')
+    fields, rng, render_rng, player, entities, projectiles, sparks, particles, clouds = marshal.loads(blob[HEADER.size:])
+
+    level = fields[GAME_FIELDS.index('level')]
+    if level != game.level:
+        game.level = level
+        game.load_level(level) # tilemap and fresh entities, everything else is overwritten below
+
+    for field, value in zip(GAME_FIELDS, fields):
+        setattr(game, field, value)
+    game.rng.setstate(unpack_rng(rng))
+    game.render_rng.setstate(unpack_rng(render_rng))
+
+    apply_entity(game.player, player)
+    for (name, cls), states in zip(ENTITY_LISTS, entities):
+        current = getattr(game, name)
+        if len(current) != len(states): # something spawned or was added since (benchmark stress), make the list match
+            current = [current[i] if i < len(current) else cls(game, state[0]['pos'], state[0]['size']) for i, state in enumerate(states)]
+            setattr(game, name, current)
+        for entity, state in zip(current, states):
+            apply_entity(entity, state)
+
+    game.projectiles = projectiles
+    game.sparks = [Spark(pos, angle, speed) for pos, angle, speed in sparks]
+    game.particles = []
+    for p_type, pos, velocity, frame, anim_frame, done in particles:
+        particle = Particle(game, p_type, pos, velocity, frame)
+        particle.animation.frame = anim_frame
+        particle.animation.done = done
+        game.particles.append(particle)
+    game.clouds.clouds = [Cloud(pos, game.assets['clouds'][img], speed, depth) for pos, speed, depth, img in clouds]
+
+    game.audio.stop() # sounds from the future, and their cooldowns
+
+def save(blob, path):
+    f = open(path, 'wb')
+    f.write(blob)
+    f.close()
+
+def load(path):
+    '''
+    (file path) -> (bytes for restore())
+    '''
+    f = open(path, 'rb')
+    blob = f.read()
+    f.close()
+    return blob
+
+class SnapshotHistory:
+    '''
+    the last few seconds of snapshots for rewinding, plus named checkpoints that stay until replaced
+    '''
+    def __init__(self, size=300):
+        '''
+        (snapshots kept, one per step so 300 -> 5 seconds at 60 steps per second)
+        '''
+        self.ring = deque(maxlen=size)
+        self.checkpoints = {} # name -> snapshot
+        self.stats = {'taken': 0, 'bytes': 0, 'rewinds': 0}
+
+    def record(self, game):
+        '''
+        called after a step, keeps the newest snapshot and drops the oldest
+        '''
+        blob = snapshot(game)
+        self.ring.append(blob)
+        self.stats['taken'] += 1
+        self.stats['bytes'] = len(blob)
+
+    def rewind(self, game, steps):
+        '''
+        goes back up to steps simulation steps, or as far as the ring reaches
+        (Game, steps) -> (steps actually rewound)
+        '''
+        if not self.ring:
+            return 0
+        steps = min(steps, len(self.ring) - 1)
+        for i in range(steps):
+            self.ring.pop()
+        restore(game, self.ring[-1])
+        self.stats['rewinds'] += 1
+        return steps
+
+    def checkpoint(self, game, name='checkpoint'):
+        self.checkpoints[name] = snapshot(game)
+
+    def retry(self, game, name='checkpoint'):
+        '''
+        back to a checkpoint, the ring is cleared since it holds a different timeline
+        (Game, checkpoint name) -> (bool, false when there's no such checkpoint)
+        '''
+        if name not in self.checkpoints:
+            return False
+        restore(game, self.checkpoints[name])
+        self.ring.clear()
+        return True
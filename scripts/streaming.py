@@ -0,0 +1,219 @@
+import os
+import struct
+import marshal
+from concurrent.futures import ThreadPoolExecutor
+
+import pygame
+
+from scripts.tilemap import Tilemap
+
+CHUNK_SIZE = 16 # tiles per chunk side
+DECOR_MARGIN = 8 # tiles around the view kept resident for offgrid decor, the biggest (the prize rope) is 132px tall
+EVICT_MARGIN = 2 # chunks past a focus point's radius before its chunks are dropped, so a point going back and forth
+                 # over a chunk edge doesn't load and evict the same chunks every step (radius 0 points included)
+
+# chunk file: header (magic, version, chunk x, chunk y) then the marshalled chunk dict
+# level file (level.bin next to the chunks): same header with chunk 0, 0 then tile size, spawn table, metadata and chunk list
+MAGIC = b'TTCH'
+VERSION = 1
+HEADER = struct.Struct('<4sBii')
+MARSHAL_VERSION = 4
+LEVEL_FILE = 'level.bin'
+
+pool = None # the chunk loading thread, started by the first streamed level so games that don't stream never have it
+
+def get_pool():
+    global pool
+    if pool is None:
+        pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='chunks')
+    return pool
+
+def chunk_of(tile_x, tile_y):
+    '''
+    (tile coordinates) -> (chunk coordinates)
+    '''
+    return tile_x // CHUNK_SIZE, tile_y // CHUNK_SIZE
+
+def chunk_name(key):
+    return str(key[0]) + '_' + str(key[1]) + '.bin'
+
+def write_file(path, key, data):
+    f = open(path, 'wb')
+    f.write(HEADER.pack(MAGIC, VERSION, key[0], key[1]) + marshal.dumps(data, MARSHAL_VERSION))
+    f.close()
+
+def read_file(path):
+    '''
+    (chunk or level file) -> (its dict)
+    '''
+    f = open(path, 'rb')
+    data = f.read()
+    f.close()
+    magic, version, x, y = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(path + ' is not a version ' + str(VERSION) + ' level chunk, rebuild with python -m scripts.levels')
+    return marshal.loads(data[HEADER.size:])
+
+def write_chunks(bundle, out):
+    '''
+    splits a compiled level bundle (scripts/levels.py) into chunk files, offgrid tiles go in the chunk their position is in
+    and keep their index so decor still draws in the original order
+    (bundle dict, output folder) -> (list of chunk keys written)
+    '''
+    os.makedirs(out, exist_ok=True)
+    for name in os.listdir(out): # chunks that don't exist any more
+        if name.endswith('.bin'):
+            os.remove(os.path.join(out, name))
+
+    chunks = {}
+    for loc, tile in bundle['tilemap'].items():
+        chunk = chunks.setdefault(chunk_of(tile['pos'][0], tile['pos'][1]), {'tilemap': {}, 'offgrid': [], 'solid': {}})
+        chunk['tilemap'][loc] = tile
+        if loc in bundle['solid']:
+            chunk['solid'][loc] = bundle['solid'][loc]
+    for i, tile in enumerate(bundle['offgrid']):
+        key = chunk_of(int(tile['pos'][0] // bundle['tile_size']), int(tile['pos'][1] // bundle['tile_size']))
+        chunks.setdefault(key, {'tilemap': {}, 'offgrid': [], 'solid': {}})['offgrid'].append((i, tile))
+
+    for key, chunk in chunks.items():
+        write_file(os.path.join(out, chunk_name(key)), key, chunk)
+    keys = sorted(chunks)
+    write_file(os.path.join(out, LEVEL_FILE), (0, 0), {'tile_size': bundle['tile_size'], 'spawns': bundle['spawns'], 'meta': bundle['meta'], 'chunks': keys})
+    return keys
+
+def load_chunk(path):
+    '''
+    runs on the streaming thread
+    (chunk file) -> (dict of tiles, offgrid (index, tile) pairs and collision Rects)
+    '''
+    chunk = read_file(path)
+    chunk['solid'] = {loc: pygame.Rect(rect) for loc, rect in chunk['solid'].items()}
+    return chunk
+
+class StreamedTilemap(Tilemap):
+    '''
+    a Tilemap that only holds the chunks near the camera / player, the rest stay on disk
+
+    tilemap / solid / offgrid_tiles only ever contain resident chunks, queries make sure the chunks they look at are resident
+    first (loading on the spot if the streaming thread hasn't got to them yet), so physics and rendering work the same as with
+    the whole map in memory
+    '''
+    def __init__(self, game, path, radius=2, margin=EVICT_MARGIN):
+        '''
+        (game, folder written by write_chunks, chunks loaded around each focus point,
+         chunks further out than that before they're dropped again)
+        '''
+        level = read_file(os.path.join(path, LEVEL_FILE))
+        super().__init__(game, tile_size=level['tile_size'])
+        self.path = path
+        self.radius = radius
+        self.margin = margin
+        self.spawns = level['spawns']
+        self.meta = level['meta']
+        self.available = set(level['chunks']) # chunks that have a file, everything else is empty space
+        self.resident = {} # chunk key -> chunk dict
+        self.pending = {} # chunk key -> Future of load_chunk
+        self.offgrid_dirty = False
+        self.stats = {'loaded': 0, 'sync_loads': 0, 'evicted': 0}
+
+    def stream(self, points):
+        '''
+        called once per step, starts loading chunks within the radius of any focus point and drops the ones
+        more than margin chunks further out
+        (list of (pixel position, radius in chunks or None for the default))
+        '''
+        self.collect()
+        wanted = set()
+        keep = set()
+        for pos, radius in points:
+            radius = self.radius if radius is None else radius
+            cx, cy = chunk_of(int(pos[0] // self.tile_size), int(pos[1] // self.tile_size))
+            reach = radius + self.margin
+            for x in range(cx - reach, cx + reach + 1):
+                for y in range(cy - reach, cy + reach + 1):
+                    keep.add((x, y))
+                    if abs(x - cx) <= radius and abs(y - cy) <= radius:
+                        wanted.add((x, y))
+
+        for key in wanted:
+            if key in self.available and key not in self.resident and key not in self.pending:
+                self.pending[key] = get_pool().submit(load_chunk, os.path.join(self.path, chunk_name(key)))
+        for key in [key for key in self.resident if key not in keep]:
+            self.evict(key)
+        for key in [key for key in self.pending if key not in keep]:
+            self.pending.pop(key).cancel()
+
+    def collect(self):
+        '''
+        merges whatever the streaming thread finished
+        '''
+        for key in [key for key, future in self.pending.items() if future.done()]:
+            self.merge(key, self.pending.pop(key).result())
+
+    def merge(self, key, chunk):
+        self.resident[key] = chunk
+        self.tilemap.update(chunk['tilemap'])
+        self.solid.update(chunk['solid'])
+        if chunk['offgrid']:
+            self.offgrid_dirty = True
+        self.stats['loaded'] += 1
+
+    def evict(self, key):
+        chunk = self.resident.pop(key)
+        for loc in chunk['tilemap']:
+            del self.tilemap[loc]
+        for loc in chunk['solid']:
+            del self.solid[loc]
+        if chunk['offgrid']:
+            self.offgrid_dirty = True
+        self.stats['evicted'] += 1
+
+    def ensure(self, x0, y0, x1, y1):
+        '''
+        makes every chunk overlapping a range of tiles resident, waiting on / doing the load if it has to
+        (first tile x, first tile y, last tile x, last tile y)
+        '''
+        cx0, cy0 = chunk_of(x0, y0)
+        cx1, cy1 = chunk_of(x1, y1)
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                key = (cx, cy)
+                if key in self.resident or key not in self.available:
+                    continue
+                if key in self.pending:
+                    chunk = self.pending.pop(key).result()
+                else:
+                    chunk = load_chunk(os.path.join(self.path, chunk_name(key)))
+                self.stats['sync_loads'] += 1
+                self.merge(key, chunk)
+        if self.offgrid_dirty:
+            pairs = sorted((pair for chunk in self.resident.values() for pair in chunk['offgrid']), key=lambda pair: pair[0])
+            self.offgrid_tiles = [tile for i, tile in pairs]
+            self.offgrid_dirty = False
+
+    def tiles_around(self, pos):
+        tile_loc = (int(pos[0] // self.tile_size), int(pos[1] // self.tile_size))
+        self.ensure(tile_loc[0] - 1, tile_loc[1] - 1, tile_loc[0] + 1, tile_loc[1] + 1)
+        return super().tiles_around(pos)
+
+    def physics_rects_around(self, pos):
+        tile_loc = (int(pos[0] // self.tile_size), int(pos[1] // self.tile_size))
+        self.ensure(tile_loc[0] - 1, tile_loc[1] - 1, tile_loc[0] + 1, tile_loc[1] + 1)
+        return super().physics_rects_around(pos)
+
+    def solid_check(self, pos):
+        tile_loc = (int(pos[0] // self.tile_size), int(pos[1] // self.tile_size))
+        self.ensure(tile_loc[0], tile_loc[1], tile_loc[0], tile_loc[1])
+        return super().solid_check(pos)
+
+    def render(self, surf, offset=(0, 0)):
+        # with a margin so offgrid decor hanging over from a neighbouring chunk is there too
+        self.ensure(offset[0] // self.tile_size - DECOR_MARGIN, offset[1] // self.tile_size - DECOR_MARGIN,
+                    (offset[0] + surf.get_width()) // self.tile_size + DECOR_MARGIN, (offset[1] + surf.get_height()) // self.tile_size + DECOR_MARGIN)
+        super().render(surf, offset=offset)
+
+    def report(self):
+        '''
+        -> (dict of resident / pending chunk counts, tiles in memory and load stats)
+        '''
+        return dict(self.stats, resident=len(self.resident), pending=len(self.pending), tiles=len(self.tilemap), chunks=len(self.available))
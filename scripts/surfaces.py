@@ -0,0 +1,66 @@
+import pygame
+
+BLACK = (0, 0, 0) # black has always been the transparent colour for tiles, particles and UI, on top of the png's own alpha
+# keys for images that draw their black pixels (entity frames), the first one the image doesn't use wins
+SPARE_KEYS = [(255, 0, 255), (0, 255, 255), (255, 255, 0), (1, 2, 3), (254, 1, 253)]
+
+# cheapest first
+OPAQUE = 'opaque' # display format, straight copy blits
+COLORKEY = 'colorkey' # display format + colorkey, RLE encoded when it's drawn whole
+ALPHA = 'alpha' # per pixel alpha, only for images with soft edges
+
+def bake_colorkey(img, colorkey):
+    '''
+    turns the colorkey into real transparency, any alpha, so one format can describe the whole image
+    (32 bit RGBA Surface, colour) -> (copy with those pixels at alpha 0)
+    '''
+    img = img.copy()
+    keyed = pygame.mask.from_threshold(img, tuple(colorkey) + (128,), (1, 1, 1, 255))
+    keyed.to_surface(surface=img, setcolor=(0, 0, 0, 0), unsetcolor=None)
+    return img
+
+def spare_key(img, visible):
+    '''
+    (32 bit RGBA Surface, mask of its visible pixels) -> (a colour none of the visible pixels use)
+    '''
+    for key in SPARE_KEYS:
+        if not pygame.mask.from_threshold(img, key + (128,), (1, 1, 1, 255)).overlap_area(visible, (0, 0)):
+            return key
+    raise ValueError('image uses every spare colorkey')
+
+def classify(img):
+    '''
+    works out the cheapest format that draws the image exactly like per pixel alpha does
+    (32 bit RGBA Surface) -> (OPAQUE, COLORKEY or ALPHA, colorkey or None, the image flattened onto it or None)
+    '''
+    visible = pygame.mask.from_surface(img, 0) # alpha > 0
+    solid = pygame.mask.from_surface(img, 254).count() # alpha == 255
+    if visible.count() != solid: # partly transparent pixels need real blending
+        return ALPHA, None, None
+
+    # every pixel is either fully there or fully gone, gone ones become the colorkey
+    key = BLACK if not pygame.mask.from_threshold(img, BLACK + (128,), (1, 1, 1, 255)).overlap_area(visible, (0, 0)) else spare_key(img, visible)
+    flat = pygame.Surface(img.get_size())
+    flat.fill(key)
+    flat.blit(img, (0, 0))
+    if solid == img.get_width() * img.get_height():
+        return OPAQUE, None, flat
+    return COLORKEY, key, flat
+
+def prepare(img, colorkey=BLACK, rle=True):
+    '''
+    converts a decoded image to the display format it's cheapest to blit in, drawing exactly what
+    convert_alpha() + set_colorkey(colorkey) would
+    (32 bit RGBA Surface, colour that's transparent (None -> only the png's alpha),
+     RLE encode colorkeyed images (not for sheets that get cut into subsurfaces)) -> (Surface, format)
+    '''
+    kind, key, flat = classify(bake_colorkey(img, colorkey) if colorkey is not None else img)
+    if kind == ALPHA:
+        surf = img.convert_alpha()
+        if colorkey is not None:
+            surf.set_colorkey(colorkey)
+    else:
+        surf = flat.convert()
+        if kind == COLORKEY:
+            surf.set_colorkey(key, pygame.RLEACCEL if rle else 0)
+    return surf, kind
@@ -1,4 +1,7 @@
+import os
 import json
+from itertools import islice
+
 import pygame
 
 # depends on order location that we are rendering the tiles, tuple(sorted() solves this, + we can't use list as a key therefore tuple
@@ -13,10 +16,34 @@ AUTOTILE_MAP = {
     tuple(sorted([(1, 0), (0, -1), (0, 1)])): 7,
     tuple(sorted([(1, 0), (-1, 0), (0, 1), (0, -1)])): 8,
 }
+AUTOTILE_SETS = {frozenset(neighbors): variant for neighbors, variant in AUTOTILE_MAP.items()}
 NEIGHBOR_OFFSET = [(-1, 0), (-1, -1), (0, -1), (1, -1), (1, 0), (0, 0), (-1, 1), (0, 1), (1, 1)]
 PHYSICS_TILES = {'grass', 'stone'}
 AUTOTILE_TYPES = {'grass', 'stone'}
 
+def write_map(path, tilemap, tile_size, offgrid, batch=1000):
+    '''
+    writes a map in the editor's json format through a temporary file, so a crash part way leaves the old file as it was,
+    the tiles are encoded a batch at a time (same text as one json.dump) so a background thread saving a big map
+    lets go of the GIL between batches instead of freezing the editor for the whole map
+    (file path, dict of location -> tile, tile size, list of offgrid tiles, tiles per batch)
+    '''
+    items = iter(tilemap.items()) # no list of (loc, tile) pairs, tens of thousands of new tuples would set off a full gc pass
+    tmp = path + '.tmp'
+    f = open(tmp, 'w')
+    f.write('{"tilemap": {')
+    part = dict(islice(items, batch))
+    while part:
+        f.write(json.dumps(part)[1:-1])
+        part = dict(islice(items, batch))
+        if part:
+            f.write(', ')
+    f.write('}, "tile_size": ' + json.dumps(tile_size) + ', "offgrid": ' + json.dumps(offgrid) + '}')
+    f.flush()
+    os.fsync(f.fileno())
+    f.close()
+    os.replace(tmp, path)
+
 class Tilemap:
     def __init__(self, game, tile_size=16):
         '''
@@ -27,6 +54,7 @@ class Tilemap:
         self.tile_size = tile_size
         self.tilemap = {} # map tile based on location, using a dictionary for conveince (dont have to fill in all the space like lists) 
         self.offgrid_tiles = []
+        self.solid = {} # location -> pixel Rect of every physics tile, baked once per level, nothing may move the rects
 
     def extract(self, id_pairs, keep=False):
         '''
@@ -74,9 +102,7 @@ class Tilemap:
         saves the tile map
         (file path to save to)
         '''
-        f = open(path, 'w') # open file
-        json.dump({'tilemap': self.tilemap, 'tile_size': self.tile_size, 'offgrid': self.offgrid_tiles}, f) # dump object into file
-        f.close()
+        write_map(path, self.tilemap, self.tile_size, self.offgrid_tiles)
     
     def load(self, path):
         '''
@@ -90,6 +116,16 @@ class Tilemap:
         self.tilemap = map_data['tilemap']
         self.tile_size = map_data['tile_size']
         self.offgrid_tiles = map_data['offgrid']
+        self.bake_collision()
+
+    def bake_collision(self):
+        '''
+        works out the collision rects from the tiles, again whenever tiles change
+        '''
+        self.solid = {}
+        for loc, tile in self.tilemap.items():
+            if tile['type'] in PHYSICS_TILES:
+                self.solid[loc] = pygame.Rect(tile['pos'][0] * self.tile_size, tile['pos'][1] * self.tile_size, self.tile_size, self.tile_size)
 
     def solid_check(self, pos):
         '''
@@ -97,36 +133,51 @@ class Tilemap:
         (pos: tuple) -> (str)
         '''
         tile_loc = str(int(pos[0] // self.tile_size)) + ';' + str(int(pos[1] // self.tile_size)) # gives tile location
-        if tile_loc in self.tilemap:
-            if self.tilemap[tile_loc]['type'] in PHYSICS_TILES:
-                return self.tilemap[tile_loc]
+        if tile_loc in self.solid:
+            return self.tilemap[tile_loc]
     
-    def autotile(self):
+    def autotile_locs(self, cells):
+        '''
+        (list of (x, y) cells that changed) -> (dict of location -> tile for the tiles whose variant can depend on them, the cells and their 4 neighbours)
+        '''
+        tilemap = self.tilemap
+        locs = {}
+        for x, y in cells:
+            for loc in (str(x) + ';' + str(y), str(x + 1) + ';' + str(y), str(x - 1) + ';' + str(y), str(x) + ';' + str(y - 1), str(x) + ';' + str(y + 1)):
+                if loc in tilemap:
+                    locs[loc] = tilemap[loc]
+        return locs
+
+    def autotile(self, locs=None):
         '''
         auto tiles depending on it's neightbors
+        (dict of location -> tile to redo, from autotile_locs after an edit (None -> the whole map))
         '''
-        for loc in self.tilemap:
-            tile = self.tilemap[loc]
+        tilemap = self.tilemap
+        for tile in (tilemap if locs is None else locs).values():
+            if tile['type'] not in AUTOTILE_TYPES: # nothing to work out for the rest, a bulk fill can be thousands of them
+                continue
+            x, y = tile['pos']
             neighbors = set()
-            for shift in [(1, 0), (-1, 0), (0, -1), (0, 1)]:
-                check_loc = str(tile['pos'][0] + shift[0]) + ';' + str(tile['pos'][1] + shift[1])
-                if check_loc in self.tilemap:
-                    if self.tilemap[check_loc]['type'] == tile['type']: # check if neighbors are same type/group
+            for shift, check_loc in (((1, 0), str(x + 1) + ';' + str(y)), ((-1, 0), str(x - 1) + ';' + str(y)), ((0, -1), str(x) + ';' + str(y - 1)), ((0, 1), str(x) + ';' + str(y + 1))):
+                if check_loc in tilemap:
+                    if tilemap[check_loc]['type'] == tile['type']: # check if neighbors are same type/group
                         neighbors.add(shift)
-            neighbors = tuple(sorted(neighbors)) #tuple(sorted() solves this, + we can't use list as a key therefore tuple
-            if (tile['type'] in AUTOTILE_TYPES) and (neighbors in AUTOTILE_MAP):
-                tile['variant'] = AUTOTILE_MAP[neighbors]
+            neighbors = frozenset(neighbors) # same as AUTOTILE_MAP's sorted tuples without sorting every tile
+            if neighbors in AUTOTILE_SETS:
+                tile['variant'] = AUTOTILE_SETS[neighbors]
 
-    
     def physics_rects_around(self, pos):
         '''
         filters nearby tiles to check if they have physics
         (position) -> (list of rectangles) 
         '''
         rects = []
-        for tile in self.tiles_around(pos):
-            if tile['type'] in PHYSICS_TILES:
-                rects.append(pygame.Rect(tile['pos'][0] * self.tile_size, tile['pos'][1] * self.tile_size, self.tile_size, self.tile_size))
+        tile_loc = (int(pos[0] // self.tile_size), int(pos[1] // self.tile_size))
+        for offset in NEIGHBOR_OFFSET:
+            check_loc = str(tile_loc[0] + offset[0]) + ';' + str(tile_loc[1] + offset[1])
+            if check_loc in self.solid:
+                rects.append(self.solid[check_loc])
         return rects
 
     def render(self, surf, offset=(0, 0)):
@@ -135,8 +186,10 @@ class Tilemap:
         (screen surface)
         '''
         # rendering offgrid tiles, decor gets rendered first (behind the actual tiles)
+        # everything is queued and handed to blits() in one call instead of one blit call per tile
+        blits = []
         for tile in self.offgrid_tiles:
-            surf.blit(self.game.assets[tile['type']][tile['variant']], (tile['pos'][0] - offset[0], tile['pos'][1] - offset[1]))
+            blits.append((self.game.assets[tile['type']][tile['variant']], (tile['pos'][0] - offset[0], tile['pos'][1] - offset[1])))
 
         # for x in range(top left tile x position [tile coord], to top  right edge of screen [tile coord])
         for x in range(offset[0] // self.tile_size, (offset[0] + surf.get_width()) // self.tile_size + 1):
@@ -146,6 +199,7 @@ class Tilemap:
                     tile = self.tilemap[loc]
                     # pos * tile size bc it's in terms of grid within tilemap currently, we want position in terms of pixels
                     # (tile in assets, rendering pos)
-                    surf.blit(self.game.assets[tile['type']][tile['variant']], (tile['pos'][0] * self.tile_size - offset[0], tile['pos'][1] * self.tile_size - offset[1]))
+                    blits.append((self.game.assets[tile['type']][tile['variant']], (tile['pos'][0] * self.tile_size - offset[0], tile['pos'][1] * self.tile_size - offset[1])))
                     # for hitbox testing
-                    # pygame.draw.rect(surf, (255, 0, 0), (tile['pos'][0] * self.tile_size  - offset[0], tile['pos'][1] * self.tile_size - offset[1], self.tile_size, self.tile_size), 1)
\ No newline at end of file
+                    # pygame.draw.rect(surf, (255, 0, 0), (tile['pos'][0] * self.tile_size  - offset[0], tile['pos'][1] * self.tile_size - offset[1], self.tile_size, self.tile_size), 1)
+        surf.blits(blits, doreturn=False)
\ No newline at end of file
@@ -1,36 +1,90 @@
 import os
+import time
 
 import pygame
 
+from scripts.atlas import Atlas
+from scripts.assetcache import get_cache
+from scripts import loader
+from scripts.surfaces import BLACK, prepare
+
 BASE_IMG_PATH = 'data/images/'
+SFX_PATH = 'data/sfx/'
 
 
 # BASE_IMG_PATH = '/data/images/' <-- Use when building game
 
-def load_image(path):
-    img = pygame.image.load(BASE_IMG_PATH + path).convert_alpha()
-    img.set_colorkey((0, 0, 0))
+atlas = None # packed sprite sheets, loaded on the first image request (needs the display to be set up)
+atlas_checked = False
+
+def get_atlas():
+    '''
+    -> (Atlas, or None when there isn't an up to date one and images load from their own files)
+    '''
+    global atlas, atlas_checked
+    if not atlas_checked:
+        atlas = Atlas.load(src=BASE_IMG_PATH)
+        atlas_checked = True
+    return atlas
+
+def load_image(path, colorkey=BLACK):
+    '''
+    (path under data/images, colour that's transparent on top of the png's alpha (None -> none)) -> (Surface in the cheapest format that draws it right)
+    '''
+    sheets = get_atlas()
+    if sheets and sheets.has(path):
+        return sheets.image(path, colorkey)
+    img = loader.take(BASE_IMG_PATH + path) or get_cache().load_image(BASE_IMG_PATH + path) # decoded ahead of time on the loader's threads
+    start = time.perf_counter()
+    img, kind = prepare(img, colorkey)
+    loader.converted(BASE_IMG_PATH + path, time.perf_counter() - start, kind)
     return img
 
-def load_images(path):
+def load_pixels(path):
+    '''
+    (path under data/images) -> (its decoded 32 bit RGBA Surface, not converted, from preload() or the asset cache)
+    '''
+    return loader.take(BASE_IMG_PATH + path) or get_cache().load_image(BASE_IMG_PATH + path)
+
+def load_sound(path):
+    '''
+    (path under data/sfx) -> (pygame.mixer.Sound, decoded once and cached after that)
+    '''
+    return loader.take(SFX_PATH + path) or get_cache().load_sound(SFX_PATH + path)
+
+def preload(entries, sounds=(), workers=None):
+    '''
+    decodes images and sounds on the loader's thread pool ahead of load_image / load_sound, atlas images come out of their sheets
+    (files / folders under data/images, sound files under data/sfx, worker threads (None -> one per core)) -> (seconds taken)
+    '''
+    paths = loader.image_files(BASE_IMG_PATH, entries)
+    sheets = get_atlas()
+    if sheets:
+        paths = [p for p in paths if not sheets.has(p[len(BASE_IMG_PATH):])] + [sheets.sheet_path(i) for i in range(len(sheets.manifest['sheets']))]
+    return loader.decode_all(paths, [SFX_PATH + name for name in sounds], workers)
+
+def load_images(path, colorkey=BLACK):
     images = []
-    for img_name in sorted(os.listdir(BASE_IMG_PATH + path)):
+    sheets = get_atlas()
+    listing = sheets.listing(path) if sheets else None
+    for img_name in listing or sorted(os.listdir(BASE_IMG_PATH + path)):
         if img_name == '.DS_Store':
             pass
         else:
-            images.append(load_image(path + '/' + img_name))
+            images.append(load_image(path + '/' + img_name, colorkey))
     return images
 
 class Animation:
-    def __init__(self, images, img_dur=5, loop=True):
+    def __init__(self, images, img_dur=5, loop=True, flipped=None):
         self.images = images
+        self.flipped = flipped if flipped is not None else [None] * len(images) # mirrored frames, made once and shared by every copy
         self.loop = loop
         self.img_duration = img_dur
         self.done = False
         self.frame = 0
     
     def copy(self):
-        return Animation(self.images, self.img_duration, self.loop)
+        return Animation(self.images, self.img_duration, self.loop, self.flipped)
     
     def update(self):
         if self.loop:
@@ -40,5 +94,10 @@ class Animation:
             if self.frame >= self.img_duration * len(self.images) - 1:
                 self.done = True
     
-    def img(self):
-        return self.images[int(self.frame / self.img_duration)]
\ No newline at end of file
+    def img(self, flip=False):
+        index = int(self.frame / self.img_duration)
+        if not flip:
+            return self.images[index]
+        if self.flipped[index] is None:
+            self.flipped[index] = pygame.transform.flip(self.images[index], True, False)
+        return self.flipped[index]
\ No newline at end of file